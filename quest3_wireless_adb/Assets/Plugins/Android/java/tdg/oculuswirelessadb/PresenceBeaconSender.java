@@ -0,0 +1,151 @@
+package tdg.oculuswirelessadb;
+
+import android.content.Context;
+import android.os.BatteryManager;
+import android.util.Log;
+
+import org.json.JSONObject;
+
+import java.net.DatagramPacket;
+import java.net.DatagramSocket;
+import java.net.InetAddress;
+
+/**
+ * 存在信标发送器
+ * 无线ADB启动后每秒向局域网广播一个 UDP JSON 包（IP、ADB 端口、序列号、应用版本、电量），
+ * 格式与 PC 端 script/presence_beacon.py 的 make_beacon 一致
+ */
+public class PresenceBeaconSender {
+
+    private static final String TAG = "PresenceBeacon";
+
+    private static final int BEACON_PORT = 45455;
+    private static final String BEACON_TYPE = "qwa-presence";
+    private static final long SEND_INTERVAL_MS = 1000;
+
+    private Context context;
+    private String serial;
+    private String appVersion;
+
+    private volatile String ip = "";
+    private volatile int port = 0;
+    private volatile boolean running = false;
+    private Thread thread;
+
+    public PresenceBeaconSender(Context context) {
+        this.context = context.getApplicationContext();
+        this.serial = readSerial();
+        this.appVersion = readAppVersion();
+    }
+
+    /**
+     * 开始（或更新地址后继续）广播
+     */
+    public synchronized void start(String ip, int port) {
+        this.ip = ip;
+        this.port = port;
+        if (running) {
+            return;
+        }
+        running = true;
+        thread = new Thread(new Runnable() {
+            @Override
+            public void run() {
+                sendLoop();
+            }
+        }, "PresenceBeacon");
+        thread.setDaemon(true);
+        thread.start();
+    }
+
+    /**
+     * 停止广播
+     */
+    public synchronized void stop() {
+        running = false;
+        if (thread != null) {
+            thread.interrupt();
+            thread = null;
+        }
+    }
+
+    private void sendLoop() {
+        DatagramSocket socket = null;
+        int seq = 0;
+        try {
+            socket = new DatagramSocket();
+            socket.setBroadcast(true);
+            InetAddress target = InetAddress.getByName("255.255.255.255");
+
+            while (running) {
+                if (!ip.isEmpty() && port > 0) {
+                    byte[] data = makeBeacon(seq++).getBytes("UTF-8");
+                    try {
+                        socket.send(new DatagramPacket(data, data.length, target, BEACON_PORT));
+                    } catch (Exception e) {
+                        // 网络暂时不可用（如刚唤醒），下一秒再试
+                        Log.w(TAG, "Failed to send beacon: " + e.getMessage());
+                    }
+                }
+                Thread.sleep(SEND_INTERVAL_MS);
+            }
+        } catch (InterruptedException e) {
+            // stop() 中断等待
+        } catch (Exception e) {
+            Log.e(TAG, "Beacon sender stopped", e);
+        } finally {
+            if (socket != null) {
+                socket.close();
+            }
+        }
+    }
+
+    private String makeBeacon(int seq) throws Exception {
+        JSONObject payload = new JSONObject();
+        payload.put("type", BEACON_TYPE);
+        payload.put("v", 1);
+        payload.put("ip", ip);
+        payload.put("port", port);
+        payload.put("serial", serial);
+        payload.put("app_version", appVersion);
+        payload.put("battery", readBattery());
+        payload.put("seq", seq);
+        return payload.toString();
+    }
+
+    private Object readBattery() {
+        try {
+            BatteryManager batteryManager = (BatteryManager) context.getSystemService(Context.BATTERY_SERVICE);
+            int level = batteryManager.getIntProperty(BatteryManager.BATTERY_PROPERTY_CAPACITY);
+            if (level >= 0 && level <= 100) {
+                return level;
+            }
+        } catch (Exception e) {
+            Log.w(TAG, "Failed to read battery level: " + e.getMessage());
+        }
+        return JSONObject.NULL;
+    }
+
+    /**
+     * 读取 ro.serialno，应用无权读取时返回空字符串（PC 端改按 IP 匹配）
+     */
+    private static String readSerial() {
+        try {
+            Class<?> systemProperties = Class.forName("android.os.SystemProperties");
+            Object value = systemProperties.getMethod("get", String.class, String.class)
+                .invoke(null, "ro.serialno", "");
+            return value != null ? value.toString() : "";
+        } catch (Exception e) {
+            return "";
+        }
+    }
+
+    private String readAppVersion() {
+        try {
+            String version = context.getPackageManager().getPackageInfo(context.getPackageName(), 0).versionName;
+            return version != null ? version : "";
+        } catch (Exception e) {
+            return "";
+        }
+    }
+}
@@ -18,6 +18,7 @@ public class UnityADBBridge {
 
     private Context context;
     private JmDNSAdbDiscoveryJava adbDiscovery;
+    private PresenceBeaconSender beaconSender;
 
     // 状态信息
     private String currentIP = "";
@@ -32,6 +33,7 @@ public class UnityADBBridge {
     public UnityADBBridge(Context context) {
         this.context = context;
         this.adbDiscovery = new JmDNSAdbDiscoveryJava(context);
+        this.beaconSender = new PresenceBeaconSender(context);
 
         Log.d(TAG, "UnityADBBridge initialized");
 
@@ -70,6 +72,7 @@ public class UnityADBBridge {
                             currentIP = result.first;
                             currentPort = result.second;
                             statusMessage = "ADB已启动: " + currentIP + ":" + currentPort;
+                            beaconSender.start(currentIP, currentPort);
 
                             Log.d(TAG, "ADB discovered at " + currentIP + ":" + currentPort);
                         } else {
@@ -111,6 +114,7 @@ public class UnityADBBridge {
             currentIP = "";
             currentPort = 0;
             statusMessage = "ADB已禁用";
+            beaconSender.stop();
 
             return true;
 
@@ -143,6 +147,7 @@ public class UnityADBBridge {
                             currentIP = result.first;
                             currentPort = result.second;
                             statusMessage = "ADB已启动: " + currentIP + ":" + currentPort;
+                            beaconSender.start(currentIP, currentPort);
                         }
                     }
                 }).start();
@@ -151,6 +156,7 @@ public class UnityADBBridge {
                 currentIP = "";
                 currentPort = 0;
                 statusMessage = "ADB已禁用";
+                beaconSender.stop();
             }
 
         } catch (Exception e) {
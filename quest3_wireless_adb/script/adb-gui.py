@@ -1,61 +1,100 @@
 #!/usr/bin/env python3
 
+import time
+
+# 启动计时起点
+STARTUP_BEGIN = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
+from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
-import time
 import json
-import shutil
+import base64
 import re
 import urllib.request
 import urllib.error
+import zipfile
 from pathlib import Path
 from subprocess import Popen, PIPE
-from zeroconf import ServiceBrowser, ServiceListener, Zeroconf
+
+import adb_errors
+from adb_server import AdbServerManager, find_adb
+from app_list import LIST_COMMAND, AppListError, list_apps
+from apk_delta import (PatchError, apply_patch, device_install_patch, find_patches,
+                       make_patch, patch_filename)
+from apk_mirror import CATALOG_FILENAME, CATALOG_PATH, ApkMirrorServer
+from apk_manifest import ManifestIndex
+from apk_store import ApkStore
+from deploy_journal import (STEP_DONE, STEP_FAILED, STEP_SKIPPED, STEP_STARTED, DeployJournal,
+                            verify_completed)
+from device_telemetry import TelemetryPoller, sparkline
+from fleet_signal import send_signal
+from install_preflight import STATUS_CLEANUP, STATUS_OK, preflight, run_cleanup
+from presence_beacon import DiscoveredDevices, PresenceListener, serial_from_service_name
+from profiling import Profiler, profiler_from_env
+from shell_pool import ShellError, ShellPool
+from transfer_scheduler import TransferScheduler
+from tree_model import TreeModel
 
 # 设备列表文件
 DEVICES_FILE = Path(__file__).parent / "devices.json"
 
+# logcat 日志目录
+LOGS_DIR = Path(__file__).parent / "logs"
+
+# 部署任务日志目录
+JOBS_DIR = Path(__file__).parent / "jobs"
+
+# 诊断包目录
+DIAGNOSTICS_DIR = Path(__file__).parent / "diagnostics"
+
+# 设备分组与发布通道配置
+GROUPS_FILE = Path(__file__).parent / "groups.json"
+
+# 上次会话的界面状态缓存（启动时先显示，后台刷新后替换）
+GUI_STATE_FILE = Path(__file__).parent / "gui_state.json"
+
+# 窗口首次显示的目标耗时（毫秒）
+STARTUP_TARGET_MS = 500
+
 # 远程APK列表API
 REMOTE_API_URL = "https://mrgun.chu-jiao.com/api/v1/admins/applications/versions/all"
 
 
-class DeviceListener(ServiceListener):
-    """设备发现监听器"""
+class DeviceListener:
+    """设备发现监听器（zeroconf 只要求实现 add/update/remove_service）"""
 
-    def __init__(self, callback=None):
-        self.discovered_devices = {}
+    def __init__(self, callback=None, devices=None):
+        # 与存在信标共用，按序列号/IP 去重
+        self.devices = devices or DiscoveredDevices()
         self.callback = callback
 
-    def do_stuff(self, zc: Zeroconf, type_: str, name: str) -> None:
+    @property
+    def discovered_devices(self):
+        return self.devices.snapshot()
+
+    def do_stuff(self, zc, type_: str, name: str) -> None:
         info = zc.get_service_info(type_, name)
         if not info or not info.addresses:
             return
 
         ip_bytes = info.addresses[0]
         ip_str = f"{ip_bytes[0]}.{ip_bytes[1]}.{ip_bytes[2]}.{ip_bytes[3]}"
-        device_addr = f"{ip_str}:{info.port}"
+        device_addr, previous = self.devices.add(ip_str, info.port, name, serial_from_service_name(name))
 
-        if device_addr in self.discovered_devices:
+        if previous == device_addr:
             return
 
-        self.discovered_devices[device_addr] = {
-            "ip": ip_str,
-            "port": info.port,
-            "name": name,
-            "address": device_addr
-        }
-
         if self.callback:
             self.callback(device_addr)
 
-    def add_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+    def add_service(self, zc, type_: str, name: str) -> None:
         self.do_stuff(zc, type_, name)
 
-    def update_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+    def update_service(self, zc, type_: str, name: str) -> None:
         self.do_stuff(zc, type_, name)
 
-    def remove_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+    def remove_service(self, zc, type_: str, name: str) -> None:
         pass
 
 
@@ -66,32 +105,143 @@ class ADBDeviceGUI:
     PRIORITY_PREFIXES = ('com.chujiao', 'com.ChuJiao', 'com.trev3d')
     # 排在后面的包名前缀
     LOW_PRIORITY_PREFIXES = ('com.meta', 'com.oculus', 'com.whatsapp', 'com.facebook')
+    # 配套应用信号
+    SIGNAL_LABELS = {'查找': 'find', '声音': 'sound', '振动': 'vibrate'}
 
     def __init__(self, root):
         self.root = root
         self.root.title("Quest 无线 ADB 管理器")
         self.root.geometry("1200x800")
 
+        # 性能分析（QWA_PROFILE=1 时从启动开始记录）
+        self.profiler = profiler_from_env(LOGS_DIR, log=self.log)
+        if self.profiler:
+            self.profiler.start(self.root)
+
         # APK 目录
         self.apks_dir = Path(__file__).parent / "apks"
+        # 增量补丁目录
+        self.patches_dir = self.apks_dir / "patches"
+        # 内容寻址的 APK 仓库（按文件名索引，保留历史版本用于回滚）
+        self.store = ApkStore(self.apks_dir / "store")
+        # APK 清单缓存（包名/versionCode）
+        self.manifest_index = ManifestIndex(self.apks_dir / "manifest_cache.json")
+        # 部署任务日志（用于崩溃后恢复）
+        self.journal = DeployJournal(JOBS_DIR)
 
         self.scanning = False
         self.zeroconf = None
+        # 扫描期间 mDNS 与存在信标共用的发现结果
+        self.scan_results = None
+        self.presence_listener = None
+        self.mirror_server = None
+        self.transfer_scheduler = None
+        self.shell_pool = None
+        # 已连接设备（供遥测轮询使用）与最新遥测数据
+        self.connected_devices = set()
+        self.telemetry = {}
+        self.telemetry_poller = None
+        self.logcat_collector = None
+        self.logcat_window = None
+        self.screen_wall = None
+        self.screen_wall_window = None
         self.adb_path = self.get_adb_path()
+        # 专属端口上的 adb 服务在后台提前启动，并定期健康检查
+        self.adb_server = AdbServerManager(
+            self.adb_path, log=lambda m: self.root.after(0, lambda: self.log(m)),
+            on_restart=lambda: self.root.after(0, self.on_adb_server_restart)).start()
+
+        self.refreshing_devices = False
+        self.refresh_pending = False
+        self.startup_reported = False
 
+        # 先用上次会话的缓存显示界面，耗时的初始化在窗口显示后于后台进行
         self.create_widgets()
+        self.show_cached_state()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after_idle(self.deferred_init)
+
+    def deferred_init(self):
+        """窗口显示后再执行的初始化"""
+        elapsed = (time.perf_counter() - STARTUP_BEGIN) * 1000
+        if elapsed > STARTUP_TARGET_MS:
+            self.log(f"窗口显示耗时 {elapsed:.0f} ms，超过目标 {STARTUP_TARGET_MS} ms")
+        else:
+            self.log(f"窗口显示耗时 {elapsed:.0f} ms")
+        if not self.adb_path:
+            self.log("未找到 ADB，请运行 python install_adb.py 安装 platform-tools（离线环境可用 --bundle）")
         self.load_and_display_devices()
-        self.load_apk_list()
+        self.start_presence_listener()
+        self.root.after_idle(self.load_apk_list)
+        self.start_telemetry()
+        self.root.after(500, self.check_unfinished_deployments)
+
+    def load_gui_state(self):
+        if GUI_STATE_FILE.exists():
+            try:
+                with open(GUI_STATE_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        return {}
+
+    def save_gui_state(self):
+        """保存连接状态和最新遥测，供下次启动时立即显示"""
+        state = {
+            "connected": sorted(self.connected_devices),
+            "telemetry": {device: sample for device, (sample, _) in self.telemetry.items()},
+        }
+        try:
+            tmp_file = GUI_STATE_FILE.with_suffix(".json.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            tmp_file.replace(GUI_STATE_FILE)
+        except OSError:
+            pass
+
+    def show_cached_state(self):
+        """显示上次会话的设备状态（标记为缓存，后台刷新后替换）"""
+        state = self.load_gui_state()
+        empty_history = {"battery": [], "temperature": [], "rssi": []}
+        for device, sample in state.get("telemetry", {}).items():
+            self.telemetry[device] = (sample, empty_history)
+        devices = self.load_devices()
+        self.render_devices(devices, set(state.get("connected", [])), cached=True)
+        self.set_status("正在刷新设备状态...")
+
+    def on_close(self):
+        self.save_gui_state()
+        if self.presence_listener:
+            self.presence_listener.stop()
+        if self.screen_wall:
+            self.screen_wall.stop()
+        self.store.close()
+        if self.profiler and self.profiler.running:
+            self.profiler.stop()
+        self.root.destroy()
+
+    def toggle_profiling(self):
+        """开始/停止性能分析，停止时保存 trace 文件"""
+        if self.profiler and self.profiler.running:
+            path = self.profiler.stop()
+            self.profile_btn.config(text="性能分析")
+            self.log(f"性能记录已保存: {path}（界面卡顿 {self.profiler.stalls} 次），"
+                     f"可在 chrome://tracing 或 https://ui.perfetto.dev 中打开")
+            return
+        self.profiler = Profiler(LOGS_DIR, log=self.log)
+        self.profiler.start(self.root)
+        self.profile_btn.config(text="停止分析")
+        self.log("性能分析已开启：采样调用栈、检测界面卡顿并记录 adb 进程和网络调用耗时")
 
     def get_adb_path(self):
         """获取ADB路径"""
-        adb_path = shutil.which('adb')
-        if not adb_path:
-            script_dir = Path(__file__).parent
-            local_adb = script_dir / "platform-tools" / "adb.exe"
-            if local_adb.exists():
-                adb_path = str(local_adb.absolute())
-        return adb_path
+        return find_adb()
+
+    def on_adb_server_restart(self):
+        """adb 服务意外重启后无线连接会全部断开，自动重连"""
+        self.log("adb 服务已重启，正在重新连接设备...")
+        if self.load_devices():
+            self.connect_all()
 
     def create_widgets(self):
         """创建界面组件"""
@@ -108,10 +258,24 @@ class ADBDeviceGUI:
         self.refresh_btn = ttk.Button(toolbar, text="刷新列表", command=self.load_and_display_devices)
         self.refresh_btn.pack(side=tk.LEFT, padx=5)
 
+        ttk.Button(toolbar, text="日志收集", command=self.open_logcat_window).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="屏幕墙", command=self.open_screen_wall).pack(side=tk.LEFT, padx=5)
+
+        self.profile_btn = ttk.Button(toolbar, text="停止分析" if self.profiler else "性能分析",
+                                      command=self.toggle_profiling)
+        self.profile_btn.pack(side=tk.LEFT, padx=5)
+
         # 扫描进度标签
         self.scan_label = ttk.Label(toolbar, text="")
         self.scan_label.pack(side=tk.LEFT, padx=10)
 
+        # 局域网 APK 镜像
+        self.mirror_label = ttk.Label(toolbar, text="")
+        self.mirror_label.pack(side=tk.RIGHT, padx=5)
+
+        self.mirror_btn = ttk.Button(toolbar, text="启动APK镜像", command=self.toggle_mirror)
+        self.mirror_btn.pack(side=tk.RIGHT, padx=5)
+
         # 中间区域：设备列表和操作按钮
         middle_frame = ttk.Frame(self.root)
         middle_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -120,26 +284,44 @@ class ADBDeviceGUI:
         list_frame = ttk.Frame(middle_frame)
         list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        ttk.Label(list_frame, text="设备列表:", font=('Microsoft YaHei UI', 10, 'bold')).pack(anchor=tk.W)
+        list_header = ttk.Frame(list_frame)
+        list_header.pack(fill=tk.X)
+        ttk.Label(list_header, text="设备列表:", font=('Microsoft YaHei UI', 10, 'bold')).pack(side=tk.LEFT)
+        self.device_filter_var = tk.StringVar()
+        ttk.Entry(list_header, textvariable=self.device_filter_var, width=24).pack(side=tk.RIGHT)
+        ttk.Label(list_header, text="筛选:").pack(side=tk.RIGHT, padx=(0, 2))
 
         # 创建树形视图
-        columns = ('Address', 'Status')
+        columns = ('Address', 'Status', 'Battery', 'Temp', 'Storage', 'WiFi', 'App')
         self.tree = ttk.Treeview(list_frame, columns=columns, show='tree headings', height=10)
         self.tree.heading('#0', text='序号')
         self.tree.heading('Address', text='设备地址')
         self.tree.heading('Status', text='状态')
+        self.tree.heading('Battery', text='电量')
+        self.tree.heading('Temp', text='温度')
+        self.tree.heading('Storage', text='可用存储')
+        self.tree.heading('WiFi', text='Wi-Fi')
+        self.tree.heading('App', text='前台应用')
 
         self.tree.column('#0', width=50, stretch=False)
-        self.tree.column('Address', width=250)
-        self.tree.column('Status', width=120)
+        self.tree.column('Address', width=170)
+        self.tree.column('Status', width=70)
+        self.tree.column('Battery', width=130)
+        self.tree.column('Temp', width=110)
+        self.tree.column('Storage', width=80)
+        self.tree.column('WiFi', width=120)
+        self.tree.column('App', width=180)
 
         # 滚动条
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscroll=scrollbar.set)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
 
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        # 按设备地址增量更新，只渲染可见行
+        self.device_view = TreeModel(self.tree, scrollbar, numbered=True)
+        self.device_filter_var.trace_add('write', lambda *_: self.device_view.set_filter(self.device_filter_var.get()))
+
         # 右侧：操作按钮
         button_frame = ttk.Frame(middle_frame, padding="10")
         button_frame.pack(side=tk.RIGHT, fill=tk.Y)
@@ -155,6 +337,18 @@ class ADBDeviceGUI:
 
         ttk.Button(button_frame, text="USB 授权", command=self.usb_grant_permission, width=15).pack(pady=5)
         ttk.Button(button_frame, text="查看应用", command=self.view_app_versions, width=15).pack(pady=5)
+        ttk.Button(button_frame, text="运行剧本", command=self.run_playbook, width=15).pack(pady=5)
+        ttk.Button(button_frame, text="收集诊断", command=self.collect_diagnostics, width=15).pack(pady=5)
+        ttk.Button(button_frame, text="按通道部署", command=self.release_deploy, width=15).pack(pady=5)
+
+        ttk.Separator(button_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
+
+        # 查找设备：向配套应用发送广播
+        self.signal_var = tk.StringVar(value='查找')
+        ttk.Combobox(button_frame, textvariable=self.signal_var, values=list(self.SIGNAL_LABELS),
+                     state='readonly', width=13).pack(pady=5)
+        ttk.Button(button_frame, text="发送到所选", command=lambda: self.send_fleet_signal(False), width=15).pack(pady=5)
+        ttk.Button(button_frame, text="发送到全部", command=lambda: self.send_fleet_signal(True), width=15).pack(pady=5)
 
         # 中间区域：应用列表和APK安装列表并排
         lists_frame = ttk.Frame(self.root)
@@ -164,44 +358,69 @@ class ADBDeviceGUI:
         app_frame = ttk.LabelFrame(lists_frame, text="已安装应用", padding="5")
         app_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 2))
 
+        app_filter_frame = ttk.Frame(app_frame)
+        app_filter_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 3))
+        ttk.Label(app_filter_frame, text="筛选:").pack(side=tk.LEFT, padx=(0, 2))
+        self.app_filter_var = tk.StringVar()
+        ttk.Entry(app_filter_frame, textvariable=self.app_filter_var).pack(side=tk.LEFT, fill=tk.X, expand=True)
+
         # 应用列表树形视图
-        app_columns = ('PackageName', 'AppName', 'Version')
+        app_columns = ('PackageName', 'AppName', 'Version', 'VersionCode', 'Local')
         self.app_tree = ttk.Treeview(app_frame, columns=app_columns, show='headings', height=8)
         self.app_tree.heading('PackageName', text='包名')
         self.app_tree.heading('AppName', text='应用名')
         self.app_tree.heading('Version', text='版本号')
+        self.app_tree.heading('VersionCode', text='版本代码')
+        self.app_tree.heading('Local', text='本地APK')
 
-        self.app_tree.column('PackageName', width=300)
-        self.app_tree.column('AppName', width=150)
-        self.app_tree.column('Version', width=100)
+        self.app_tree.column('PackageName', width=260)
+        self.app_tree.column('AppName', width=120)
+        self.app_tree.column('Version', width=80)
+        self.app_tree.column('VersionCode', width=70)
+        self.app_tree.column('Local', width=120)
 
         # 应用列表滚动条
-        app_scrollbar = ttk.Scrollbar(app_frame, orient=tk.VERTICAL, command=self.app_tree.yview)
-        self.app_tree.configure(yscroll=app_scrollbar.set)
+        app_scrollbar = ttk.Scrollbar(app_frame, orient=tk.VERTICAL)
 
         self.app_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         app_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        self.app_view = TreeModel(self.app_tree, app_scrollbar)
+        self.app_view_device = None
+        self.app_filter_var.trace_add('write', lambda *_: self.app_view.set_filter(self.app_filter_var.get()))
+
         # 右侧：APK安装列表区域
         apk_frame = ttk.LabelFrame(lists_frame, text="安装程序 (script/apks)", padding="5")
         apk_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(2, 0))
 
+        apk_filter_frame = ttk.Frame(apk_frame)
+        apk_filter_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 3))
+        ttk.Label(apk_filter_frame, text="筛选:").pack(side=tk.LEFT, padx=(0, 2))
+        self.apk_filter_var = tk.StringVar()
+        ttk.Entry(apk_filter_frame, textvariable=self.apk_filter_var).pack(side=tk.LEFT, fill=tk.X, expand=True)
+
         # APK列表树形视图
-        apk_columns = ('FileName', 'Size')
+        apk_columns = ('FileName', 'Package', 'VersionCode', 'Size')
         self.apk_tree = ttk.Treeview(apk_frame, columns=apk_columns, show='headings', height=8)
         self.apk_tree.heading('FileName', text='文件名')
+        self.apk_tree.heading('Package', text='包名')
+        self.apk_tree.heading('VersionCode', text='版本代码')
         self.apk_tree.heading('Size', text='大小')
 
-        self.apk_tree.column('FileName', width=300)
+        self.apk_tree.column('FileName', width=220)
+        self.apk_tree.column('Package', width=180)
+        self.apk_tree.column('VersionCode', width=70)
         self.apk_tree.column('Size', width=80)
 
         # APK列表滚动条
-        apk_scrollbar = ttk.Scrollbar(apk_frame, orient=tk.VERTICAL, command=self.apk_tree.yview)
-        self.apk_tree.configure(yscroll=apk_scrollbar.set)
+        apk_scrollbar = ttk.Scrollbar(apk_frame, orient=tk.VERTICAL)
 
         self.apk_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         apk_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        self.apk_view = TreeModel(self.apk_tree, apk_scrollbar)
+        self.apk_filter_var.trace_add('write', lambda *_: self.apk_view.set_filter(self.apk_filter_var.get()))
+
         # APK操作按钮
         apk_btn_frame = ttk.Frame(apk_frame)
         apk_btn_frame.pack(fill=tk.X, pady=(5, 0))
@@ -209,6 +428,19 @@ class ADBDeviceGUI:
         ttk.Button(apk_btn_frame, text="刷新APK列表", command=self.load_apk_list).pack(pady=2)
         ttk.Button(apk_btn_frame, text="安装", command=self.install_apk).pack(pady=2)
 
+        # 传输限速（MB/s，0 表示不限）
+        rate_frame = ttk.Frame(apk_btn_frame)
+        rate_frame.pack(pady=2)
+        ttk.Label(rate_frame, text="总限速").pack(side=tk.LEFT)
+        self.global_rate_var = tk.StringVar(value="0")
+        ttk.Spinbox(rate_frame, from_=0, to=1000, width=5, textvariable=self.global_rate_var,
+                    command=self.apply_transfer_rates).pack(side=tk.LEFT, padx=2)
+        ttk.Label(rate_frame, text="单机限速").pack(side=tk.LEFT, padx=(5, 0))
+        self.device_rate_var = tk.StringVar(value="0")
+        ttk.Spinbox(rate_frame, from_=0, to=1000, width=5, textvariable=self.device_rate_var,
+                    command=self.apply_transfer_rates).pack(side=tk.LEFT, padx=2)
+        ttk.Label(rate_frame, text="MB/s").pack(side=tk.LEFT)
+
         # 底部：日志区域
         log_frame = ttk.LabelFrame(self.root, text="日志", padding="5")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -255,49 +487,306 @@ class ADBDeviceGUI:
         """获取已连接的设备"""
         if not self.adb_path:
             return set()
-
+        self.log_cmd([self.adb_path, 'devices'])
         try:
-            cmd = [self.adb_path, 'devices']
-            self.log_cmd(cmd)
-            pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
-            output, _ = pipe.communicate()
-            output_str = output.decode("utf-8").strip()
-
-            connected = set()
-            for line in output_str.split('\n')[1:]:
-                if line.strip():
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        device_addr = parts[0]
-                        status = parts[1]
-                        if status == 'device':
-                            connected.add(device_addr)
-            return connected
+            return self.query_connected_devices()
         except Exception as e:
             self.log(f"获取已连接设备出错: {e}")
             return set()
 
+    def query_connected_devices(self):
+        """执行 adb devices（不写日志，可在后台线程调用）"""
+        cmd = [self.adb_path, 'devices']
+        pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
+        output, _ = pipe.communicate()
+        output_str = output.decode("utf-8").strip()
+
+        connected = set()
+        for line in output_str.split('\n')[1:]:
+            if line.strip():
+                parts = line.split()
+                if len(parts) >= 2:
+                    device_addr = parts[0]
+                    status = parts[1]
+                    if status == 'device':
+                        connected.add(device_addr)
+        return connected
+
     def load_and_display_devices(self):
-        """加载并显示设备列表"""
-        # 清空列表
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        """加载并显示设备列表（adb devices 在后台执行，不阻塞界面）"""
+        if self.refreshing_devices:
+            # 正在刷新时收到的请求合并为一次，结束后再刷新
+            self.refresh_pending = True
+            return
+        if not self.adb_path:
+            self.display_devices(set())
+            return
+        self.refreshing_devices = True
+        self.log_cmd([self.adb_path, 'devices'])
 
+        def fetch():
+            try:
+                connected = self.query_connected_devices()
+            except Exception as e:
+                self.root.after(0, lambda msg=str(e): self.log(f"获取已连接设备出错: {msg}"))
+                connected = set()
+            self.root.after(0, lambda: self.display_devices(connected))
+
+        threading.Thread(target=fetch, daemon=True).start()
+
+    def display_devices(self, connected):
+        """用最新的连接状态刷新设备列表"""
+        self.refreshing_devices = False
+        if self.refresh_pending:
+            self.refresh_pending = False
+            self.load_and_display_devices()
         devices = self.load_devices()
-        connected = self.get_connected_devices()
+        self.connected_devices = connected
+        if self.logcat_collector:
+            self.logcat_collector.sync(connected)
+        self.render_devices(devices, connected)
+        self.save_gui_state()
+
+        if not self.startup_reported:
+            self.startup_reported = True
+            self.log(f"初始化完成，耗时 {(time.perf_counter() - STARTUP_BEGIN) * 1000:.0f} ms")
 
         if not devices:
             self.log("设备列表为空，请先扫描设备")
             self.set_status("无设备")
             return
+        self.set_status(f"已加载 {len(devices)} 个设备")
+        self.log(f"从 devices.json 加载了 {len(devices)} 个设备")
 
-        # 添加设备到列表
-        for i, (addr, info) in enumerate(devices.items(), 1):
+    def render_devices(self, devices, connected, cached=False):
+        """刷新设备列表（只更新有变化的行，保留选中状态）"""
+        rows = []
+        for addr in devices:
             status = "已连接" if addr in connected else "未连接"
-            self.tree.insert('', tk.END, text=str(i), values=(addr, status))
+            if cached:
+                status += "（缓存）"
+            rows.append((addr, (addr, status) + self.telemetry_columns(addr if addr in connected else None)))
+        self.device_view.set_rows(rows)
+
+    def start_telemetry(self):
+        """启动设备遥测轮询"""
+        if not self.adb_path or self.telemetry_poller:
+            return
+        self.telemetry_poller = TelemetryPoller(
+            self.get_shell_pool(), lambda: set(self.connected_devices),
+            on_update=lambda d, sample, history: self.root.after(0, lambda: self.on_telemetry(d, sample, history)))
+        self.telemetry_poller.start()
+
+    def on_telemetry(self, device, sample, history):
+        """收到遥测后只更新对应行"""
+        self.telemetry[device] = (sample, history)
+        values = self.device_view.get(device)
+        if values:
+            self.device_view.update_row(device, values[:2] + self.telemetry_columns(device))
+
+    def telemetry_columns(self, device):
+        """生成遥测列的显示内容"""
+        if device not in self.telemetry:
+            return ("", "", "", "", "")
+        sample, history = self.telemetry[device]
+
+        battery = ""
+        if "battery" in sample:
+            battery = f"{sample['battery']}%{'⚡' if sample.get('charging') else ''} {sparkline(history['battery'])}"
+        temp = ""
+        if "temperature" in sample:
+            temp = f"{sample['temperature']:.1f}°C {sparkline(history['temperature'])}"
+            if sample.get("thermal_status"):
+                temp = f"[热{sample['thermal_status']}] {temp}"
+        storage = self.format_size(sample["storage_free"]) if "storage_free" in sample else ""
+        wifi = ""
+        if "rssi" in sample:
+            wifi = f"{sample['rssi']}dBm {sample.get('link_mbps', '?')}Mbps"
+        return (battery, temp, storage, wifi, sample.get("foreground", ""))
+
+    def open_logcat_window(self):
+        """打开日志收集窗口"""
+        if self.logcat_window and self.logcat_window.winfo_exists():
+            self.logcat_window.lift()
+            return
 
-        self.set_status(f"已加载 {len(devices)} 个设备")
-        self.log(f"从 devices.json 加载了 {len(devices)} 个设备")
+        from logcat_collector import LEVELS, LogcatCollector
+
+        win = tk.Toplevel(self.root)
+        win.title("日志收集 (logcat)")
+        win.geometry("1100x600")
+        self.logcat_window = win
+
+        bar = ttk.Frame(win, padding="5")
+        bar.pack(fill=tk.X)
+
+        ttk.Label(bar, text="级别").pack(side=tk.LEFT)
+        level_var = tk.StringVar(value="I")
+        ttk.Combobox(bar, textvariable=level_var, values=list(LEVELS), state='readonly', width=3).pack(side=tk.LEFT, padx=2)
+        ttk.Label(bar, text="标签(逗号分隔)").pack(side=tk.LEFT, padx=(10, 0))
+        tags_var = tk.StringVar(value="Unity,AndroidRuntime,DEBUG")
+        ttk.Entry(bar, textvariable=tags_var, width=30).pack(side=tk.LEFT, padx=2)
+
+        def current_filter():
+            tags = [t.strip() for t in tags_var.get().split(',') if t.strip()]
+            return level_var.get(), tags
+
+        def toggle():
+            if self.logcat_collector:
+                self.logcat_collector.stop()
+                self.logcat_collector = None
+                start_btn.config(text="开始收集")
+                self.log("日志收集已停止")
+                return
+            if not self.adb_path:
+                messagebox.showerror("错误", "未找到 ADB")
+                return
+            level, tags = current_filter()
+            self.logcat_collector = LogcatCollector(self.adb_path, LOGS_DIR, min_level=level, tags=tags)
+            self.logcat_collector.sync(self.connected_devices)
+            start_btn.config(text="停止收集")
+            self.log(f"开始收集 {len(self.connected_devices)} 个设备的日志，保存到 {LOGS_DIR}")
+
+        def apply_filter():
+            if self.logcat_collector:
+                self.logcat_collector.set_filter(*current_filter())
+
+        start_btn = ttk.Button(bar, text="停止收集" if self.logcat_collector else "开始收集", command=toggle)
+        start_btn.pack(side=tk.LEFT, padx=5)
+        ttk.Button(bar, text="应用过滤", command=apply_filter).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(bar, text="搜索").pack(side=tk.LEFT, padx=(10, 0))
+        search_var = tk.StringVar()
+        ttk.Entry(bar, textvariable=search_var, width=20).pack(side=tk.LEFT, padx=2)
+
+        stats_label = ttk.Label(bar, text="")
+        stats_label.pack(side=tk.RIGHT)
+
+        text = scrolledtext.ScrolledText(win, state=tk.DISABLED, wrap=tk.NONE, font=('Consolas', 9))
+        text.pack(fill=tk.BOTH, expand=True)
+
+        state = {'key': None, 'busy': False}
+
+        def render(rows, stats):
+            state['busy'] = False
+            if not win.winfo_exists():
+                return
+            lines = []
+            for ts, device, level, tag, message in rows:
+                stamp = time.strftime('%H:%M:%S', time.localtime(ts)) + f".{int(ts * 1000) % 1000:03d}"
+                lines.append(f"{stamp} {device:<21} {level} {tag}: {message}")
+            at_bottom = text.yview()[1] >= 0.999
+            text.config(state=tk.NORMAL)
+            text.delete('1.0', tk.END)
+            text.insert(tk.END, '\n'.join(lines))
+            text.config(state=tk.DISABLED)
+            if at_bottom:
+                text.see(tk.END)
+            stats_label.config(text=f"{len(stats)} 个设备，共 {sum(stats.values())} 行")
+
+        def refresh():
+            if not win.winfo_exists():
+                return
+            collector = self.logcat_collector
+            if collector and not state['busy']:
+                stats = collector.stats()
+                key = (tuple(sorted(stats.items())), search_var.get())
+                if key != state['key']:
+                    # 归并在后台线程进行，避免阻塞界面
+                    state['key'] = key
+                    state['busy'] = True
+                    search = search_var.get()
+
+                    def merge():
+                        rows = collector.merged(search=search)
+                        self.root.after(0, lambda: render(rows, stats))
+
+                    threading.Thread(target=merge, daemon=True).start()
+            win.after(1000, refresh)
+
+        refresh()
+
+    def open_screen_wall(self):
+        """打开屏幕缩略图墙"""
+        if self.screen_wall_window and self.screen_wall_window.winfo_exists():
+            self.screen_wall_window.lift()
+            return
+        if not self.adb_path:
+            messagebox.showerror("错误", "未找到 ADB")
+            return
+
+        from screen_wall import ScreenWall, THUMB_WIDTH
+
+        win = tk.Toplevel(self.root)
+        win.title("屏幕墙")
+        win.geometry("1100x700")
+        self.screen_wall_window = win
+
+        # 安装/推送进行中时暂停抓取
+        self.screen_wall = ScreenWall(
+            self.adb_path, lambda: sorted(self.connected_devices),
+            is_busy=lambda: bool(self.transfer_scheduler and self.transfer_scheduler.is_busy()))
+        self.screen_wall.start()
+
+        status_label = ttk.Label(win, text="", padding="5")
+        status_label.pack(fill=tk.X)
+        grid = ttk.Frame(win, padding="5")
+        grid.pack(fill=tk.BOTH, expand=True)
+
+        # 设备 -> (外框, 图片标签, 说明标签, 已显示版本, PhotoImage)
+        tiles = {}
+        columns = 4
+
+        def close():
+            if self.screen_wall:
+                self.screen_wall.stop()
+                self.screen_wall = None
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", close)
+
+        def refresh():
+            if not win.winfo_exists() or not self.screen_wall:
+                return
+            frames = self.screen_wall.frames()
+            devices = sorted(self.connected_devices)
+
+            for device in list(tiles):
+                if device not in devices:
+                    tiles.pop(device)[0].destroy()
+            for index, device in enumerate(devices):
+                if device not in tiles:
+                    box = ttk.LabelFrame(grid, text=device, padding="2")
+                    image_label = ttk.Label(box, text="等待画面...")
+                    image_label.pack()
+                    info_label = ttk.Label(box, text="")
+                    info_label.pack()
+                    tiles[device] = [box, image_label, info_label, -1, None]
+                tiles[device][0].grid(row=index // columns, column=index % columns, padx=4, pady=4, sticky=tk.N)
+
+                if device not in frames:
+                    continue
+                version, frame, interval = frames[device]
+                tile = tiles[device]
+                if version != tile[3]:
+                    try:
+                        image = tk.PhotoImage(data=base64.b64encode(frame.png))
+                    except tk.TclError:
+                        continue
+                    if not frame.thumbnail:
+                        # 没有 Pillow 时用整数倍缩小
+                        factor = max(1, -(-image.width() // THUMB_WIDTH))
+                        image = image.subsample(factor, factor)
+                    tile[1].config(image=image, text="")
+                    tile[3], tile[4] = version, image
+                age = int(time.time() - frame.captured)
+                tile[2].config(text=f"{age}s 前更新，间隔 {interval:.0f}s")
+
+            paused = self.transfer_scheduler and self.transfer_scheduler.is_busy()
+            status_label.config(text=f"{len(devices)} 个设备" + ("（传输进行中，已暂停抓取）" if paused else ""))
+            win.after(1000, refresh)
+
+        refresh()
 
     def start_scan(self):
         """开始扫描"""
@@ -330,11 +819,82 @@ class ADBDeviceGUI:
         """设备发现回调"""
         self.root.after(0, lambda: self.log(f"发现: {device_addr}"))
 
+    def start_presence_listener(self):
+        """监听配套应用的 UDP 存在信标（比 mDNS 更快得知新设备和端口变化）"""
+        listener = PresenceListener(callback=lambda info: self.root.after(0, lambda: self.on_presence(info)))
+        try:
+            self.presence_listener = listener.start()
+        except OSError as e:
+            self.log(f"无法监听存在信标端口 {listener.port}: {e}")
+
+    def on_presence(self, info):
+        """收到新设备或地址变化的信标（主线程）"""
+        extra = {"app_version": info["app_version"] or None, "battery": info["battery"]}
+        if self.scanning and self.scan_results is not None:
+            address, previous = self.scan_results.add(info["ip"], info["port"], serial=info["serial"],
+                                                      source="beacon", **extra)
+            if previous != address:
+                self.log(f"发现: {address}（信标）")
+            return
+
+        # 不在扫描时更新已保存的设备列表；信标未经认证，新设备和端口变化都要先连接确认后才保存
+        saved = DiscoveredDevices(self.load_devices())
+        address, previous = saved.add(info["ip"], info["port"], serial=info["serial"], source="beacon", **extra)
+        if previous == address or not self.adb_path:
+            return
+        serial = saved.snapshot()[address].get("serial")
+        threading.Thread(target=self.verify_beacon_device, args=(info, previous, address, serial),
+                         daemon=True).start()
+
+    def verify_beacon_device(self, info, previous, address, serial):
+        """连接信标给出的地址并读取序列号，确认后才写入设备列表（后台线程）。
+        新设备要求能连接并读到序列号，端口变化的设备还要求序列号与信标（或已保存记录）一致；
+        之前未连接的地址确认后断开"""
+        was_connected = previous is not None and previous in self.connected_devices
+        result = adb_errors.connect(self.adb_path, address, on_retry=self.log_retry(address))
+        if result.ok:
+            # 无线设备的 get-serialno 返回的是 ip:port，读取系统属性得到真实序列号
+            result = adb_errors.run_adb(self.adb_path, ['-s', address, 'shell', 'getprop', 'ro.serialno'], timeout=15)
+        # 信标和已保存记录都没有序列号时，只要求新地址确实是可连接的 ADB 设备
+        verified = result.ok and bool(result.message) and (serial is None or result.message == serial)
+        if not verified or not was_connected:
+            adb_errors.run_adb(self.adb_path, ['disconnect', address], timeout=10)
+        if not verified:
+            reason = f"序列号为 {result.message or '空'}" if result.ok else result.describe()
+            message = f"忽略信标: {address} 无法确认为设备 {serial or previous or address}（{reason}）"
+            self.root.after(0, lambda: self.log(message))
+            return
+        serial = result.message
+
+        def apply():
+            # 重新读取设备列表，避免覆盖确认期间的其他修改
+            saved = DiscoveredDevices(self.load_devices())
+            saved.add(info["ip"], info["port"], serial=serial, source="beacon",
+                      app_version=info["app_version"] or None, battery=info["battery"])
+            self.save_devices(saved.snapshot())
+            if previous is None:
+                self.log(f"信标发现新设备: {address}（序列号 {serial}）")
+            else:
+                self.log(f"设备端口变化: {previous} -> {address}")
+            if was_connected:
+                self.log(f"已重新连接 {address}")
+            self.load_and_display_devices()
+
+        self.root.after(0, apply)
+
     def scan_devices(self, duration=10):
         """扫描设备"""
         try:
+            # zeroconf 加载较慢，只在扫描时导入
+            from zeroconf import ServiceBrowser, Zeroconf
             self.zeroconf = Zeroconf()
-            listener = DeviceListener(callback=self.on_device_found)
+            # 最近仍在广播信标的设备直接计入本次扫描结果
+            results = DiscoveredDevices()
+            for info in (self.presence_listener.recent() if self.presence_listener else []):
+                results.add(info["ip"], info["port"], serial=info["serial"], source="beacon")
+                self.on_device_found(info["address"])
+            self.scan_results = results
+            listener = DeviceListener(callback=self.on_device_found, devices=results)
             ServiceBrowser(self.zeroconf, "_adb-tls-connect._tcp.local.", listener)
             ServiceBrowser(self.zeroconf, "_adb_secure_connect._tcp.local.", listener)
 
@@ -352,6 +912,7 @@ class ADBDeviceGUI:
                     break
 
             self.zeroconf.close()
+            self.scan_results = None
 
             # 保存设备（无论是否发现设备都要保存，未发现时保存空列表）
             self.save_devices(listener.discovered_devices)
@@ -377,13 +938,27 @@ class ADBDeviceGUI:
 
     def get_selected_device(self):
         """获取选中的设备"""
-        selection = self.tree.selection()
+        selection = self.device_view.selection()
         if not selection:
             messagebox.showwarning("未选择设备", "请先选择一个设备")
             return None
 
-        item = self.tree.item(selection[0])
-        return item['values'][0]  # 返回设备地址
+        return selection[0]  # 返回设备地址
+
+    def get_shell_pool(self):
+        """获取常驻 shell 会话池（首次使用时创建）"""
+        if not self.shell_pool:
+            self.shell_pool = ShellPool(self.adb_path)
+        return self.shell_pool
+
+    def get_selected_devices(self):
+        """获取所有选中的设备"""
+        selection = self.device_view.selection()
+        if not selection:
+            messagebox.showwarning("未选择设备", "请先选择一个设备")
+            return []
+
+        return selection
 
     def connect_device(self):
         """连接设备"""
@@ -399,29 +974,27 @@ class ADBDeviceGUI:
         self.set_status(f"正在连接 {device}...")
 
         def connect():
-            try:
-                cmd = [self.adb_path, 'connect', device]
-                self.root.after(0, lambda: self.log_cmd(cmd))
-                pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
-                output, error = pipe.communicate()
-                output_str = output.decode("utf-8").strip()
-                error_str = error.decode("utf-8").strip()
+            cmd = [self.adb_path, 'connect', device]
+            self.root.after(0, lambda: self.log_cmd(cmd))
+            result = adb_errors.connect(self.adb_path, device, on_retry=self.log_retry(device))
 
-                if pipe.returncode == 0 and ("connected" in output_str or "already connected" in output_str):
-                    self.root.after(0, lambda: self.log(f"成功: {device}"))
-                    self.root.after(0, lambda: self.set_status(f"已连接 {device}"))
-                    self.root.after(0, self.load_and_display_devices)
-                else:
-                    error_msg = error_str if error_str else output_str
-                    self.root.after(0, lambda: self.log(f"失败: {device} - {error_msg}"))
-                    self.root.after(0, lambda: self.set_status("连接失败"))
-            except Exception as e:
-                self.root.after(0, lambda: self.log(f"错误: {e}"))
-                self.root.after(0, lambda: self.set_status("连接出错"))
+            if result.ok:
+                self.root.after(0, lambda: self.log(f"成功: {device}"))
+                self.root.after(0, lambda: self.set_status(f"已连接 {device}"))
+                self.root.after(0, self.load_and_display_devices)
+            else:
+                self.root.after(0, lambda: self.log(f"失败: {device} - {result.describe()}"))
+                self.root.after(0, lambda: self.set_status(f"连接失败: {result.label}"))
 
         thread = threading.Thread(target=connect, daemon=True)
         thread.start()
 
+    def log_retry(self, device):
+        """暂时性错误重试时写日志的回调"""
+        def on_retry(result, attempt, delay):
+            self.root.after(0, lambda: self.log(f"{device}: {result.label}，{delay:.1f}s 后第 {attempt} 次重试"))
+        return on_retry
+
     def disconnect_device(self):
         """断开设备"""
         device = self.get_selected_device()
@@ -443,6 +1016,8 @@ class ADBDeviceGUI:
                 output, _ = pipe.communicate()
                 output_str = output.decode("utf-8").strip()
 
+                if self.shell_pool:
+                    self.shell_pool.discard(device)
                 self.root.after(0, lambda: self.log(f"已断开: {device}"))
                 self.root.after(0, lambda: self.set_status(f"已断开 {device}"))
                 self.root.after(0, self.load_and_display_devices)
@@ -468,24 +1043,20 @@ class ADBDeviceGUI:
         self.set_status("正在连接所有设备...")
 
         def connect_all():
-            success = 0
+            results = {}
             for addr in devices:
-                try:
-                    cmd = [self.adb_path, 'connect', addr]
-                    self.root.after(0, lambda c=cmd: self.log_cmd(c))
-                    pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
-                    output, _ = pipe.communicate()
-                    output_str = output.decode("utf-8").strip()
-
-                    if pipe.returncode == 0 and ("connected" in output_str or "already connected" in output_str):
-                        success += 1
-                        self.root.after(0, lambda a=addr: self.log(f"成功: {a}"))
-                    else:
-                        self.root.after(0, lambda a=addr: self.log(f"失败: {a}"))
-                except Exception as e:
-                    self.root.after(0, lambda a=addr, err=e: self.log(f"错误 {a}: {err}"))
+                cmd = [self.adb_path, 'connect', addr]
+                self.root.after(0, lambda c=cmd: self.log_cmd(c))
+                result = results[addr] = adb_errors.connect(self.adb_path, addr, on_retry=self.log_retry(addr))
+                if result.ok:
+                    self.root.after(0, lambda a=addr: self.log(f"成功: {a}"))
+                else:
+                    self.root.after(0, lambda a=addr, r=result: self.log(f"失败: {a} - {r.describe()}"))
 
+            success = sum(1 for result in results.values() if result.ok)
             self.root.after(0, lambda: self.log(f"已连接 {success}/{len(devices)} 个设备"))
+            for line in adb_errors.format_summary(results):
+                self.root.after(0, lambda line=line: self.log(f"  {line}"))
             self.root.after(0, lambda: self.set_status(f"已连接 {success}/{len(devices)} 个设备"))
             self.root.after(0, self.load_and_display_devices)
 
@@ -508,6 +1079,8 @@ class ADBDeviceGUI:
                 pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
                 output, _ = pipe.communicate()
 
+                if self.shell_pool:
+                    self.shell_pool.close_all()
                 self.root.after(0, lambda: self.log("所有设备已断开"))
                 self.root.after(0, lambda: self.set_status("所有设备已断开"))
                 self.root.after(0, self.load_and_display_devices)
@@ -554,18 +1127,19 @@ class ADBDeviceGUI:
                     return
 
                 # 对每个 USB 设备授予权限
+                pool = self.get_shell_pool()
                 for device in usb_devices:
-                    cmd = [self.adb_path, '-s', device, 'shell', 'pm', 'grant',
-                           'com.ChuJiao.quest3_wireless_adb', 'android.permission.WRITE_SECURE_SETTINGS']
-                    self.root.after(0, lambda c=cmd: self.log_cmd(c))
-                    pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
-                    output, error = pipe.communicate()
+                    command = 'pm grant com.ChuJiao.quest3_wireless_adb android.permission.WRITE_SECURE_SETTINGS'
+                    self.root.after(0, lambda d=device: self.log(f"$ adb -s {d} shell {command}"))
+                    try:
+                        code, output_str = pool.run(device, command)
+                    except ShellError as e:
+                        code, output_str = -1, str(e)
 
-                    if pipe.returncode == 0:
+                    if code == 0:
                         self.root.after(0, lambda d=device: self.log(f"权限已授予 {d}"))
                     else:
-                        error_str = error.decode("utf-8").strip()
-                        self.root.after(0, lambda d=device, e=error_str: self.log(f"授予权限失败 {d}: {e}"))
+                        self.root.after(0, lambda d=device, e=output_str: self.log(f"授予权限失败 {d}: {e}"))
 
                 self.root.after(0, lambda: self.set_status("权限授予完成"))
 
@@ -576,6 +1150,149 @@ class ADBDeviceGUI:
         thread = threading.Thread(target=grant, daemon=True)
         thread.start()
 
+    def run_playbook(self):
+        """在选中的设备上执行部署剧本"""
+        devices = self.get_selected_devices()
+        if not devices:
+            return
+        if not self.adb_path:
+            messagebox.showerror("错误", "未找到 ADB")
+            return
+
+        from playbook import Playbook, PlaybookError, PlaybookRunner, summarize
+
+        path = filedialog.askopenfilename(
+            title="选择部署剧本", initialdir=Path(__file__).parent / "playbooks",
+            filetypes=[("剧本", "*.json *.yml *.yaml"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            playbook = Playbook.load(path)
+        except (OSError, PlaybookError) as e:
+            messagebox.showerror("剧本错误", str(e))
+            return
+
+        self.log(f"正在执行剧本 {playbook.name}（{len(playbook.steps)} 步）到 {len(devices)} 个设备...")
+        self.set_status(f"正在执行剧本 {playbook.name}...")
+
+        def run():
+            runner = PlaybookRunner(self.adb_path, playbook, pool=self.get_shell_pool(), store=self.store,
+                                    log=lambda m: self.root.after(0, lambda m=m: self.log(m)))
+            results = runner.run(devices)
+            ok, failed = summarize(results)
+            self.root.after(0, lambda: self.set_status(f"剧本完成: 成功 {ok}/{len(results)}"))
+            self.root.after(0, lambda: self.log(f"剧本 {playbook.name} 完成: 成功 {ok}/{len(results)}"))
+            if failed:
+                detail = "\n".join(f"{device}: " + "; ".join(f"{step} {msg}" for step, msg in problems)
+                                   for device, problems in failed.items())
+                self.root.after(0, lambda: messagebox.showerror("剧本部分失败", detail))
+            self.root.after(0, self.load_and_display_devices)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def collect_diagnostics(self):
+        """并发收集选中设备（未选择时为全部已连接设备）的 bugreport、tombstone 和 ANR"""
+        if not self.adb_path:
+            messagebox.showerror("错误", "未找到 ADB")
+            return
+        selected = self.device_view.selection()
+        include_bugreport = messagebox.askyesnocancel(
+            "收集诊断", f"收集{'所选' if selected else '全部已连接'}设备的 tombstone 和 ANR。\n"
+                       "是否同时生成 bugreport？（每台约需 1-3 分钟）")
+        if include_bugreport is None:
+            return
+
+        from diagnostics import DEFAULT_RATE, DiagnosticsCollector, summarize
+
+        def run():
+            connected = self.get_connected_devices()
+            devices = [d for d in selected if d in connected] if selected else sorted(connected)
+            if not devices:
+                self.root.after(0, lambda: self.log("没有已连接的设备"))
+                return
+
+            # 与安装共用总限速设置，未限速时使用诊断的默认上限
+            collector = DiagnosticsCollector(
+                self.adb_path, DIAGNOSTICS_DIR, rate=self.read_rate(self.global_rate_var) or DEFAULT_RATE,
+                bugreport=include_bugreport, log=lambda m: self.root.after(0, lambda m=m: self.log(m)))
+            self.root.after(0, lambda: self.log(f"开始收集 {len(devices)} 个设备的诊断包..."))
+            self.root.after(0, lambda: self.set_status("正在收集诊断..."))
+            results = collector.collect(devices, on_done=lambda r: self.root.after(0, lambda: self.log(
+                f"{'完成' if r.ok else '失败'}: {r.device} {r.message} ({self.format_size(r.bytes)})")))
+            for line in summarize(results):
+                self.root.after(0, lambda line=line: self.log(f"  {line}"))
+            ok = sum(1 for r in results.values() if r.ok)
+            self.root.after(0, lambda: self.log(f"诊断包已保存到 {DIAGNOSTICS_DIR}（成功 {ok}/{len(results)}）"))
+            self.root.after(0, lambda: self.set_status(f"诊断收集完成: {ok}/{len(results)}"))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def release_deploy(self):
+        """按 groups.json 的分组和发布通道，为选中设备（未选择时为全部已连接设备）计算并执行安装计划"""
+        if not self.adb_path:
+            messagebox.showerror("错误", "未找到 ADB")
+            return
+        catalog_file = self.apks_dir / CATALOG_FILENAME
+        if not catalog_file.exists():
+            messagebox.showwarning("没有目录", "请先同步云端 APK 列表")
+            return
+        selected = self.device_view.selection()
+
+        from release_channels import (ReleaseConfig, ReleaseConfigError, execute_plan, plan_release,
+                                      plan_totals, query_inventory)
+
+        def run():
+            try:
+                config = ReleaseConfig.load(GROUPS_FILE)
+                with open(catalog_file, 'r', encoding='utf-8') as f:
+                    catalog = json.load(f)
+            except (ReleaseConfigError, OSError, json.JSONDecodeError) as e:
+                self.root.after(0, lambda msg=str(e): messagebox.showerror("分组配置错误", msg))
+                return
+            connected = self.get_connected_devices()
+            devices = [d for d in selected if d in connected] if selected else sorted(connected)
+            if not devices:
+                self.root.after(0, lambda: self.log("没有已连接的设备"))
+                return
+
+            self.root.after(0, lambda: self.set_status(f"正在读取 {len(devices)} 个设备的已安装应用..."))
+            inventory = query_inventory(self.get_shell_pool(), devices)
+            plans = plan_release(config, catalog, self.store, self.manifest_index, inventory)
+            for plan in plans:
+                self.root.after(0, lambda line=plan.summary(): self.log(f"  {line}"))
+            changed, installs, uninstalls, unchanged = plan_totals(plans)
+            self.root.after(0, lambda: self.log(
+                f"部署计划: {changed} 个设备需要变更（安装 {installs}，卸载 {uninstalls}），{unchanged} 个无需变更"))
+            self.root.after(0, lambda: self.set_status("部署计划已生成"))
+            if not changed:
+                return
+            self.root.after(0, lambda: confirm(plans, installs, uninstalls))
+
+        def confirm(plans, installs, uninstalls):
+            detail = "\n".join(plan.summary() for plan in plans if plan.actions)
+            if len(detail) > 1500:
+                detail = detail[:1500] + "\n……（完整计划见日志）"
+            if not messagebox.askyesno("按通道部署", f"{detail}\n\n执行安装 {installs}、卸载 {uninstalls}？"):
+                self.set_status("已取消部署")
+                return
+            allow_downgrade = False
+            if any(a.kind == "downgrade" for plan in plans for a in plan.actions):
+                allow_downgrade = messagebox.askyesno(
+                    "需要降级", "部分设备上的版本比通道版本新，降级需要先卸载（会清除应用数据）。\n是否执行降级？")
+            threading.Thread(target=execute, args=(plans, allow_downgrade), daemon=True).start()
+
+        def execute(plans, allow_downgrade):
+            self.root.after(0, lambda: self.set_status("正在按通道部署..."))
+            results = execute_plan(plans, self.store, self.get_transfer_scheduler(), self.get_shell_pool(),
+                                   self.journal, allow_downgrade=allow_downgrade,
+                                   log=lambda m: self.root.after(0, lambda m=m: self.log(m)))
+            steps = [step for items in results.values() for step in items]
+            ok = sum(1 for _, success, _ in steps if success)
+            self.root.after(0, lambda: self.set_status(f"按通道部署完成: {ok}/{len(steps)}"))
+            self.root.after(0, self.load_and_display_devices)
+
+        threading.Thread(target=run, daemon=True).start()
+
     def view_app_versions(self):
         """查看选中设备上的应用版本"""
         device = self.get_selected_device()
@@ -595,58 +1312,24 @@ class ADBDeviceGUI:
         self.log(f"正在获取 {device} 上的应用列表...")
         self.set_status(f"正在获取应用列表...")
 
-        # 清空应用列表
-        for item in self.app_tree.get_children():
-            self.app_tree.delete(item)
+        # 换了设备时清空应用列表，同一设备刷新时保留并增量更新
+        if device != self.app_view_device:
+            self.app_view.clear()
+            self.app_view_device = device
 
         def get_apps():
             try:
-                # 获取第三方应用列表
-                cmd = [self.adb_path, '-s', device, 'shell', 'pm', 'list', 'packages', '-3']
-                self.root.after(0, lambda: self.log_cmd(cmd))
-                pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
-                output, error = pipe.communicate()
-
-                if pipe.returncode != 0:
-                    error_str = error.decode("utf-8").strip()
-                    self.root.after(0, lambda: self.log(f"获取应用列表失败: {error_str}"))
+                # 获取第三方应用列表及版本（复用设备的常驻 shell）
+                self.root.after(0, lambda: self.log(f"$ adb -s {device} shell {LIST_COMMAND}"))
+                try:
+                    apps_info = list_apps(
+                        self.get_shell_pool(), device,
+                        on_packages=lambda p: self.root.after(0, lambda: self.log(f"找到 {len(p)} 个第三方应用")))
+                except AppListError as e:
+                    self.root.after(0, lambda msg=str(e): self.log(f"获取应用列表失败: {msg}"))
                     self.root.after(0, lambda: self.set_status("获取应用列表失败"))
                     return
 
-                output_str = output.decode("utf-8").strip()
-                packages = []
-                for line in output_str.split('\n'):
-                    if line.startswith('package:'):
-                        package_name = line[8:].strip()
-                        packages.append(package_name)
-
-                self.root.after(0, lambda: self.log(f"找到 {len(packages)} 个第三方应用"))
-
-                # 获取每个应用的版本信息
-                apps_info = []
-                for package in packages:
-                    try:
-                        # 获取版本号
-                        cmd = [self.adb_path, '-s', device, 'shell', 'dumpsys', 'package', package]
-                        pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
-                        output, _ = pipe.communicate(timeout=5)
-                        output_str = output.decode("utf-8", errors='ignore')
-
-                        version = "N/A"
-                        app_name = package
-
-                        # 解析版本号
-                        for line in output_str.split('\n'):
-                            line = line.strip()
-                            if line.startswith('versionName='):
-                                version = line.split('=')[1].strip()
-                                break
-
-                        apps_info.append((package, app_name, version))
-
-                    except Exception as e:
-                        apps_info.append((package, package, "获取失败"))
-
                 # 排序应用列表
                 def get_sort_key(item):
                     package = item[0].lower()
@@ -663,10 +1346,19 @@ class ADBDeviceGUI:
 
                 apps_info.sort(key=get_sort_key)
 
+                # 与本地 APK 按包名对照
+                local_packages = self.local_apk_packages()
+
                 # 更新 UI
                 def update_ui():
-                    for package, app_name, version in apps_info:
-                        self.app_tree.insert('', tk.END, values=(package, app_name, version))
+                    if device != self.app_view_device:
+                        return
+                    rows = []
+                    for package, app_name, version, version_code in apps_info:
+                        local = self.describe_local_apk(local_packages.get(package), version_code)
+                        rows.append((package, (package, app_name, version,
+                                               version_code if version_code is not None else "", local)))
+                    self.app_view.set_rows(rows)
                     self.set_status(f"已加载 {len(apps_info)} 个应用")
 
                 self.root.after(0, update_ui)
@@ -678,12 +1370,40 @@ class ADBDeviceGUI:
         thread = threading.Thread(target=get_apps, daemon=True)
         thread.start()
 
+    def send_fleet_signal(self, all_devices):
+        """向所选或全部已连接设备并发发送信号，并记录每台设备的耗时"""
+        if not self.adb_path:
+            messagebox.showerror("错误", "未找到 ADB")
+            return
+
+        signal = self.SIGNAL_LABELS[self.signal_var.get()]
+        selected = [] if all_devices else self.get_selected_devices()
+        if not all_devices and not selected:
+            return
+
+        def send():
+            connected = self.get_connected_devices()
+            devices = sorted(connected) if all_devices else [d for d in selected if d in connected]
+            if not devices:
+                self.root.after(0, lambda: self.log("没有已连接的设备"))
+                return
+
+            self.root.after(0, lambda: self.log(f"发送信号 {signal} 到 {len(devices)} 个设备..."))
+            start = time.perf_counter()
+            results = send_signal(
+                self.get_shell_pool(), devices, signal,
+                on_result=lambda r: self.root.after(0, lambda: self.log(
+                    f"{'送达' if r[1] else '失败'}: {r[0]} {r[2]:.0f}ms" + ("" if r[1] else f" - {r[3]}"))))
+            total = (time.perf_counter() - start) * 1000
+            ok = sum(1 for r in results if r[1])
+            self.root.after(0, lambda: self.log(f"信号已送达 {ok}/{len(results)}，总耗时 {total:.0f}ms"))
+            self.root.after(0, lambda: self.set_status(f"信号已送达 {ok}/{len(results)}"))
+
+        thread = threading.Thread(target=send, daemon=True)
+        thread.start()
+
     def load_apk_list(self):
         """加载 APK 列表（先显示本地，再从云端同步）"""
-        # 清空列表
-        for item in self.apk_tree.get_children():
-            self.apk_tree.delete(item)
-
         # 确保目录存在
         if not self.apks_dir.exists():
             self.apks_dir.mkdir(parents=True)
@@ -692,28 +1412,91 @@ class ADBDeviceGUI:
         # 先显示本地 APK
         self.display_local_apks()
 
-        # 在后台从云端同步
+        # 在后台导入散放的 APK 并从云端同步
         self.log("正在从云端检查更新...")
         thread = threading.Thread(target=self.sync_remote_apks, daemon=True)
         thread.start()
 
     def display_local_apks(self):
-        """显示本地 APK 文件"""
-        for item in self.apk_tree.get_children():
-            self.apk_tree.delete(item)
-
-        apk_files = list(self.apks_dir.glob("*.apk"))
-        for apk_file in sorted(apk_files, key=lambda x: x.name.lower()):
-            size = apk_file.stat().st_size
-            size_str = self.format_size(size)
-            self.apk_tree.insert('', tk.END, values=(apk_file.name, size_str))
-
-        if apk_files:
-            self.log(f"本地有 {len(apk_files)} 个 APK 文件")
+        """显示本地 APK 文件（读取仓库索引）"""
+        entries = self.store.entries()
+        missing = False
+        rows = []
+        for filename, entry in entries:
+            size_str = self.format_size(entry["size"])
+            blob_path = self.store.blob_path(entry["blob"])
+            info = self.manifest_index.cached(blob_path)
+            if info is None:
+                missing = missing or blob_path.exists()
+                info = {}
+            rows.append((filename, (filename, info.get("package") or "", info.get("versionCode") or "", size_str)))
+        self.apk_view.set_rows(rows)
+
+        if entries:
+            self.log(f"本地有 {len(entries)} 个 APK 版本，占用 {self.format_size(self.store.total_size())}")
+
+        # 清单未缓存的 APK 在后台解析后刷新
+        if missing:
+            threading.Thread(target=self.index_local_apks, daemon=True).start()
+
+    def index_local_apks(self):
+        """解析本地 APK 清单并写入缓存"""
+        paths = [self.store.blob_path(entry["blob"]) for _, entry in self.store.entries()]
+        for path in paths:
+            self.manifest_index.get(path)
+        self.manifest_index.save(live_paths=paths)
+        self.root.after(0, self.display_local_apks)
+
+    def local_apk_packages(self):
+        """返回 {包名: (versionCode, versionName, 文件名)}，同一包名取最高 versionCode"""
+        packages = {}
+        for filename, entry in self.store.entries():
+            info = self.manifest_index.get(self.store.blob_path(entry["blob"]))
+            if not info or not info.get("package") or info.get("split"):
+                continue
+            current = packages.get(info["package"])
+            if current is None or (info["versionCode"] or 0) > (current[0] or 0):
+                packages[info["package"]] = (info["versionCode"], info["versionName"], filename)
+        return packages
+
+    def describe_local_apk(self, local, installed_code):
+        """描述本地 APK 与已安装版本的关系"""
+        if not local:
+            return ""
+        local_code, local_name, _ = local
+        if installed_code is None or local_code is None:
+            return f"v{local_name}"
+        if local_code > installed_code:
+            return f"可更新 v{local_name}"
+        if local_code == installed_code:
+            return "已是最新"
+        return f"本地较旧 v{local_name}"
+
+    def ingest_loose_apks(self):
+        """把手动放入 apks 目录的 APK 导入仓库"""
+        loose = list(self.apks_dir.glob("*.apk"))
+        if not loose:
+            return
+        self.root.after(0, lambda: self.log(f"正在导入 {len(loose)} 个本地 APK..."))
+        self.store.ingest_dir(self.apks_dir)
+        self.evict_store()
+        self.root.after(0, self.display_local_apks)
+
+    def evict_store(self):
+        """按容量预算淘汰旧版本（发布通道固定的版本保留）"""
+        from release_channels import ReleaseConfig, ReleaseConfigError
+        try:
+            keep = ReleaseConfig.load(GROUPS_FILE).pinned_filenames()
+        except ReleaseConfigError:
+            keep = set()
+        for filename in self.store.evict(keep):
+            self.root.after(0, lambda f=filename: self.log(f"超出容量预算，已淘汰: {f}"))
 
     def sync_remote_apks(self):
         """从远程API同步APK列表，下载本地没有的版本"""
         try:
+            self.ingest_loose_apks()
+
             # 获取远程APK列表
             self.root.after(0, lambda: self.log(f"$ GET {REMOTE_API_URL}"))
             req = urllib.request.Request(REMOTE_API_URL, headers={'User-Agent': 'Mozilla/5.0'})
@@ -722,8 +1505,12 @@ class ADBDeviceGUI:
 
             self.root.after(0, lambda: self.log(f"云端有 {len(data)} 个应用"))
 
+            # 缓存目录，供局域网镜像提供给头显
+            with open(self.apks_dir / CATALOG_FILENAME, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
             # 获取本地已有的APK文件名
-            local_apks = {f.name.lower() for f in self.apks_dir.glob("*.apk")}
+            local_apks = {name.lower() for name, _ in self.store.entries()}
 
             # 检查每个远程应用
             downloads_needed = []
@@ -744,10 +1531,13 @@ class ADBDeviceGUI:
                         'app_name': app_name,
                         'version': version,
                         'url': apk_url,
-                        'filename': expected_filename
+                        'filename': expected_filename,
+                        'patches': app.get('patches') or []
                     })
                     self.root.after(0, lambda n=app_name, v=version: self.log(f"需要下载: {n} v{v}"))
 
+            self.check_pinned_versions(data, local_apks)
+
             if not downloads_needed:
                 self.root.after(0, lambda: self.log("所有APK已是最新"))
                 return
@@ -763,49 +1553,49 @@ class ADBDeviceGUI:
         except Exception as e:
             self.root.after(0, lambda: self.log(f"同步错误: {e}"))
 
+    def check_pinned_versions(self, catalog, local_apks):
+        """发布通道固定的旧版本云端只提供最新版，本地缺失时提示手动放入 apks 目录"""
+        from release_channels import ReleaseConfig, ReleaseConfigError, apk_filename
+        try:
+            pinned = ReleaseConfig.load(GROUPS_FILE).pinned_filenames()
+        except ReleaseConfigError as e:
+            self.root.after(0, lambda msg=str(e): self.log(f"分组配置错误: {msg}"))
+            return
+        latest = {apk_filename(app.get('app_name', ''), app.get('latest_version', '')).lower() for app in catalog}
+        for filename in sorted(pinned):
+            if filename.lower() not in local_apks and filename.lower() not in latest:
+                self.root.after(0, lambda f=filename: self.log(f"固定版本不在本地仓库: {f}"))
+
     def download_apk(self, item):
-        """下载单个APK文件"""
+        """下载单个APK文件（有可用补丁时增量更新）"""
         app_name = item['app_name']
         version = item['version']
         url = item['url']
         filename = item['filename']
-        filepath = self.apks_dir / filename
+        filepath = self.store.temp_path(filename)
+
+        # 该应用已缓存的旧版本（保留在仓库中，可随时回滚）
+        safe_name = app_name.replace(' ', '_').replace('.', '_')
+        old_versions = [(entry["version"], self.store.blob_path(entry["blob"]))
+                        for name, entry in self.store.versions(safe_name) if name != filename]
 
         try:
             self.root.after(0, lambda: self.log(f"正在下载: {app_name} v{version}..."))
             self.root.after(0, lambda: self.set_status(f"正在下载 {filename}..."))
 
-            # 删除该应用的旧版本
-            safe_name = app_name.replace(' ', '_').replace('.', '_')
-            for old_file in self.apks_dir.glob(f"{safe_name}_*.apk"):
-                if old_file.name != filename:
-                    old_file.unlink()
-                    self.root.after(0, lambda f=old_file.name: self.log(f"删除旧版本: {f}"))
-
-            # 下载文件
-            req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            with urllib.request.urlopen(req, timeout=300) as response:
-                total_size = int(response.headers.get('Content-Length', 0))
-                downloaded = 0
-                chunk_size = 8192
-
-                with open(filepath, 'wb') as f:
-                    while True:
-                        chunk = response.read(chunk_size)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        downloaded += len(chunk)
-
-                        if total_size > 0:
-                            progress = downloaded / total_size * 100
-                            self.root.after(0, lambda p=progress, fn=filename:
-                                self.set_status(f"下载 {fn}: {p:.1f}%"))
+            if not self.download_via_patch(item, old_versions, filepath):
+                self.fetch_url(url, filepath, filename)
 
             # 验证文件
             if filepath.exists() and filepath.stat().st_size > 1000:
                 size_str = self.format_size(filepath.stat().st_size)
+                self.store.add_file(filepath, filename, app=safe_name, version=version)
                 self.root.after(0, lambda: self.log(f"下载完成: {filename} ({size_str})"))
+
+                # 只为最近的旧版本生成补丁
+                self.create_delta_patches(old_versions[:1], filename)
+                self.evict_store()
+
                 self.root.after(0, self.display_local_apks)
             else:
                 self.root.after(0, lambda: self.log(f"下载失败: {filename} 文件太小"))
@@ -819,6 +1609,105 @@ class ADBDeviceGUI:
 
         self.root.after(0, lambda: self.set_status("就绪"))
 
+    def fetch_url(self, url, filepath, filename):
+        """下载URL到文件并在状态栏显示进度"""
+        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(req, timeout=300) as response:
+            total_size = int(response.headers.get('Content-Length', 0))
+            downloaded = 0
+            chunk_size = 8192
+
+            with open(filepath, 'wb') as f:
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    downloaded += len(chunk)
+
+                    if total_size > 0:
+                        progress = downloaded / total_size * 100
+                        self.root.after(0, lambda p=progress, fn=filename:
+                            self.set_status(f"下载 {fn}: {p:.1f}%"))
+
+    def download_via_patch(self, item, old_versions, filepath):
+        """使用云端提供的补丁从本地旧版本重建新版本，成功返回 True"""
+        old_by_version = dict(old_versions)
+
+        for patch_info in item.get('patches', []):
+            from_version = patch_info.get('from_version', '')
+            patch_url = patch_info.get('patch_url', '')
+            old_file = old_by_version.get(from_version)
+            if not old_file or not patch_url:
+                continue
+
+            self.patches_dir.mkdir(parents=True, exist_ok=True)
+            patch_path = self.patches_dir / patch_filename(item['filename'], from_version)
+            try:
+                self.root.after(0, lambda v=from_version: self.log(f"下载增量补丁: v{v} -> v{item['version']}"))
+                self.fetch_url(patch_url, patch_path, patch_path.name)
+                apply_patch(old_file, patch_path, filepath)
+                self.root.after(0, lambda: self.log(f"增量更新完成: {item['filename']}"))
+                return True
+            except (PatchError, OSError, urllib.error.URLError) as e:
+                self.root.after(0, lambda err=e: self.log(f"增量更新失败，改为完整下载: {err}"))
+                if patch_path.exists():
+                    patch_path.unlink()
+        return False
+
+    def create_delta_patches(self, old_versions, filename):
+        """为旧版本生成到新版本的补丁，供设备端增量安装"""
+        target_path = self.store.path(filename)
+        for old_version, old_file in old_versions:
+            self.patches_dir.mkdir(parents=True, exist_ok=True)
+            patch_path = self.patches_dir / patch_filename(filename, old_version)
+            if patch_path.exists() or not old_file.exists():
+                continue
+            try:
+                self.root.after(0, lambda v=old_version: self.log(f"正在生成补丁: v{v} -> {filename}"))
+                patch_size = make_patch(old_file, target_path, patch_path)
+                # 补丁没有明显收益时不保留
+                if patch_size > target_path.stat().st_size * 0.8:
+                    patch_path.unlink()
+                    self.root.after(0, lambda: self.log("补丁收益太小，已丢弃"))
+                else:
+                    size_str = self.format_size(patch_size)
+                    self.root.after(0, lambda: self.log(f"补丁已生成: {patch_path.name} ({size_str})"))
+            except (PatchError, OSError, zipfile.BadZipFile) as e:
+                self.root.after(0, lambda err=e: self.log(f"生成补丁失败: {err}"))
+
+        # 清理目标已不在仓库中的补丁
+        if self.patches_dir.exists():
+            current = {Path(name).stem for name, _ in self.store.entries()}
+            for patch in self.patches_dir.glob("*.apkpatch"):
+                if patch.name.split('__from_')[0] not in current:
+                    patch.unlink()
+
+    def toggle_mirror(self):
+        """启动/停止局域网 APK 镜像"""
+        if self.mirror_server:
+            self.mirror_server.stop()
+            self.mirror_server = None
+            self.mirror_btn.config(text="启动APK镜像")
+            self.mirror_label.config(text="")
+            self.log("APK 镜像已停止")
+            return
+
+        try:
+            self.mirror_server = ApkMirrorServer(
+                self.apks_dir, log=lambda m: self.root.after(0, lambda: self.log(m)),
+                resolve_apk=self.store.path)
+        except OSError as e:
+            messagebox.showerror("错误", f"启动 APK 镜像失败: {e}")
+            return
+
+        self.mirror_server.start()
+        url = self.mirror_server.url
+        self.mirror_btn.config(text="停止APK镜像")
+        self.mirror_label.config(text=url)
+        self.log(f"APK 镜像已启动: {url}")
+        self.log(f"头显目录地址: {url}{CATALOG_PATH}")
+
     def format_size(self, size_bytes):
         """格式化文件大小"""
         if size_bytes < 1024:
@@ -830,25 +1719,48 @@ class ADBDeviceGUI:
         else:
             return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
 
+    def read_rate(self, var):
+        """读取限速输入，返回字节/秒，0 或无效输入表示不限"""
+        try:
+            rate = float(var.get())
+        except ValueError:
+            return None
+        return int(rate * 1024 * 1024) if rate > 0 else None
+
+    def apply_transfer_rates(self):
+        """应用限速设置"""
+        if self.transfer_scheduler:
+            self.transfer_scheduler.set_rates(self.read_rate(self.global_rate_var),
+                                              self.read_rate(self.device_rate_var))
+
+    def get_transfer_scheduler(self):
+        """获取传输调度器（首次使用时创建）"""
+        if not self.transfer_scheduler:
+            self.transfer_scheduler = TransferScheduler(
+                self.adb_path,
+                global_rate=self.read_rate(self.global_rate_var),
+                per_device_rate=self.read_rate(self.device_rate_var),
+                log=lambda m: self.root.after(0, lambda: self.log(m)))
+        return self.transfer_scheduler
+
     def install_apk(self):
-        """安装选中的 APK 到选中的设备"""
+        """安装选中的 APK 到选中的设备（支持多选，由传输调度器控制并发）"""
         # 获取选中的设备
-        device = self.get_selected_device()
-        if not device:
+        devices = self.get_selected_devices()
+        if not devices:
             return
 
         # 获取选中的 APK
-        apk_selection = self.apk_tree.selection()
+        apk_selection = self.apk_view.selection()
         if not apk_selection:
             messagebox.showwarning("未选择APK", "请先选择一个 APK 文件")
             return
 
-        apk_item = self.apk_tree.item(apk_selection[0])
-        apk_name = apk_item['values'][0]
-        apk_path = self.apks_dir / apk_name
+        apk_name = apk_selection[0]
+        apk_path = self.store.path(apk_name)
 
-        if not apk_path.exists():
-            messagebox.showerror("错误", f"APK 文件不存在: {apk_path}")
+        if not apk_path or not apk_path.exists():
+            messagebox.showerror("错误", f"APK 文件不存在: {apk_name}")
             return
 
         if not self.adb_path:
@@ -857,42 +1769,185 @@ class ADBDeviceGUI:
 
         # 检查设备是否已连接
         connected = self.get_connected_devices()
-        if device not in connected:
-            messagebox.showwarning("设备未连接", f"设备 {device} 未连接，请先连接")
+        not_connected = [d for d in devices if d not in connected]
+        if not_connected:
+            messagebox.showwarning("设备未连接", f"设备 {', '.join(not_connected)} 未连接，请先连接")
             return
 
-        self.log(f"正在安装 {apk_name} 到 {device}...")
+        self.run_preflight(apk_name, apk_path, devices)
+
+    def run_preflight(self, apk_name, apk_path, devices, job=None):
+        """传输前先检查所有设备的存储空间"""
+        info = self.manifest_index.get(apk_path) or {}
+        package = info.get("package")
+        obb_size = self.local_obb_size(package)
+        self.log(f"正在预检 {len(devices)} 个设备的存储空间...")
+        self.set_status("安装预检中...")
+
+        def check():
+            plans = preflight(self.get_shell_pool(), devices, package, info.get("versionCode"),
+                              apk_path.stat().st_size, obb_size)
+            self.root.after(0, lambda: self.confirm_install_plan(apk_name, apk_path, plans, job))
+
+        threading.Thread(target=check, daemon=True).start()
+
+    def local_obb_size(self, package):
+        """本地 apks/obb/<包名>/ 下 OBB 文件的总大小（计入所需空间）"""
+        if not package:
+            return 0
+        return sum(p.stat().st_size for p in (self.apks_dir / "obb" / package).glob("*.obb"))
+
+    def confirm_install_plan(self, apk_name, apk_path, plans, job=None):
+        """显示预检结果，确认清理后开始安装"""
+        for plan in plans:
+            self.log(plan.summary(self.format_size))
+
+        ready = [plan for plan in plans if plan.status in (STATUS_OK, STATUS_CLEANUP)]
+        rejected = [plan for plan in plans if plan not in ready]
+        if not ready:
+            self.set_status("安装预检失败")
+            messagebox.showerror("存储空间不足", "\n".join(p.summary(self.format_size) for p in rejected))
+            return
+        if rejected:
+            detail = "\n".join(p.summary(self.format_size) for p in rejected)
+            if not messagebox.askyesno("部分设备无法安装",
+                                       f"{detail}\n\n是否继续安装到其余 {len(ready)} 个设备？"):
+                self.set_status("已取消安装")
+                return
+
+        cleanup = [plan for plan in ready if plan.status == STATUS_CLEANUP]
+        if cleanup:
+            detail = "\n".join(p.summary(self.format_size) for p in cleanup)
+            if any(step.destructive for plan in cleanup for step in plan.cleanup):
+                detail += "\n\n注意: 卸载旧版本会清除该应用的数据"
+            if not messagebox.askyesno("需要清理空间", f"{detail}\n\n是否执行以上清理后安装？"):
+                ready = [plan for plan in ready if plan.status == STATUS_OK]
+                if not ready:
+                    self.set_status("已取消安装")
+                    return
+
+        self.start_install(apk_name, apk_path, ready, job)
+
+    def start_install(self, apk_name, apk_path, plans, deploy=None):
+        """按预检结果提交安装任务，每个设备的进度写入部署日志"""
+        devices = [plan.device for plan in plans]
+        cleanup = {plan.device: plan for plan in plans if plan.status == STATUS_CLEANUP}
+        if deploy is None:
+            info = self.manifest_index.get(apk_path) or {}
+            deploy = self.journal.create(apk_name, info.get("package"), info.get("versionCode"), devices)
+        self.log(f"正在安装 {apk_name} 到 {len(devices)} 个设备...")
         self.set_status(f"正在安装 {apk_name}...")
 
-        def install():
-            try:
-                cmd = [self.adb_path, '-s', device, 'install', '-r', str(apk_path)]
-                self.root.after(0, lambda: self.log_cmd(cmd))
-                pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
-                output, error = pipe.communicate(timeout=1800)  # 30分钟超时
+        patches = find_patches(self.patches_dir, apk_name)
+        scheduler = self.get_transfer_scheduler()
+
+        def prepare(job):
+            deploy.record(job.device, STEP_STARTED)
+            if job.device in cleanup:
+                if not run_cleanup(self.get_shell_pool(), cleanup[job.device],
+                                   log=lambda m: self.root.after(0, lambda m=m: self.log(m))):
+                    # 清理失败时空间仍不足，不再尝试安装
+                    job.success = False
+                    job.message = "预检清理失败，剩余空间不足"
+                    return True
+            # 设备上已安装补丁对应的旧版本时，只传输补丁
+            for patch in patches:
+                self.root.after(0, lambda p=patch, d=job.device: self.log(f"尝试增量安装 {d}: {p.name}"))
+                if device_install_patch(self.adb_path, job.device, patch,
+                                        log=lambda m: self.root.after(0, lambda m=m: self.log(m))):
+                    return True
+            self.root.after(0, lambda d=job.device: self.log(f"$ adb -s {d} exec-in pm install -r -S {job.size} < {apk_name}"))
+            return False
+
+        def on_done(job):
+            if job.success:
+                deploy.record(job.device, STEP_DONE)
+                self.root.after(0, lambda: self.log(f"安装成功: {apk_name} -> {job.device}"))
+            else:
+                deploy.record(job.device, STEP_FAILED, job.message)
+                self.root.after(0, lambda: self.log(f"安装失败: {apk_name} -> {job.device} - {job.message}"))
+
+        jobs = [scheduler.submit(device, apk_path, kind="install", before=prepare, on_done=on_done)
+                for device in devices]
 
-                output_str = output.decode("utf-8", errors='ignore').strip()
-                error_str = error.decode("utf-8", errors='ignore').strip()
+        def wait():
+            scheduler.wait_all(jobs)
+            deploy.close()
+            failed = [job for job in jobs if not job.success]
+            ok = len(jobs) - len(failed)
 
-                if pipe.returncode == 0 and "Success" in output_str:
-                    self.root.after(0, lambda: self.log(f"安装成功: {apk_name}"))
+            if len(jobs) == 1:
+                job = jobs[0]
+                if job.success:
                     self.root.after(0, lambda: self.set_status(f"安装成功: {apk_name}"))
                     self.root.after(0, lambda: messagebox.showinfo("成功", f"{apk_name} 安装成功"))
                     self.root.after(0, self.view_app_versions)
                 else:
-                    error_msg = error_str if error_str else output_str
-                    self.root.after(0, lambda: self.log(f"安装失败: {apk_name} - {error_msg}"))
                     self.root.after(0, lambda: self.set_status("安装失败"))
-                    self.root.after(0, lambda: messagebox.showerror("安装失败", f"{apk_name}\n{error_msg}"))
-
-            except Exception as e:
-                self.root.after(0, lambda: self.log(f"安装错误: {e}"))
-                self.root.after(0, lambda: self.set_status("安装出错"))
-                self.root.after(0, lambda: messagebox.showerror("错误", f"安装出错: {e}"))
+                    self.root.after(0, lambda: messagebox.showerror("安装失败", f"{apk_name}\n{job.message}"))
+                return
 
-        thread = threading.Thread(target=install, daemon=True)
+            self.root.after(0, lambda: self.log(f"安装完成: 成功 {ok}/{len(jobs)}"))
+            self.root.after(0, lambda: self.set_status(f"安装完成: 成功 {ok}/{len(jobs)}"))
+            if failed:
+                # 按失败类别汇总（存储不足、版本降级、设备离线……）
+                summary = adb_errors.format_summary(
+                    {job.device: job.error or adb_errors.AdbResult(adb_errors.UNKNOWN, job.message) for job in failed})
+                for line in summary:
+                    self.root.after(0, lambda line=line: self.log(f"  {line}"))
+                detail = "\n".join(summary)
+                self.root.after(0, lambda: messagebox.showerror("部分安装失败", detail))
+
+        thread = threading.Thread(target=wait, daemon=True)
         thread.start()
 
+    def check_unfinished_deployments(self):
+        """启动时检查上次未完成的部署并提示恢复"""
+        for job in self.journal.unfinished():
+            pending = job.pending_devices()
+            if not pending:
+                job.close()
+                continue
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(job.created or 0))
+            if messagebox.askyesno("恢复部署",
+                                   f"{created} 开始的部署未完成: {job.apk}\n"
+                                   f"还有 {len(pending)}/{len(job.devices)} 个设备未完成\n\n"
+                                   f"是否继续？（选择“否”将放弃该部署）"):
+                self.resume_deployment(job)
+            else:
+                job.close("abandoned")
+
+    def resume_deployment(self, job):
+        """核对设备上已安装的版本后，只重做未完成的设备"""
+        apk_path = self.store.path(job.apk)
+        if not apk_path or not apk_path.exists() or not self.adb_path:
+            self.log(f"无法恢复部署 {job.id}: APK {job.apk} 不存在")
+            job.close("abandoned")
+            return
+
+        connected = self.get_connected_devices()
+        online = [d for d in job.devices if d in connected]
+        for device in job.devices:
+            if device not in connected and job.steps.get(device) != STEP_DONE:
+                job.record(device, STEP_SKIPPED, "设备未连接")
+                self.log(f"跳过未连接的设备: {device}")
+        self.log(f"正在恢复部署 {job.id}: 核对 {len(online)} 个设备的已安装版本...")
+
+        def verify():
+            remaining = verify_completed(self.get_shell_pool(), job, online)
+            self.root.after(0, lambda: self.continue_deployment(job, apk_path, remaining))
+
+        threading.Thread(target=verify, daemon=True).start()
+
+    def continue_deployment(self, job, apk_path, remaining):
+        """继续执行恢复的部署"""
+        if not remaining:
+            self.log(f"部署 {job.id} 的所有在线设备已是目标版本")
+            job.close()
+            return
+        self.log(f"部署 {job.id}: 还需安装 {len(remaining)} 个设备")
+        self.run_preflight(job.apk, apk_path, remaining, job)
+
 
 def main():
     root = tk.Tk()
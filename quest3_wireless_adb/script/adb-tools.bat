@@ -1,6 +1,9 @@
 @echo off
 setlocal enabledelayedexpansion
 
+rem Use the same dedicated adb server port as the Python tools (adb_server.py), keep a user override
+if not defined ANDROID_ADB_SERVER_PORT set ANDROID_ADB_SERVER_PORT=5038
+
 :menu
 cls
 echo ========================================
@@ -15,10 +18,11 @@ echo  5. Disconnect one device
 echo  6. Grant WRITE_SECURE_SETTINGS
 echo  7. Revoke WRITE_SECURE_SETTINGS
 echo  8. List all devices
+echo  9. Find devices (play signal on all)
 echo  0. Exit
 echo.
 echo ========================================
-set /p choice=Select (0-8):
+set /p choice=Select (0-9):
 
 if "%choice%"=="1" goto scan
 if "%choice%"=="2" goto connect_all
@@ -28,6 +32,7 @@ if "%choice%"=="5" goto disconnect_one
 if "%choice%"=="6" goto grant_permission
 if "%choice%"=="7" goto revoke_permission
 if "%choice%"=="8" goto list_devices
+if "%choice%"=="9" goto find_devices
 if "%choice%"=="0" goto end
 goto menu
 
@@ -54,6 +59,13 @@ echo.
 pause
 goto menu
 
+:find_devices
+echo.
+python "%~dp0discover-and-connect.py" signal find
+echo.
+pause
+goto menu
+
 :list_devices
 echo.
 python "%~dp0discover-and-connect.py" list
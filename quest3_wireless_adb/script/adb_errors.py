@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+adb 结果分类与重试策略
+把 adb 命令的退出码和输出归类为 离线/未授权/拒绝连接/超时/安装失败码 等，
+永久性错误（未授权、端口已变、存储不足、版本降级……）立即失败，暂时性错误（超时、离线、传输中断）按退避重试；
+批量操作的结果按类别汇总显示
+"""
+
+import random
+import re
+import time
+from subprocess import Popen, PIPE, TimeoutExpired
+
+# 错误类别
+OK = "ok"
+TIMEOUT = "timeout"
+OFFLINE = "offline"
+UNREACHABLE = "unreachable"
+TRANSPORT = "transport"
+UNAUTHORIZED = "unauthorized"
+REFUSED = "refused"
+NOT_FOUND = "not_found"
+INSTALL_FAILED = "install_failed"
+UNKNOWN = "unknown"
+
+LABELS = {
+    OK: "成功",
+    TIMEOUT: "超时",
+    OFFLINE: "设备离线",
+    UNREACHABLE: "网络不可达",
+    TRANSPORT: "传输中断",
+    UNAUTHORIZED: "未授权（请在头显上允许调试）",
+    REFUSED: "拒绝连接（端口可能已变化，请重新扫描）",
+    NOT_FOUND: "设备未连接",
+    INSTALL_FAILED: "安装失败",
+    UNKNOWN: "其他错误",
+}
+
+# 暂时性错误及其最多重试次数，其余类别立即失败
+RETRIES = {
+    TIMEOUT: 2,
+    OFFLINE: 2,
+    UNREACHABLE: 1,
+    TRANSPORT: 2,
+}
+# 可以重试的安装失败码（设备端暂时状态）
+TRANSIENT_INSTALL_CODES = {
+    "INSTALL_FAILED_INTERNAL_ERROR": 1,
+    "INSTALL_FAILED_MEDIA_UNAVAILABLE": 1,
+}
+INSTALL_CODE_LABELS = {
+    "INSTALL_FAILED_INSUFFICIENT_STORAGE": "存储空间不足",
+    "INSTALL_FAILED_VERSION_DOWNGRADE": "版本降级（设备上的版本更新）",
+    "INSTALL_FAILED_UPDATE_INCOMPATIBLE": "签名不一致（需先卸载旧版本）",
+    "INSTALL_FAILED_ALREADY_EXISTS": "应用已存在",
+    "INSTALL_FAILED_INVALID_APK": "APK 无效",
+    "INSTALL_FAILED_NO_MATCHING_ABIS": "不支持的 CPU 架构",
+    "INSTALL_FAILED_OLDER_SDK": "系统版本过低",
+    "INSTALL_FAILED_TEST_ONLY": "测试包需要 -t 安装",
+    "INSTALL_FAILED_DUPLICATE_PERMISSION": "权限与其他应用冲突",
+    "INSTALL_FAILED_USER_RESTRICTED": "用户限制安装",
+    "INSTALL_FAILED_INTERNAL_ERROR": "设备内部错误",
+    "INSTALL_PARSE_FAILED_NO_CERTIFICATES": "APK 未签名",
+    "INSTALL_PARSE_FAILED_INCONSISTENT_CERTIFICATES": "签名不一致",
+}
+
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 15.0
+
+FAILURE_CODE_RE = re.compile(r"\b(INSTALL_(?:PARSE_)?FAILED_[A-Z_]+|DELETE_FAILED_[A-Z_]+)\b")
+
+# 按顺序匹配，先匹配到的类别优先
+PATTERNS = [
+    (UNAUTHORIZED, re.compile(r"unauthorized|failed to authenticate|not authorized", re.I)),
+    (OFFLINE, re.compile(r"device offline|\boffline\b", re.I)),
+    (NOT_FOUND, re.compile(r"device '.*' not found|device not found|no devices/emulators found", re.I)),
+    (REFUSED, re.compile(r"connection refused|actively refused|积极拒绝", re.I)),
+    (TIMEOUT, re.compile(r"timed out|timeout|超时", re.I)),
+    (UNREACHABLE, re.compile(r"no route to host|network is unreachable|host is down|unreachable", re.I)),
+    (TRANSPORT, re.compile(r"broken pipe|connection reset|protocol fault|transport|closed", re.I)),
+]
+
+
+class AdbResult:
+    """一次 adb 操作的分类结果"""
+
+    def __init__(self, kind, message="", code=None, output=""):
+        self.kind = kind
+        self.message = message
+        # 安装失败码，例如 INSTALL_FAILED_INSUFFICIENT_STORAGE
+        self.code = code
+        self.output = output
+
+    @property
+    def ok(self):
+        return self.kind == OK
+
+    @property
+    def max_retries(self):
+        if self.kind == INSTALL_FAILED:
+            return TRANSIENT_INSTALL_CODES.get(self.code, 0)
+        return RETRIES.get(self.kind, 0)
+
+    @property
+    def transient(self):
+        return self.max_retries > 0
+
+    @property
+    def label(self):
+        if self.kind == INSTALL_FAILED and self.code:
+            return INSTALL_CODE_LABELS.get(self.code, self.code)
+        return LABELS.get(self.kind, self.kind)
+
+    def describe(self):
+        if self.ok:
+            return self.message
+        return f"{self.label}: {self.message}" if self.message else self.label
+
+    def __repr__(self):
+        return f"AdbResult({self.kind!r}, {self.message!r}, code={self.code!r})"
+
+
+def _last_line(text):
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    return lines[-1].strip() if lines else ""
+
+
+def classify(returncode, output, error="", success=None):
+    """按输出分类；success(输出) 判断成功，默认以退出码为准"""
+    text = f"{output}\n{error}".strip()
+    if success(text) if success else returncode == 0:
+        return AdbResult(OK, _last_line(output), output=text)
+    match = FAILURE_CODE_RE.search(text)
+    if match:
+        return AdbResult(INSTALL_FAILED, _last_line(text), code=match.group(1), output=text)
+    for kind, pattern in PATTERNS:
+        if pattern.search(text):
+            return AdbResult(kind, _last_line(text), output=text)
+    return AdbResult(UNKNOWN, _last_line(text) or f"退出码 {returncode}", output=text)
+
+
+def connect_succeeded(text):
+    lowered = text.lower()
+    return (("connected to" in lowered or "already connected" in lowered)
+            and "cannot" not in lowered and "failed" not in lowered)
+
+
+def install_succeeded(text):
+    return "Success" in text and "Failure" not in text
+
+
+def run_adb(adb_path, args, timeout=60, success=None):
+    """执行 adb 命令并分类，超时也作为一种结果返回"""
+    try:
+        pipe = Popen([adb_path, *args], stdout=PIPE, stderr=PIPE)
+    except OSError as e:
+        return AdbResult(UNKNOWN, str(e))
+    try:
+        output, error = pipe.communicate(timeout=timeout)
+    except TimeoutExpired:
+        pipe.kill()
+        pipe.communicate()
+        return AdbResult(TIMEOUT, f"{timeout}s 无响应")
+    return classify(pipe.returncode, output.decode('utf-8', errors='ignore'),
+                    error.decode('utf-8', errors='ignore'), success)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """指数退避加随机抖动（attempt 从 1 开始）"""
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay * (0.5 + random.random() / 2)
+
+
+def with_retry(attempt_fn, on_retry=None, sleep=time.sleep):
+    """执行 attempt_fn() -> AdbResult，暂时性错误按类别的次数退避重试，永久性错误立即返回"""
+    attempt = 0
+    while True:
+        result = attempt_fn()
+        if result.ok or attempt >= result.max_retries:
+            return result
+        attempt += 1
+        delay = backoff_delay(attempt)
+        if on_retry:
+            on_retry(result, attempt, delay)
+        sleep(delay)
+
+
+def connect(adb_path, address, timeout=20, on_retry=None):
+    """adb connect，按错误类别重试"""
+    return with_retry(lambda: run_adb(adb_path, ['connect', address], timeout, success=connect_succeeded),
+                      on_retry=on_retry)
+
+
+def group_by_class(results, labels=True):
+    """{设备: AdbResult} -> {类别说明（labels=False 时为类别名）: [设备]}，按设备数从多到少"""
+    groups = {}
+    for device, result in results.items():
+        if not result.ok:
+            key = result.label if labels else (result.code or result.kind)
+            groups.setdefault(key, []).append(device)
+    return dict(sorted(groups.items(), key=lambda item: -len(item[1])))
+
+
+def format_summary(results, limit=5, labels=True):
+    """按类别汇总失败设备，每类最多列出 limit 台"""
+    lines = []
+    for label, devices in group_by_class(results, labels).items():
+        shown = ", ".join(devices[:limit]) + (f" (+{len(devices) - limit})" if len(devices) > limit else "")
+        lines.append(f"{label} ({len(devices)}): {shown}")
+    return lines
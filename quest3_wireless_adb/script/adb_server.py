@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+adb 服务管理
+本工具使用独立端口（ANDROID_ADB_SERVER_PORT）上的专属 adb 服务，
+IDE/Unity 自带的其他版本 adb 使用默认 5037 端口，互不杀死对方的服务；
+启动时在后台提前拉起服务，定期健康检查，并报告版本冲突而不是反复重启
+"""
+
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+from pathlib import Path
+from subprocess import Popen, PIPE, TimeoutExpired
+
+# 本工具专用的 adb 服务端口（adb 默认是 5037）
+DEFAULT_SERVER_PORT = 5038
+ADB_DEFAULT_PORT = 5037
+HEALTH_INTERVAL = 10.0
+START_TIMEOUT = 15
+
+VERSION_RE = re.compile(r"Android Debug Bridge version \d+\.\d+\.(\d+)")
+REVISION_RE = re.compile(r"^Version (\S+)", re.MULTILINE)
+
+
+def find_adb():
+    """查找 adb：优先使用脚本目录下 platform-tools 中固定版本的 adb，其次是 PATH"""
+    local_adb = Path(__file__).parent / "platform-tools" / ("adb.exe" if os.name == 'nt' else "adb")
+    if local_adb.exists():
+        return str(local_adb.absolute())
+    return shutil.which('adb')
+
+
+def configure_server_port(port=None):
+    """设置本进程及子进程使用的 adb 服务端口（用户已设置环境变量时保留用户的设置）"""
+    if port is None:
+        port = int(os.environ.get("ANDROID_ADB_SERVER_PORT") or DEFAULT_SERVER_PORT)
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(port)
+    return port
+
+
+def client_version(adb_path):
+    """返回 (adb 协议版本号, 版本字符串)，例如 (41, "35.0.2-12147458")"""
+    pipe = Popen([adb_path, 'version'], stdout=PIPE, stderr=PIPE)
+    output, _ = pipe.communicate(timeout=10)
+    text = output.decode('utf-8', errors='ignore')
+    match = VERSION_RE.search(text)
+    revision = REVISION_RE.search(text)
+    return (int(match.group(1)) if match else None), (revision.group(1) if revision else "")
+
+
+def server_version(port, timeout=2.0):
+    """通过 host:version 请求查询正在运行的 adb 服务版本，没有服务时返回 None"""
+    request = b"host:version"
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout) as s:
+            s.sendall(b"%04x%s" % (len(request), request))
+            reply = b""
+            while len(reply) < 12:
+                chunk = s.recv(12 - len(reply))
+                if not chunk:
+                    break
+                reply += chunk
+    except OSError:
+        return None
+    if reply[:4] != b"OKAY" or len(reply) < 12:
+        return None
+    try:
+        return int(reply[8:12], 16)
+    except ValueError:
+        return None
+
+
+class AdbServerManager:
+    """管理本工具专属的 adb 服务"""
+
+    def __init__(self, adb_path, port=None, log=print, on_restart=None):
+        self.adb_path = adb_path
+        self.port = configure_server_port(port)
+        self.log = log
+        # 服务意外重启后回调（无线连接会全部断开）
+        self.on_restart = on_restart
+        self.version = None
+        self.revision = ""
+        self.ready = threading.Event()
+        self.running = False
+        self.restarts = 0
+        self.status = "starting"
+
+    def start(self):
+        """在后台启动服务和健康检查"""
+        if self.running or not self.adb_path:
+            return self
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def wait_ready(self, timeout=START_TIMEOUT):
+        return self.ready.wait(timeout)
+
+    def _run(self):
+        try:
+            self.version, self.revision = client_version(self.adb_path)
+        except (OSError, TimeoutExpired) as e:
+            self.status = f"adb 无法运行: {e}"
+            self.log(self.status)
+            self.ready.set()
+            return
+        self.check_default_server()
+        self.ensure_server()
+        self.ready.set()
+        while self.running:
+            time.sleep(HEALTH_INTERVAL)
+            if not self.running:
+                break
+            if server_version(self.port) is None:
+                self.restarts += 1
+                self.log(f"adb 服务 (端口 {self.port}) 已停止，正在重新启动...")
+                if self.ensure_server() and self.on_restart:
+                    self.on_restart()
+
+    def check_default_server(self):
+        """默认端口上有其他版本的 adb 服务时只提示，不去杀掉它"""
+        other = server_version(ADB_DEFAULT_PORT)
+        if other is not None and self.version is not None and other != self.version:
+            self.log(f"提示: 端口 {ADB_DEFAULT_PORT} 上运行着其他版本的 adb 服务 (版本 {other})，"
+                     f"本工具使用独立端口 {self.port} 上的 adb (版本 {self.version})，互不影响")
+
+    def ensure_server(self):
+        """确保专属端口上运行着版本匹配的服务，返回是否可用"""
+        running = server_version(self.port)
+        if running is not None and self.version is not None and running != self.version:
+            # 端口被其他版本的 adb 占用，重启只会与对方互相杀死，直接报告
+            self.status = f"版本冲突: 端口 {self.port} 上的 adb 服务版本 {running}，本工具的 adb 版本 {self.version}"
+            self.log(f"{self.status}，请关闭使用该端口的程序或设置 ANDROID_ADB_SERVER_PORT 为其他端口")
+            return False
+        if running is None:
+            start = time.perf_counter()
+            try:
+                pipe = Popen([self.adb_path, 'start-server'], stdout=PIPE, stderr=PIPE)
+                pipe.communicate(timeout=START_TIMEOUT)
+            except (OSError, TimeoutExpired) as e:
+                self.status = f"adb 服务启动失败: {e}"
+                self.log(self.status)
+                return False
+            if server_version(self.port) is None:
+                self.status = "adb 服务启动失败"
+                self.log(self.status)
+                return False
+            self.log(f"adb 服务已启动 (端口 {self.port}, 版本 {self.revision or self.version}, "
+                     f"{(time.perf_counter() - start) * 1000:.0f} ms)")
+        self.status = "ok"
+        return True
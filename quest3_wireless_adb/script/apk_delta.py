@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+APK 增量更新
+按 ZIP 条目比较新旧 APK 生成二进制补丁，可在本地应用，也可在设备上用 dd 基于已安装的 base.apk 重建
+"""
+
+import hashlib
+import json
+import os
+import struct
+import zipfile
+from pathlib import Path
+from subprocess import Popen, PIPE
+
+# 补丁文件格式: MAGIC + 头长度(uint32) + JSON 头 + 字面数据区
+PATCH_MAGIC = b"QAPKPAT1"
+PATCH_SUFFIX = ".apkpatch"
+
+CHUNK_SIZE = 1024 * 1024
+
+# 设备端临时目录
+DEVICE_TMP_DIR = "/data/local/tmp"
+# 本工具写入设备临时目录的文件名前缀，预检清理只删除带此前缀的文件
+DEVICE_TMP_PREFIX = "qwa_"
+
+
+class PatchError(Exception):
+    """补丁生成或应用失败"""
+
+
+def file_sha256(path):
+    """计算文件 SHA256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def patch_filename(target_filename, source_version):
+    """补丁文件名: <目标文件名去后缀>__from_<旧版本>.apkpatch"""
+    stem = Path(target_filename).stem
+    return f"{stem}__from_{source_version}{PATCH_SUFFIX}"
+
+
+def find_patches(patches_dir, target_filename):
+    """查找以指定 APK 为目标的所有补丁"""
+    patches_dir = Path(patches_dir)
+    if not patches_dir.exists():
+        return []
+    stem = Path(target_filename).stem
+    return sorted(patches_dir.glob(f"{stem}__from_*{PATCH_SUFFIX}"))
+
+
+def _entry_ranges(path):
+    """读取 ZIP 中央目录，返回每个条目的 (名称, CRC, 压缩大小, 压缩方式, 头偏移, 数据起点)"""
+    entries = []
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            f.seek(info.header_offset)
+            header = f.read(30)
+            if len(header) != 30 or header[:4] != b"PK\x03\x04":
+                raise PatchError(f"无效的本地文件头: {info.filename}")
+            name_len, extra_len = struct.unpack('<HH', header[26:30])
+            data_start = info.header_offset + 30 + name_len + extra_len
+            entries.append((info.filename, info.CRC, info.compress_size,
+                            info.compress_type, info.header_offset, data_start))
+    return entries
+
+
+def _ranges_equal(f_a, off_a, f_b, off_b, length):
+    """逐块比较两个文件区间是否相同"""
+    f_a.seek(off_a)
+    f_b.seek(off_b)
+    remaining = length
+    while remaining > 0:
+        n = min(CHUNK_SIZE, remaining)
+        if f_a.read(n) != f_b.read(n):
+            return False
+        remaining -= n
+    return True
+
+
+def _append_op(ops, kind, offset, length):
+    """追加操作，相邻的同类区间直接合并以减少设备端 dd 次数"""
+    if length <= 0:
+        return
+    if ops:
+        last = ops[-1]
+        if last[0] == kind and last[1] + last[2] == offset:
+            last[2] += length
+            return
+    ops.append([kind, offset, length])
+
+
+def make_patch(source_path, target_path, patch_path):
+    """生成 source -> target 的补丁，返回补丁大小"""
+    source_path = Path(source_path)
+    target_path = Path(target_path)
+
+    source_entries = _entry_ranges(source_path)
+    by_name = {e[0]: e for e in source_entries}
+    by_content = {(e[1], e[2], e[3]): e for e in source_entries}
+
+    ops = []  # [kind, offset, length]，kind: "c" 从源文件复制，"d" 从字面数据区复制
+    literals = []  # 目标文件中需要写入补丁的区间 (offset, length)
+    literal_size = 0
+    cursor = 0
+    target_size = target_path.stat().st_size
+
+    with open(source_path, 'rb') as src, open(target_path, 'rb') as dst:
+        for name, crc, csize, method, header_offset, data_start in sorted(
+                _entry_ranges(target_path), key=lambda e: e[4]):
+            match = by_name.get(name)
+            if not match or (match[1], match[2], match[3]) != (crc, csize, method):
+                match = by_content.get((crc, csize, method))
+            if not match or csize == 0 or not _ranges_equal(src, match[5], dst, data_start, csize):
+                continue
+
+            # 本地文件头等不同部分作为字面数据，条目数据从源文件复制
+            if data_start > cursor:
+                _append_op(ops, "d", literal_size, data_start - cursor)
+                literals.append((cursor, data_start - cursor))
+                literal_size += data_start - cursor
+            _append_op(ops, "c", match[5], csize)
+            cursor = data_start + csize
+
+        if target_size > cursor:
+            _append_op(ops, "d", literal_size, target_size - cursor)
+            literals.append((cursor, target_size - cursor))
+            literal_size += target_size - cursor
+
+        header = {
+            "source_sha256": file_sha256(source_path),
+            "source_size": source_path.stat().st_size,
+            "target_sha256": file_sha256(target_path),
+            "target_size": target_size,
+            "ops": ops,
+        }
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+        tmp_path = Path(str(patch_path) + ".tmp")
+        try:
+            with open(tmp_path, 'wb') as out:
+                out.write(PATCH_MAGIC)
+                out.write(struct.pack('<I', len(header_bytes)))
+                out.write(header_bytes)
+                for offset, length in literals:
+                    dst.seek(offset)
+                    remaining = length
+                    while remaining > 0:
+                        chunk = dst.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise PatchError("读取目标文件失败")
+                        out.write(chunk)
+                        remaining -= len(chunk)
+            os.replace(tmp_path, patch_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    return Path(patch_path).stat().st_size
+
+
+def read_patch_header(patch_path):
+    """读取补丁头，返回 (header, 字面数据区在补丁文件中的起始偏移)"""
+    with open(patch_path, 'rb') as f:
+        if f.read(len(PATCH_MAGIC)) != PATCH_MAGIC:
+            raise PatchError(f"不是有效的补丁文件: {patch_path}")
+        (header_len,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    return header, len(PATCH_MAGIC) + 4 + header_len
+
+
+def apply_patch(source_path, patch_path, out_path):
+    """在本地应用补丁，校验目标 SHA256，不一致时抛出 PatchError"""
+    header, literal_base = read_patch_header(patch_path)
+    if Path(source_path).stat().st_size != header["source_size"]:
+        raise PatchError("源文件大小与补丁不符")
+
+    h = hashlib.sha256()
+    tmp_path = Path(str(out_path) + ".tmp")
+    try:
+        with open(source_path, 'rb') as src, open(patch_path, 'rb') as patch, open(tmp_path, 'wb') as out:
+            for kind, offset, length in header["ops"]:
+                f = src if kind == "c" else patch
+                f.seek(offset if kind == "c" else literal_base + offset)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise PatchError("补丁数据不完整")
+                    out.write(chunk)
+                    h.update(chunk)
+                    remaining -= len(chunk)
+
+        if h.hexdigest() != header["target_sha256"]:
+            raise PatchError("目标文件校验失败")
+        os.replace(tmp_path, out_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    return header
+
+
+def device_apply_script(header, literal_base, source_remote, patch_remote, out_remote):
+    """生成在设备上用 dd 重建目标 APK 的 shell 脚本，最后输出目标文件的 sha256"""
+    lines = [f": > '{out_remote}'"]
+    for kind, offset, length in header["ops"]:
+        if kind == "c":
+            src, skip = source_remote, offset
+        else:
+            src, skip = patch_remote, literal_base + offset
+        lines.append(
+            f"dd if='{src}' bs={CHUNK_SIZE} iflag=skip_bytes,count_bytes "
+            f"skip={skip} count={length} >> '{out_remote}' 2>/dev/null || exit 1"
+        )
+    lines.append(f"sha256sum '{out_remote}'")
+    return "\n".join(lines) + "\n"
+
+
+def _adb(adb_path, device, *args, timeout=None):
+    """执行 adb 命令，返回 (returncode, stdout, stderr)"""
+    cmd = [adb_path, '-s', device, *args]
+    pipe = Popen(cmd, stdout=PIPE, stderr=PIPE)
+    output, error = pipe.communicate(timeout=timeout)
+    return (pipe.returncode,
+            output.decode("utf-8", errors='ignore').strip(),
+            error.decode("utf-8", errors='ignore').strip())
+
+
+def find_installed_source(adb_path, device, header):
+    """在设备已安装应用中查找与补丁源文件一致的 base.apk，返回其路径或 None"""
+    code, output, _ = _adb(adb_path, device, 'shell', 'pm', 'list', 'packages', '-f', '-3', timeout=30)
+    if code != 0:
+        return None
+
+    paths = []
+    for line in output.split('\n'):
+        line = line.strip()
+        if line.startswith('package:') and '=' in line:
+            paths.append(line[8:].rsplit('=', 1)[0])
+    if not paths:
+        return None
+
+    # 一次 shell 调用取全部大小，先按大小筛选，再在设备上计算哈希确认
+    quoted = ' '.join(f"'{p}'" for p in paths)
+    code, output, _ = _adb(adb_path, device, 'shell', f"stat -c '%s %n' {quoted}", timeout=30)
+    if code != 0:
+        return None
+
+    for line in output.split('\n'):
+        parts = line.strip().split(' ', 1)
+        if len(parts) != 2 or not parts[0].isdigit():
+            continue
+        if int(parts[0]) != header["source_size"]:
+            continue
+        code, output, _ = _adb(adb_path, device, 'shell', f"sha256sum '{parts[1]}'", timeout=300)
+        if code == 0 and output.split(' ')[0] == header["source_sha256"]:
+            return parts[1]
+    return None
+
+
+def device_install_patch(adb_path, device, patch_path, log=print):
+    """推送补丁到设备，基于已安装的 base.apk 重建并安装，成功返回 True"""
+    header, literal_base = read_patch_header(patch_path)
+    source_remote = find_installed_source(adb_path, device, header)
+    if not source_remote:
+        return False
+
+    name = Path(patch_path).name
+    patch_remote = f"{DEVICE_TMP_DIR}/{DEVICE_TMP_PREFIX}{name}"
+    script_remote = f"{patch_remote}.sh"
+    out_remote = f"{patch_remote}.apk"
+    script_local = Path(str(patch_path) + ".sh")
+
+    try:
+        script_local.write_text(
+            device_apply_script(header, literal_base, source_remote, patch_remote, out_remote),
+            encoding='utf-8', newline='\n')
+
+        log(f"推送补丁 {name} ({header['target_size']} 字节目标, 补丁 {Path(patch_path).stat().st_size} 字节)")
+        for local, remote in ((patch_path, patch_remote), (script_local, script_remote)):
+            code, _, error = _adb(adb_path, device, 'push', str(local), remote, timeout=1800)
+            if code != 0:
+                log(f"推送失败: {error}")
+                return False
+
+        code, output, error = _adb(adb_path, device, 'shell', 'sh', script_remote, timeout=1800)
+        if code != 0 or output.split(' ')[0] != header["target_sha256"]:
+            log(f"设备端重建校验失败，回退到完整安装 {error}")
+            return False
+
+        code, output, error = _adb(adb_path, device, 'shell', 'pm', 'install', '-r', out_remote, timeout=1800)
+        if code != 0 or "Success" not in output:
+            log(f"增量安装失败: {error if error else output}")
+            return False
+        return True
+    finally:
+        if script_local.exists():
+            script_local.unlink()
+        _adb(adb_path, device, 'shell', 'rm', '-f', patch_remote, script_remote, out_remote, timeout=60)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+APK 清单索引（不依赖 aapt）
+只读取 ZIP 中央目录和 AndroidManifest.xml 条目，解析二进制 XML 得到
+包名、versionCode、versionName 和 split 信息，结果按 路径+大小+修改时间 缓存
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+from pathlib import Path
+
+MANIFEST_NAME = "AndroidManifest.xml"
+
+# ZIP 结构签名
+EOCD_SIG = b"PK\x05\x06"
+ZIP64_LOCATOR_SIG = b"PK\x06\x07"
+ZIP64_EOCD_SIG = b"PK\x06\x06"
+CENTRAL_SIG = b"PK\x01\x02"
+LOCAL_SIG = b"PK\x03\x04"
+
+# 二进制 XML 块类型
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+
+UTF8_FLAG = 0x100
+NO_INDEX = 0xFFFFFFFF
+
+# Res_value 数据类型
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+
+# android: 属性资源 ID（混淆后的清单里属性名可能为空，按 ID 识别）
+ATTR_IDS = {
+    0x0101021b: "versionCode",
+    0x0101021c: "versionName",
+    0x01010576: "versionCodeMajor",
+    0x01010003: "name",
+    0x0101055b: "isFeatureSplit",
+    0x01010591: "isSplitRequired",
+}
+
+
+class ManifestError(Exception):
+    """APK 清单解析失败"""
+
+
+def _find_central_directory(f, file_size):
+    """定位中央目录，返回 (偏移, 大小)"""
+    tail_size = min(file_size, 65535 + 22)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    pos = tail.rfind(EOCD_SIG)
+    if pos < 0:
+        raise ManifestError("找不到 ZIP 目录结尾")
+
+    cd_size, cd_offset = struct.unpack('<II', tail[pos + 12:pos + 20])
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+        # ZIP64
+        loc = tail.rfind(ZIP64_LOCATOR_SIG, 0, pos)
+        if loc < 0:
+            raise ManifestError("找不到 ZIP64 定位记录")
+        (eocd64_offset,) = struct.unpack('<Q', tail[loc + 8:loc + 16])
+        f.seek(eocd64_offset)
+        record = f.read(56)
+        if record[:4] != ZIP64_EOCD_SIG:
+            raise ManifestError("无效的 ZIP64 目录结尾")
+        cd_size, cd_offset = struct.unpack('<QQ', record[40:56])
+    return cd_offset, cd_size
+
+
+def read_zip_entry(path, entry_name):
+    """只读取 ZIP 中的单个条目并解压"""
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        cd_offset, cd_size = _find_central_directory(f, file_size)
+        f.seek(cd_offset)
+        cd = f.read(cd_size)
+
+        target = entry_name.encode('utf-8')
+        pos = 0
+        while pos + 46 <= len(cd) and cd[pos:pos + 4] == CENTRAL_SIG:
+            (method, _, _, _, csize, usize,
+             name_len, extra_len, comment_len) = struct.unpack('<HHHIIIHHH', cd[pos + 10:pos + 34])
+            (header_offset,) = struct.unpack('<I', cd[pos + 42:pos + 46])
+            name = cd[pos + 46:pos + 46 + name_len]
+            extra = cd[pos + 46 + name_len:pos + 46 + name_len + extra_len]
+            pos += 46 + name_len + extra_len + comment_len
+            if name != target:
+                continue
+
+            if 0xFFFFFFFF in (csize, usize, header_offset):
+                usize, csize, header_offset = _zip64_extra(extra, usize, csize, header_offset)
+
+            f.seek(header_offset)
+            local = f.read(30)
+            if local[:4] != LOCAL_SIG:
+                raise ManifestError("无效的本地文件头")
+            local_name_len, local_extra_len = struct.unpack('<HH', local[26:30])
+            f.seek(header_offset + 30 + local_name_len + local_extra_len)
+            data = f.read(csize)
+
+            if method == 0:
+                return data
+            if method == 8:
+                return zlib.decompress(data, -15)
+            raise ManifestError(f"不支持的压缩方式: {method}")
+
+    raise ManifestError(f"APK 中没有 {entry_name}")
+
+
+def _zip64_extra(extra, usize, csize, header_offset):
+    """从 ZIP64 扩展字段中读取被截断的大小和偏移"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, size = struct.unpack('<HH', extra[pos:pos + 4])
+        if tag == 0x0001:
+            values = list(struct.unpack(f'<{size // 8}Q', extra[pos + 4:pos + 4 + size - size % 8]))
+            if usize == 0xFFFFFFFF and values:
+                usize = values.pop(0)
+            if csize == 0xFFFFFFFF and values:
+                csize = values.pop(0)
+            if header_offset == 0xFFFFFFFF and values:
+                header_offset = values.pop(0)
+            break
+        pos += 4 + size
+    return usize, csize, header_offset
+
+
+def _decode_string_pool(data, offset):
+    """解析字符串池"""
+    header_size, chunk_size = struct.unpack('<HI', data[offset + 2:offset + 8])
+    string_count, _, flags, strings_start, _ = struct.unpack('<IIIII', data[offset + 8:offset + 28])
+    is_utf8 = bool(flags & UTF8_FLAG)
+    offsets = struct.unpack(f'<{string_count}I', data[offset + header_size:offset + header_size + 4 * string_count])
+    base = offset + strings_start
+
+    strings = []
+    for string_offset in offsets:
+        pos = base + string_offset
+        if is_utf8:
+            # UTF-16 长度和 UTF-8 字节长度，各 1~2 字节
+            pos += 2 if data[pos] & 0x80 else 1
+            length = data[pos]
+            if length & 0x80:
+                length = ((length & 0x7F) << 8) | data[pos + 1]
+                pos += 2
+            else:
+                pos += 1
+            strings.append(data[pos:pos + length].decode('utf-8', errors='replace'))
+        else:
+            (length,) = struct.unpack('<H', data[pos:pos + 2])
+            pos += 2
+            if length & 0x8000:
+                (low,) = struct.unpack('<H', data[pos:pos + 2])
+                length = ((length & 0x7FFF) << 16) | low
+                pos += 2
+            strings.append(data[pos:pos + length * 2].decode('utf-16-le', errors='replace'))
+    return strings
+
+
+def parse_binary_manifest(data):
+    """解析二进制 AndroidManifest.xml"""
+    if len(data) < 8 or struct.unpack('<H', data[:2])[0] != RES_XML_TYPE:
+        raise ManifestError("不是二进制 XML")
+
+    strings = []
+    resource_ids = []
+    result = {
+        "package": None,
+        "versionCode": None,
+        "versionName": None,
+        "split": None,
+        "isFeatureSplit": False,
+        "isSplitRequired": False,
+        "usesSplits": [],
+    }
+
+    (header_size,) = struct.unpack('<H', data[2:4])
+    offset = header_size
+    while offset + 8 <= len(data):
+        chunk_type, chunk_header_size, chunk_size = struct.unpack('<HHI', data[offset:offset + 8])
+        if chunk_size < 8:
+            break
+
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = _decode_string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            count = (chunk_size - chunk_header_size) // 4
+            resource_ids = struct.unpack(f'<{count}I', data[offset + chunk_header_size:offset + chunk_header_size + 4 * count])
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            ext = offset + chunk_header_size
+            _, name_index, attr_start, attr_size, attr_count = struct.unpack('<IIHHH', data[ext:ext + 14])
+            tag = strings[name_index] if name_index < len(strings) else ""
+            attrs = {}
+            for i in range(attr_count):
+                pos = ext + attr_start + i * attr_size
+                _, attr_name, raw_value, _, _, value_type, value = struct.unpack('<IIIHBBI', data[pos:pos + 20])
+                key = ATTR_IDS.get(resource_ids[attr_name]) if attr_name < len(resource_ids) else None
+                if not key:
+                    key = strings[attr_name] if attr_name < len(strings) else ""
+                # 先按类型取整数/布尔值，保留了原始字符串的清单中 versionCode 也是整数
+                if value_type == TYPE_INT_BOOLEAN:
+                    attrs[key] = value != 0
+                elif value_type in (TYPE_INT_DEC, TYPE_INT_HEX):
+                    attrs[key] = value
+                elif value_type == TYPE_STRING or raw_value != NO_INDEX:
+                    index = raw_value if raw_value != NO_INDEX else value
+                    attrs[key] = strings[index] if index < len(strings) else None
+                else:
+                    attrs[key] = value
+
+            if tag == "manifest":
+                result["package"] = attrs.get("package")
+                version_code = attrs.get("versionCode")
+                if isinstance(version_code, int):
+                    major = attrs.get("versionCodeMajor")
+                    result["versionCode"] = ((major if isinstance(major, int) else 0) << 32) | version_code
+                version_name = attrs.get("versionName")
+                result["versionName"] = str(version_name) if version_name is not None else None
+                result["split"] = attrs.get("split")
+                result["isFeatureSplit"] = bool(attrs.get("isFeatureSplit", False))
+            elif tag == "application":
+                result["isSplitRequired"] = bool(attrs.get("isSplitRequired", False))
+            elif tag == "uses-split" and attrs.get("name"):
+                result["usesSplits"].append(attrs["name"])
+
+        offset += chunk_size
+
+    if not result["package"]:
+        raise ManifestError("清单中没有包名")
+    return result
+
+
+def read_apk_manifest(path):
+    """读取 APK 的清单信息"""
+    return parse_binary_manifest(read_zip_entry(path, MANIFEST_NAME))
+
+
+class ManifestIndex:
+    """APK 清单缓存，键为 路径|大小|修改时间"""
+
+    def __init__(self, cache_file):
+        self.cache_file = Path(cache_file)
+        self.lock = threading.Lock()
+        self.cache = {}
+        if self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self.cache = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.cache = {}
+
+    @staticmethod
+    def cache_key(path):
+        stat = Path(path).stat()
+        return f"{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def cached(self, path):
+        """只查缓存，未命中返回 None"""
+        try:
+            key = self.cache_key(path)
+        except OSError:
+            return None
+        with self.lock:
+            return self.cache.get(key)
+
+    def get(self, path):
+        """读取清单信息，未命中时解析并写入缓存；解析失败返回 None"""
+        try:
+            key = self.cache_key(path)
+        except OSError:
+            return None
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        try:
+            info = read_apk_manifest(path)
+        except (ManifestError, OSError, zlib.error, struct.error, IndexError) as e:
+            info = {"error": str(e)}
+        with self.lock:
+            self.cache[key] = info
+        return info
+
+    def save(self, live_paths=None):
+        """保存缓存，提供 live_paths 时清除已不存在文件的条目"""
+        with self.lock:
+            if live_paths is not None:
+                live = {str(Path(p).resolve()) for p in live_paths}
+                self.cache = {k: v for k, v in self.cache.items() if k.rsplit('|', 2)[0] in live}
+            tmp_file = self.cache_file.with_suffix(".json.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.cache_file)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python apk_manifest.py <apk> [...]")
+        return
+    for apk in sys.argv[1:]:
+        try:
+            info = read_apk_manifest(apk)
+            print(f"{apk}: {info['package']} versionCode={info['versionCode']} "
+                  f"versionName={info['versionName']} split={info['split']}")
+        except (ManifestError, OSError) as e:
+            print(f"{apk}: error: {e}")
+
+
+if __name__ == "__main__":
+    main()
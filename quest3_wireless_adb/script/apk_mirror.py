@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+局域网 APK 镜像服务器
+把本地 apks 目录通过 HTTP 提供给头显下载，支持 Range 断点续传和 sendfile 零拷贝，
+并提供与 REMOTE_API_URL 相同格式的应用目录接口
+"""
+
+import json
+import re
+import socket
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# 与云端一致的目录接口路径，头显只需把主机改为本机地址
+CATALOG_PATH = "/api/v1/admins/applications/versions/all"
+# APK 下载路径前缀
+FILES_PREFIX = "/apks/"
+PATCHES_PREFIX = "/patches/"
+
+DEFAULT_PORT = 8765
+
+# 缓存的云端目录（由 adb-gui 在同步时写入）
+CATALOG_FILENAME = "catalog.json"
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_lan_ip():
+    """获取本机局域网 IP（不实际发送数据）"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("10.255.255.255", 1))
+        return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+    finally:
+        s.close()
+
+
+def safe_name(app_name):
+    """生成本地文件名中的应用名部分（与 Unity 端一致）"""
+    return app_name.replace(' ', '_').replace('.', '_')
+
+
+class MirrorRequestHandler(BaseHTTPRequestHandler):
+    """镜像请求处理"""
+
+    server_version = "QuestApkMirror/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.log:
+            self.server.log(f"[镜像] {self.address_string()} {format % args}")
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if path == CATALOG_PATH:
+            self.send_catalog(send_body)
+        elif path.startswith(FILES_PREFIX):
+            self.send_apk(self.server.resolve_apk(path[len(FILES_PREFIX):]), send_body)
+        elif path.startswith(PATCHES_PREFIX):
+            self.send_apk(self.server.resolve_patch(path[len(PATCHES_PREFIX):]), send_body)
+        else:
+            self.send_error(404)
+
+    def base_url(self):
+        host = self.headers.get('Host') or f"{get_lan_ip()}:{self.server.server_address[1]}"
+        return f"http://{host}"
+
+    def send_catalog(self, send_body):
+        body = json.dumps(self.server.build_catalog(self.base_url()), ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def send_apk(self, file_path, send_body):
+        if not file_path:
+            self.send_error(404)
+            return
+
+        size = file_path.stat().st_size
+        start, end = 0, size - 1
+        status = 200
+
+        range_header = self.headers.get('Range')
+        if range_header:
+            match = RANGE_RE.match(range_header.strip())
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    if match.group(2):
+                        end = min(int(match.group(2)), size - 1)
+                else:
+                    # bytes=-N 表示最后 N 字节
+                    start = max(0, size - int(match.group(2)))
+                if start > end or start >= size:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f"bytes */{size}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/vnd.android.package-archive')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(length))
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if send_body and length > 0:
+            with open(file_path, 'rb') as f:
+                try:
+                    # socket.sendfile 在支持的平台上使用 os.sendfile 零拷贝
+                    self.connection.sendfile(f, offset=start, count=length)
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+
+
+class ApkMirrorServer(ThreadingHTTPServer):
+    """APK 镜像服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, apks_dir, port=DEFAULT_PORT, host="0.0.0.0", log=None, resolve_apk=None):
+        self.apks_dir = Path(apks_dir)
+        self.patches_dir = self.apks_dir / "patches"
+        self.log = log
+        self._resolve_apk = resolve_apk
+        self._thread = None
+        super().__init__((host, port), MirrorRequestHandler)
+
+    def resolve_apk(self, filename):
+        """把请求的文件名映射为本地文件，禁止访问目录外的文件"""
+        if self._resolve_apk:
+            return self._resolve_apk(Path(filename).name)
+        return self._resolve_in(self.apks_dir, filename)
+
+    def resolve_patch(self, filename):
+        return self._resolve_in(self.patches_dir, filename)
+
+    def _resolve_in(self, directory, filename):
+        name = Path(filename).name
+        if not name or name != filename:
+            return None
+        file_path = directory / name
+        return file_path if file_path.is_file() else None
+
+    def load_catalog(self):
+        catalog_file = self.apks_dir / CATALOG_FILENAME
+        if catalog_file.exists():
+            try:
+                with open(catalog_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        return []
+
+    def build_catalog(self, base_url):
+        """基于缓存的云端目录生成本地目录，本地已有的 APK 改为镜像地址"""
+        catalog = []
+        for app in self.load_catalog():
+            app = dict(app)
+            app_name = app.get('app_name', '')
+            version = app.get('latest_version', '')
+            filename = f"{safe_name(app_name)}_{version}.apk"
+            if app_name and version and self.resolve_apk(filename):
+                app['apk_url'] = f"{base_url}{FILES_PREFIX}{urllib.parse.quote(filename)}"
+
+                patches = []
+                for patch in app.get('patches') or []:
+                    stem = f"{Path(filename).stem}__from_{patch.get('from_version', '')}.apkpatch"
+                    if self.resolve_patch(stem):
+                        patch = dict(patch, patch_url=f"{base_url}{PATCHES_PREFIX}{urllib.parse.quote(stem)}")
+                    patches.append(patch)
+                if patches:
+                    app['patches'] = patches
+            catalog.append(app)
+        return catalog
+
+    @property
+    def url(self):
+        return f"http://{get_lan_ip()}:{self.server_address[1]}"
+
+    def start(self):
+        """在后台线程中运行"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    apks_dir = Path(__file__).parent / "apks"
+    server = ApkMirrorServer(apks_dir, port=port, log=print)
+    print(f"Serving {apks_dir} at {server.url}")
+    print(f"Catalog: {server.url}{CATALOG_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
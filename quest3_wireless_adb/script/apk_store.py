@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+内容寻址的本地 APK 仓库
+APK 以 SHA256 命名存放在 blobs 目录，index.json 记录 文件名(应用/版本) -> blob 的映射，
+相同内容只存一份，超出容量预算时按最近最少使用淘汰旧版本
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# 跨进程文件锁：GUI、守护进程和命令行各自持有 ApkStore 实例，写索引前互斥
+try:
+    import msvcrt  # Windows
+    HAS_MSVCRT = True
+except ImportError:
+    import fcntl  # Unix/Linux
+    HAS_MSVCRT = False
+
+# 默认容量预算
+DEFAULT_BUDGET_BYTES = 20 * 1024 * 1024 * 1024
+
+CHUNK_SIZE = 1024 * 1024
+# 最近使用时间只在内存中更新，最多延迟这么久写回索引
+FLUSH_DELAY = 30.0
+
+
+def split_apk_filename(filename):
+    """从 <safe_name>_<version>.apk 中拆出 (safe_name, version)"""
+    stem = Path(filename).stem
+    if '_' not in stem:
+        return stem, ''
+    app, version = stem.rsplit('_', 1)
+    return app, version
+
+
+class IndexFileLock:
+    """索引的跨进程排他锁（锁文件）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a+b')
+        if HAS_MSVCRT:
+            self.file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK 重试约 10 秒后仍拿不到锁会抛出 OSError，继续等待
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if HAS_MSVCRT:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+
+class ApkStore:
+    """APK 仓库
+    多个进程可以同时打开同一仓库：每次写入都在锁文件保护下重新读取磁盘上的索引，
+    合并本进程的修改后再写回，不会覆盖其他进程新增或删除的条目"""
+
+    def __init__(self, root, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.tmp_dir = self.root / "tmp"
+        self.index_file = self.root / "index.json"
+        self.lock_file = self.root / "index.lock"
+        self.budget_bytes = budget_bytes
+        self.lock = threading.RLock()
+        # 尚未写回索引的最近使用时间 {filename: last_used}
+        self.touched = {}
+        self.flush_timer = None
+
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.entries_by_name = self.load_index()
+
+    def load_index(self):
+        """加载索引 {filename: {app, version, blob, size, added, last_used}}"""
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("entries", {})
+            except (OSError, json.JSONDecodeError):
+                pass
+        return {}
+
+    def save_index(self):
+        """原子写入索引，只应在 _commit 持有锁文件时调用"""
+        tmp_file = self.index_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"entries": self.entries_by_name}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def _apply_touched(self, entries):
+        for name, used in self.touched.items():
+            entry = entries.get(name)
+            if entry:
+                entry["last_used"] = max(entry.get("last_used", 0), used)
+
+    def reload(self):
+        """重新读取磁盘上的索引（其他进程可能已新增或删除条目），保留本进程未写回的最近使用时间"""
+        with self.lock:
+            entries = self.load_index()
+            self._apply_touched(entries)
+            self.entries_by_name = entries
+
+    def _commit(self, change=None):
+        """在锁文件内重新读取索引，合并最近使用时间并执行 change(entries) 后写回，返回 change 的结果"""
+        with self.lock, IndexFileLock(self.lock_file):
+            entries = self.load_index()
+            self._apply_touched(entries)
+            result = change(entries) if change else None
+            self.entries_by_name = entries
+            self.save_index()
+            self.touched = {}
+            return result
+
+    def flush(self):
+        """把内存中更新的最近使用时间写回索引"""
+        with self.lock:
+            self.flush_timer = None
+            if self.touched:
+                self._commit()
+
+    def close(self):
+        """取消定时写回并立即写入未保存的修改"""
+        with self.lock:
+            if self.flush_timer:
+                self.flush_timer.cancel()
+            self.flush()
+
+    def _touch(self, filename, used):
+        self.touched[filename] = used
+        if self.flush_timer is None:
+            self.flush_timer = threading.Timer(FLUSH_DELAY, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def blob_path(self, blob):
+        return self.blobs_dir / f"{blob}.apk"
+
+    def temp_path(self, filename):
+        """下载用的临时文件（与 blobs 同一文件系统，入库时直接改名）"""
+        return self.tmp_dir / f"{filename}.part"
+
+    def add_file(self, src, filename, app=None, version=None, sha256=None):
+        """把文件移入仓库并登记为 filename，返回索引条目"""
+        src = Path(src)
+        if app is None or version is None:
+            app, version = split_apk_filename(filename)
+        if not sha256:
+            h = hashlib.sha256()
+            with open(src, 'rb') as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+            sha256 = h.hexdigest()
+
+        def change(entries):
+            # 在锁内移动 blob，避免与其他进程的淘汰/删除交错
+            blob_path = self.blob_path(sha256)
+            if blob_path.exists():
+                # 内容已存在，只登记新文件名
+                src.unlink()
+            else:
+                os.replace(src, blob_path)
+
+            now = time.time()
+            entry = {
+                "app": app,
+                "version": version,
+                "blob": sha256,
+                "size": blob_path.stat().st_size,
+                "added": now,
+                "last_used": now,
+            }
+            entries[filename] = entry
+            return dict(entry)
+
+        return self._commit(change)
+
+    def ingest_dir(self, directory):
+        """把目录中散放的 APK 导入仓库，返回导入的文件名列表"""
+        imported = []
+        for apk_file in sorted(Path(directory).glob("*.apk")):
+            self.add_file(apk_file, apk_file.name)
+            imported.append(apk_file.name)
+        return imported
+
+    def lookup(self, filename):
+        with self.lock:
+            if filename not in self.entries_by_name:
+                # 可能是其他进程刚加入的
+                self.reload()
+            entry = self.entries_by_name.get(filename)
+            return dict(entry) if entry else None
+
+    def path(self, filename):
+        """返回文件名对应的 blob 路径，并更新最近使用时间（定时或 close() 时写回索引）"""
+        with self.lock:
+            if filename not in self.entries_by_name:
+                # 可能是其他进程刚加入的
+                self.reload()
+            entry = self.entries_by_name.get(filename)
+            if not entry:
+                return None
+            blob_path = self.blob_path(entry["blob"])
+            if not blob_path.exists():
+                self._commit(lambda entries: self._drop_missing(entries, filename))
+                entry = self.entries_by_name.get(filename)
+                return self.blob_path(entry["blob"]) if entry else None
+            now = time.time()
+            entry["last_used"] = now
+            self._touch(filename, now)
+            return blob_path
+
+    def _drop_missing(self, entries, filename):
+        """blob 已不存在时删除登记（重新读取后其他进程可能已重新入库，此时保留）"""
+        entry = entries.get(filename)
+        if entry and not self.blob_path(entry["blob"]).exists():
+            del entries[filename]
+
+    def entries(self):
+        """返回 [(filename, entry)]，按文件名排序"""
+        with self.lock:
+            return sorted(((name, dict(entry)) for name, entry in self.entries_by_name.items()),
+                          key=lambda x: x[0].lower())
+
+    def versions(self, app):
+        """返回某应用的所有缓存版本 [(filename, entry)]，最新加入的在前"""
+        with self.lock:
+            items = [(name, dict(entry)) for name, entry in self.entries_by_name.items()
+                     if entry["app"] == app]
+        return sorted(items, key=lambda x: x[1]["added"], reverse=True)
+
+    def total_size(self):
+        with self.lock:
+            return self._total_size(self.entries_by_name)
+
+    @staticmethod
+    def _total_size(entries):
+        blobs = {entry["blob"]: entry["size"] for entry in entries.values()}
+        return sum(blobs.values())
+
+    def remove(self, filename):
+        """删除文件名登记，blob 不再被引用时一并删除"""
+        def change(entries):
+            entry = entries.pop(filename, None)
+            if not entry:
+                return
+            if not any(e["blob"] == entry["blob"] for e in entries.values()):
+                blob_path = self.blob_path(entry["blob"])
+                if blob_path.exists():
+                    blob_path.unlink()
+
+        self._commit(change)
+
+    def evict(self, keep=()):
+        """超出预算时按 LRU 淘汰，每个应用最新加入的版本和 keep 中的文件名（发布通道固定的版本）不会被淘汰，
+        返回被淘汰的文件名"""
+        keep = {name.lower() for name in keep}
+
+        def change(entries):
+            evicted = []
+            latest = {}
+            for name, entry in entries.items():
+                current = latest.get(entry["app"])
+                if current is None or entry["added"] > entries[current]["added"]:
+                    latest[entry["app"]] = name
+            pinned_blobs = {entries[name]["blob"] for name in latest.values()}
+            pinned_blobs |= {entry["blob"] for name, entry in entries.items() if name.lower() in keep}
+
+            # blob 的最近使用时间取所有引用它的条目的最大值
+            blob_last_used = {}
+            for entry in entries.values():
+                blob_last_used[entry["blob"]] = max(blob_last_used.get(entry["blob"], 0), entry["last_used"])
+
+            total = self._total_size(entries)
+            for blob, _ in sorted(blob_last_used.items(), key=lambda x: x[1]):
+                if total <= self.budget_bytes:
+                    break
+                if blob in pinned_blobs:
+                    continue
+                names = [name for name, entry in entries.items() if entry["blob"] == blob]
+                total -= entries[names[0]]["size"]
+                for name in names:
+                    del entries[name]
+                    evicted.append(name)
+                blob_path = self.blob_path(blob)
+                if blob_path.exists():
+                    blob_path.unlink()
+            return evicted
+
+        return self._commit(change)
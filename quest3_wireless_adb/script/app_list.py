@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+查询设备上的第三方应用及版本
+「查看应用」和性能测试共用同一套命令序列：通过常驻 shell 列出第三方应用，
+再逐个查询版本（在设备上用 grep 过滤，只传回版本行）
+"""
+
+from shell_pool import ShellError
+
+LIST_COMMAND = 'pm list packages -3'
+
+
+class AppListError(Exception):
+    """无法列出设备上的应用"""
+
+
+def version_command(package):
+    return f"dumpsys package {package} | grep -E 'versionCode=|versionName='"
+
+
+def parse_packages(output):
+    """解析 pm list packages 的输出，返回包名列表"""
+    return [line[8:].strip() for line in output.split('\n') if line.startswith('package:')]
+
+
+def parse_version(output):
+    """解析 dumpsys 版本行，返回 (versionName, versionCode)，未找到时为 ("N/A", None)"""
+    version = "N/A"
+    version_code = None
+    for line in output.split('\n'):
+        line = line.strip()
+        if line.startswith('versionCode=') and version_code is None:
+            code = line.split()[0].split('=')[1]
+            version_code = int(code) if code.isdigit() else None
+        elif line.startswith('versionName='):
+            version = line.split('=')[1].strip()
+            break
+    return version, version_code
+
+
+def list_apps(pool, device, on_packages=None):
+    """返回 [(包名, 应用名, 版本, versionCode)]，顺序与 pm 输出一致；
+    on_packages(包名列表) 在列出应用后、查询版本前调用；列出失败时抛出 AppListError 或 ShellError"""
+    code, output = pool.run(device, LIST_COMMAND)
+    if code != 0:
+        raise AppListError(output)
+    packages = parse_packages(output)
+    if on_packages:
+        on_packages(packages)
+
+    apps = []
+    for package in packages:
+        try:
+            _, output = pool.run(device, version_command(package), timeout=5)
+        except ShellError:
+            apps.append((package, package, "获取失败", None))
+            continue
+        version, version_code = parse_version(output)
+        apps.append((package, package, version, version_code))
+    return apps
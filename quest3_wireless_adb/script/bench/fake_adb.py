@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+模拟的 adb 命令行（性能测试用）
+支持本工具用到的子命令: version / start-server / devices / connect / disconnect /
+shell（含 shell -T 常驻会话）/ exec-in / install / push，
+请求转发给 FAKE_ADB_SERVER 环境变量指定的 fake_adb_server.py
+"""
+
+import json
+import os
+import re
+import socket
+import struct
+import sys
+
+CHUNK_SIZE = 256 * 1024
+
+# shell_pool 常驻会话发送的命令格式
+SESSION_RE = re.compile(r'^\( (.*) \) </dev/null 2>&1; echo "(\S+) \$\?"$')
+
+
+def server_address():
+    host, _, port = os.environ.get("FAKE_ADB_SERVER", "127.0.0.1:5039").rpartition(':')
+    return host, int(port)
+
+
+def request(payload, stream=None):
+    """发送请求，stream 为文件对象时分块上传其内容"""
+    with socket.create_connection(server_address()) as s:
+        s.sendall((json.dumps(payload) + "\n").encode('utf-8'))
+        if stream is not None:
+            try:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    s.sendall(struct.pack(">I", len(chunk)) + chunk)
+                s.sendall(struct.pack(">I", 0))
+            except OSError:
+                pass
+        reply = s.makefile('rb').readline()
+    return json.loads(reply) if reply else {"code": 1, "stderr": "fake adb: server closed connection\n"}
+
+
+def finish(result):
+    sys.stdout.write(result.get("stdout", ""))
+    sys.stderr.write(result.get("stderr", ""))
+    return result.get("code", 0)
+
+
+def shell_session(device):
+    """常驻 shell：每行命令转发一次，输出后补上结束标记"""
+    for line in sys.stdin:
+        line = line.rstrip('\n')
+        match = SESSION_RE.match(line)
+        command = match.group(1) if match else line
+        if command.strip() == "exit":
+            return 0
+        result = request({"op": "shell", "device": device, "command": command})
+        output = result.get("stdout", "") + result.get("stderr", "")
+        sys.stdout.write(output)
+        if match:
+            sys.stdout.write(f"{match.group(2)} {result.get('code', 0)}\n")
+        sys.stdout.flush()
+    return 0
+
+
+def main(argv):
+    device = os.environ.get("ANDROID_SERIAL")
+    args = list(argv)
+    if args[:1] == ['-s']:
+        device, args = args[1], args[2:]
+    command = args[0] if args else "help"
+    rest = args[1:]
+
+    if command == "version":
+        print("Android Debug Bridge version 1.0.41\nVersion 35.0.2-fake")
+        return 0
+    if command in ("start-server", "kill-server", "wait-for-device"):
+        return 0
+    if command in ("devices", "connect", "disconnect"):
+        return finish(request({"op": command, "args": rest}))
+    if command == "shell":
+        rest = [a for a in rest if a not in ("-T", "-t", "-x")]
+        if not rest:
+            return shell_session(device)
+        return finish(request({"op": "shell", "device": device, "command": " ".join(rest)}))
+    if command == "exec-in":
+        return finish(request({"op": "stream", "device": device, "command": " ".join(rest)},
+                              stream=sys.stdin.buffer))
+    if command in ("install", "push"):
+        path = rest[-1] if command == "install" else rest[-2]
+        remote = "pm install" if command == "install" else f"cat > '{rest[-1]}'"
+        with open(path, 'rb') as f:
+            return finish(request({"op": "stream", "device": device, "command": remote}, stream=f))
+    sys.stderr.write(f"fake adb: unsupported command {command}\n")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+模拟的 adb 服务和设备（性能测试用）
+保存 N 台模拟设备的连接状态和已安装应用，每台设备有可配置的往返延迟和带宽，
+所有设备共享一条总带宽（模拟同一 Wi-Fi 信道）；由 fake_adb.py 命令行转发请求。
+用法: python fake_adb_server.py --devices 100 [--latency 20] [--bandwidth 5] ...
+启动后在标准输出打印 "PORT <端口>"
+"""
+
+import argparse
+import json
+import re
+import socketserver
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from transfer_scheduler import TokenBucket
+
+ADB_PORT = 5555
+
+DUMPSYS_RE = re.compile(r"^dumpsys package (\S+)")
+PM_PATH_RE = re.compile(r"^pm path (\S+)")
+PM_UNINSTALL_RE = re.compile(r"^pm uninstall (\S+)")
+
+
+def device_address(index):
+    """第 index 台模拟设备的地址（mDNS 模拟广播使用同一套地址）"""
+    return f"10.77.{index // 250}.{index % 250 + 1}:{ADB_PORT}"
+
+
+def fake_packages(count):
+    """生成模拟的第三方应用 {包名: (versionCode, versionName)}"""
+    packages = {}
+    for i in range(count):
+        packages[f"com.bench.app{i:04d}"] = (100 + i, f"1.{i}.0")
+    return packages
+
+
+class FakeDevice:
+    def __init__(self, address, packages, latency, bandwidth):
+        self.address = address
+        self.packages = dict(packages)
+        self.latency = latency
+        self.bucket = TokenBucket(bandwidth)
+        self.connected = False
+        self.lock = threading.Lock()
+
+    def shell(self, command):
+        """模拟常用 shell 命令，返回 (退出码, 输出)；管道只执行第一段"""
+        command = command.split('|')[0].strip()
+        if command.startswith("pm list packages"):
+            show_code = "--show-versioncode" in command
+            lines = []
+            with self.lock:
+                for package, (code, _) in sorted(self.packages.items()):
+                    lines.append(f"package:{package}" + (f" versionCode:{code}" if show_code else ""))
+            return 0, "\n".join(lines)
+        match = DUMPSYS_RE.match(command)
+        if match:
+            info = self.packages.get(match.group(1))
+            if not info:
+                return 0, ""
+            return 0, f"    versionCode={info[0]} minSdk=29 targetSdk=32\n    versionName={info[1]}"
+        match = PM_PATH_RE.match(command)
+        if match:
+            if match.group(1) not in self.packages:
+                return 1, ""
+            return 0, f"package:/data/app/{match.group(1)}-1/base.apk"
+        match = PM_UNINSTALL_RE.match(command)
+        if match:
+            with self.lock:
+                removed = self.packages.pop(match.group(1), None)
+            return (0, "Success") if removed else (1, "Failure [DELETE_FAILED_INTERNAL_ERROR]")
+        if command.startswith("echo "):
+            return 0, command[5:].strip().strip('"\'')
+        return 0, ""
+
+
+class FakeFleet:
+    """所有模拟设备和共享信道"""
+
+    def __init__(self, count, packages=30, latency=0.02, connect_latency=0.05, bandwidth=None,
+                 channel_bandwidth=None, install_time=0.5, connected=False):
+        self.devices = {}
+        package_table = fake_packages(packages)
+        for i in range(count):
+            device = FakeDevice(device_address(i), package_table, latency, bandwidth)
+            device.connected = connected
+            self.devices[device.address] = device
+        self.connect_latency = connect_latency
+        self.install_time = install_time
+        self.channel = TokenBucket(channel_bandwidth)
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+    def handle(self, request, rfile):
+        op = request.get("op")
+        if op == "devices":
+            lines = ["List of devices attached"]
+            lines += [f"{a}\tdevice" for a, d in self.devices.items() if d.connected]
+            return {"code": 0, "stdout": "\n".join(lines) + "\n"}
+        if op == "connect":
+            address = request["args"][0]
+            time.sleep(self.connect_latency)
+            device = self.devices.get(address)
+            if device is None:
+                return {"code": 1, "stdout": f"failed to connect to '{address}': Connection refused\n"}
+            if device.connected:
+                return {"code": 0, "stdout": f"already connected to {address}\n"}
+            device.connected = True
+            return {"code": 0, "stdout": f"connected to {address}\n"}
+        if op == "disconnect":
+            targets = request["args"] or list(self.devices)
+            for address in targets:
+                if address in self.devices:
+                    self.devices[address].connected = False
+            return {"code": 0, "stdout": "disconnected everything\n" if not request["args"] else
+                    f"disconnected {targets[0]}\n"}
+
+        device = self.devices.get(request.get("device") or "")
+        if device is None or not device.connected:
+            if op == "stream":
+                self.read_stream(rfile, None)
+            return {"code": 1, "stderr": f"adb: device '{request.get('device')}' not found\n"}
+        time.sleep(device.latency)
+        if op == "shell":
+            code, output = device.shell(request["command"])
+            return {"code": code, "stdout": output + ("\n" if output else "")}
+        if op == "stream":
+            size = self.read_stream(rfile, device)
+            command = request["command"]
+            if command.startswith("pm install"):
+                time.sleep(self.install_time)
+                return {"code": 0, "stdout": "Success\n"}
+            return {"code": 0, "stdout": f"{size} bytes\n"}
+        return {"code": 1, "stderr": f"fake adb: unsupported command {op}\n"}
+
+    def read_stream(self, rfile, device):
+        """读取分块上传的数据，按设备带宽和共享信道限速（读得慢时 TCP 会反压发送端）"""
+        total = 0
+        while True:
+            header = rfile.read(4)
+            if len(header) < 4:
+                break
+            length = struct.unpack(">I", header)[0]
+            if not length:
+                break
+            chunk = rfile.read(length)
+            if device is not None:
+                device.bucket.consume(len(chunk))
+                self.channel.consume(len(chunk))
+            total += len(chunk)
+        with self.lock:
+            self.bytes_received += total
+        return total
+
+
+class FakeAdbRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            result = self.server.fleet.handle(json.loads(line), self.rfile)
+        except (KeyError, IndexError, ValueError) as e:
+            result = {"code": 1, "stderr": f"fake adb: {e}\n"}
+        self.wfile.write((json.dumps(result) + "\n").encode('utf-8'))
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+    def __init__(self, fleet, port=0):
+        self.fleet = fleet
+        super().__init__(("127.0.0.1", port), FakeAdbRequestHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 adb 服务")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--packages", type=int, default=30, help="每台设备的第三方应用数")
+    parser.add_argument("--latency", type=float, default=20, help="每个请求的往返延迟（毫秒）")
+    parser.add_argument("--connect-latency", type=float, default=50, help="adb connect 耗时（毫秒）")
+    parser.add_argument("--bandwidth", type=float, default=0, help="单台设备带宽 MB/s，0 为不限")
+    parser.add_argument("--channel-bandwidth", type=float, default=0, help="共享信道总带宽 MB/s，0 为不限")
+    parser.add_argument("--install-time", type=float, default=0.5, help="传输完成后 pm install 的耗时（秒）")
+    parser.add_argument("--connected", action="store_true", help="启动时所有设备已连接")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    fleet = FakeFleet(args.devices, packages=args.packages, latency=args.latency / 1000,
+                      connect_latency=args.connect_latency / 1000,
+                      bandwidth=args.bandwidth * 1024 * 1024 or None,
+                      channel_bandwidth=args.channel_bandwidth * 1024 * 1024 or None,
+                      install_time=args.install_time, connected=args.connected)
+    server = FakeAdbServer(fleet, args.port)
+    print(f"PORT {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
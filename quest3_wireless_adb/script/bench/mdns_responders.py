@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+模拟的 mDNS 广播（性能测试用）
+在本机注册 N 个 _adb-tls-connect._tcp 服务，地址与 fake_adb_server.py 中的模拟设备一致。
+用法: python mdns_responders.py --count 100，全部注册完成后在标准输出打印 "READY"，读到标准输入结束时注销退出
+"""
+
+import argparse
+import asyncio
+import socket
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from zeroconf import IPVersion, ServiceInfo
+from zeroconf.asyncio import AsyncZeroconf
+
+from fake_adb_server import device_address
+
+SERVICE_TYPE = "_adb-tls-connect._tcp.local."
+
+
+def service_info(index):
+    ip, port = device_address(index).rsplit(':', 1)
+    return ServiceInfo(SERVICE_TYPE, f"adb-bench{index:04d}-fake._adb-tls-connect._tcp.local.",
+                       addresses=[socket.inet_aton(ip)], port=int(port),
+                       server=f"bench{index:04d}.local.")
+
+
+async def run(count, interface):
+    zc = AsyncZeroconf(interfaces=[interface], ip_version=IPVersion.V4Only)
+    infos = [service_info(i) for i in range(count)]
+    # 并发注册；模拟设备名不会冲突，跳过冲突探测
+    tasks = await asyncio.gather(*(zc.async_register_service(info, cooperating_responders=True)
+                                   for info in infos))
+    await asyncio.gather(*tasks)
+    print("READY", flush=True)
+    # 标准输入关闭（父进程退出或结束测试）时注销
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+    await zc.async_unregister_all_services()
+    await zc.async_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 mDNS 广播")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--interface", default="127.0.0.1")
+    args = parser.parse_args()
+    asyncio.run(run(args.count, args.interface))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+性能测试
+用模拟的 adb 服务和 mDNS 广播，在 1/10/100/500 台模拟设备上测量发现、连接、应用列表和安装的耗时，
+调用的是工具本身的代码（扫描监听器、连接、shell 会话池、传输调度器、常驻服务）；
+结果保存在 bench/results/，与 bench/baseline.json 比较，变慢超过容差时报告回退并以非零状态退出。
+用法: python run_bench.py [--sizes 1,10,100] [--only connect,install] [--save-baseline]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from app_list import AppListError, list_apps
+from fake_adb_server import device_address
+from shell_pool import ShellError, ShellPool
+from transfer_scheduler import TransferScheduler
+
+DEFAULT_SIZES = (1, 10, 100, 500)
+SCENARIOS = ("discovery", "connect", "connect_parallel", "app_list", "install")
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+RESULTS_DIR = BENCH_DIR / "results"
+# 比基线慢超过该比例视为回退（低于 NOISE_FLOOR 秒的差异忽略）
+DEFAULT_TOLERANCE = 0.2
+NOISE_FLOOR = 0.05
+DISCOVERY_TIMEOUT = 30
+# 应用列表同时查询的设备数（每台设备占用一个 shell 会话）
+APP_LIST_WORKERS = 8
+
+
+class FakeEnvironment:
+    """启动模拟 adb 服务，并生成指向 fake_adb.py 的 adb 可执行文件"""
+
+    def __init__(self, count, options, connected=False):
+        self.count = count
+        self.options = options
+        self.connected = connected
+        self.tmp = tempfile.TemporaryDirectory(prefix="qwa-bench-")
+        self.server = None
+        self.adb_path = None
+
+    def __enter__(self):
+        o = self.options
+        cmd = [sys.executable, str(BENCH_DIR / "fake_adb_server.py"), "--devices", str(self.count),
+               "--packages", str(o.packages), "--latency", str(o.latency),
+               "--connect-latency", str(o.connect_latency), "--bandwidth", str(o.bandwidth),
+               "--channel-bandwidth", str(o.channel_bandwidth), "--install-time", str(o.install_time)]
+        if self.connected:
+            cmd.append("--connected")
+        self.server = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        line = self.server.stdout.readline()
+        if not line.startswith("PORT "):
+            raise RuntimeError("fake adb server failed to start")
+        os.environ["FAKE_ADB_SERVER"] = f"127.0.0.1:{line.split()[1]}"
+
+        fake_adb = BENCH_DIR / "fake_adb.py"
+        if os.name == 'nt':
+            self.adb_path = str(Path(self.tmp.name) / "adb.bat")
+            with open(self.adb_path, 'w') as f:
+                f.write(f'@"{sys.executable}" "{fake_adb}" %*\n')
+        else:
+            self.adb_path = str(Path(self.tmp.name) / "adb")
+            with open(self.adb_path, 'w') as f:
+                f.write(f'#!/bin/sh\nexec "{sys.executable}" "{fake_adb}" "$@"\n')
+            os.chmod(self.adb_path, 0o755)
+        return self
+
+    def __exit__(self, *exc):
+        if self.server:
+            self.server.kill()
+            self.server.wait()
+        self.tmp.cleanup()
+
+    @property
+    def devices(self):
+        return [device_address(i) for i in range(self.count)]
+
+
+def load_cli():
+    """导入 discover-and-connect.py（文件名含连字符）"""
+    spec = importlib.util.spec_from_file_location("discover_and_connect", SCRIPT_DIR / "discover-and-connect.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_discovery(count, options):
+    """mDNS 发现：从开始浏览到找到全部模拟设备的耗时"""
+    from zeroconf import IPVersion, ServiceBrowser, Zeroconf
+
+    cli = load_cli()
+    responders = subprocess.Popen(
+        [sys.executable, str(BENCH_DIR / "mdns_responders.py"), "--count", str(count),
+         "--interface", options.interface],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        if responders.stdout.readline().strip() != "READY":
+            raise RuntimeError("mDNS responders failed to start")
+        zeroconf = Zeroconf(interfaces=[options.interface], ip_version=IPVersion.V4Only)
+        listener = cli.MyListener()
+        start = time.perf_counter()
+        browsers = []
+        try:
+            for service_type in ("_adb-tls-connect._tcp.local.", "_adb_secure_connect._tcp.local."):
+                browsers.append(ServiceBrowser(zeroconf, service_type, listener))
+            while len(listener.discovered_devices) < count and time.perf_counter() - start < DISCOVERY_TIMEOUT:
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+        finally:
+            # 先停止浏览器，避免关闭后仍有回调在查询服务信息
+            for browser in browsers:
+                browser.cancel()
+            zeroconf.close()
+        return elapsed, len(listener.discovered_devices)
+    finally:
+        responders.stdin.close()
+        try:
+            responders.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            responders.kill()
+
+
+def bench_connect(count, options):
+    """逐台连接（与扫描命令和界面「连接全部」相同的方式）"""
+    cli = load_cli()
+    with FakeEnvironment(count, options) as env:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok = sum(1 for device in env.devices if cli.connect_device(device, env.adb_path))
+        return time.perf_counter() - start, ok
+
+
+def bench_connect_parallel(count, options):
+    """通过常驻服务并发连接"""
+    from fleet_daemon import FleetDaemon
+
+    with FakeEnvironment(count, options) as env:
+        fleet = FleetDaemon(env.adb_path, Path(env.tmp.name) / "devices.json", log=lambda message: None)
+        try:
+            start = time.perf_counter()
+            op = fleet.connect(env.devices)
+            op.done.wait()
+            elapsed = time.perf_counter() - start
+            return elapsed, sum(1 for r in op.results.values() if r["ok"])
+        finally:
+            fleet.stop()
+
+
+def bench_app_list(count, options):
+    """在所有设备上获取应用列表（与「查看应用」调用同一个 app_list.list_apps）"""
+    with FakeEnvironment(count, options, connected=True) as env:
+        pool = ShellPool(env.adb_path)
+
+        def run(device):
+            try:
+                apps = list_apps(pool, device)
+                return len(apps) == options.packages and all(a[3] is not None for a in apps)
+            except (AppListError, ShellError):
+                return False
+            finally:
+                pool.discard(device)
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=APP_LIST_WORKERS) as executor:
+                ok = sum(executor.map(run, env.devices))
+            return time.perf_counter() - start, ok
+        finally:
+            pool.close_all()
+
+
+def bench_install(count, options):
+    """通过传输调度器向所有设备安装同一个 APK"""
+    with FakeEnvironment(count, options, connected=True) as env:
+        apk_path = Path(env.tmp.name) / "bench.apk"
+        with open(apk_path, 'wb') as f:
+            f.write(os.urandom(int(options.apk_size * 1024 * 1024)))
+        scheduler = TransferScheduler(env.adb_path)
+        try:
+            start = time.perf_counter()
+            jobs = [scheduler.submit(device, apk_path, kind="install") for device in env.devices]
+            scheduler.wait_all(jobs)
+            return time.perf_counter() - start, sum(1 for job in jobs if job.success)
+        finally:
+            scheduler.stop()
+
+
+BENCHMARKS = {
+    "discovery": bench_discovery,
+    "connect": bench_connect,
+    "connect_parallel": bench_connect_parallel,
+    "app_list": bench_app_list,
+    "install": bench_install,
+}
+
+
+def run_all(sizes, scenarios, options):
+    results = {}
+    for scenario in scenarios:
+        for count in sizes:
+            key = f"{scenario}/{count}"
+            times = []
+            ok = 0
+            try:
+                for _ in range(options.repeat):
+                    elapsed, ok = BENCHMARKS[scenario](count, options)
+                    times.append(elapsed)
+            except Exception as e:
+                print(f"{key:<24} ERROR {e}")
+                results[key] = {"error": str(e)}
+                continue
+            seconds = statistics.median(times)
+            results[key] = {"seconds": round(seconds, 4), "ok": ok, "devices": count}
+            print(f"{key:<24} {seconds:8.2f}s  {seconds / count * 1000:8.1f} ms/device  ok {ok}/{count}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """返回回退列表 [(指标, 基线秒数, 本次秒数)]，以及成功数下降的指标"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base or "seconds" not in base:
+            continue
+        if "error" in result:
+            regressions.append((key, base["seconds"], None))
+            continue
+        slower = result["seconds"] - base["seconds"]
+        if slower > NOISE_FLOOR and result["seconds"] > base["seconds"] * (1 + tolerance):
+            regressions.append((key, base["seconds"], result["seconds"]))
+        elif result["ok"] < base.get("ok", 0):
+            regressions.append((key, base["seconds"], result["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quest fleet tool benchmarks")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="simulated device counts, comma separated")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="scenarios, comma separated")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per benchmark (median is reported)")
+    parser.add_argument("--packages", type=int, default=30, help="third-party apps per device")
+    parser.add_argument("--latency", type=float, default=20, help="round trip per adb request (ms)")
+    parser.add_argument("--connect-latency", type=float, default=50, help="adb connect time (ms)")
+    parser.add_argument("--bandwidth", type=float, default=5, help="per-device bandwidth MB/s (0 = unlimited)")
+    parser.add_argument("--channel-bandwidth", type=float, default=40,
+                        help="shared Wi-Fi channel bandwidth MB/s (0 = unlimited)")
+    parser.add_argument("--apk-size", type=float, default=2, help="APK size for install (MB)")
+    parser.add_argument("--install-time", type=float, default=0.5, help="pm install time after transfer (s)")
+    parser.add_argument("--interface", default="127.0.0.1", help="interface for the mDNS responders")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    options = parser.parse_args()
+
+    sizes = [int(s) for s in options.sizes.split(',') if s]
+    scenarios = [s for s in options.only.split(',') if s]
+    unknown = [s for s in scenarios if s not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    results = run_all(sizes, scenarios, options)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    result_file = RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(result_file, 'w') as f:
+        json.dump({"options": vars(options), "results": results}, f, indent=2)
+    print(f"Results saved to {result_file}")
+
+    if options.save_baseline:
+        baseline = {}
+        if BASELINE_FILE.exists():
+            with open(BASELINE_FILE, 'r') as f:
+                baseline = json.load(f)
+        baseline.update({k: v for k, v in results.items() if "error" not in v})
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline updated: {BASELINE_FILE}")
+        return 0
+
+    if not BASELINE_FILE.exists():
+        print("No baseline yet, run with --save-baseline to create one.")
+        return 0
+    with open(BASELINE_FILE, 'r') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, options.tolerance)
+    if not regressions:
+        print(f"No regressions (tolerance {options.tolerance:.0%})")
+        return 0
+    print("Regressions:")
+    for key, base, current in regressions:
+        now = "error" if current is None else f"{current:.2f}s"
+        print(f"  {key:<24} baseline {base:.2f}s -> {now}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
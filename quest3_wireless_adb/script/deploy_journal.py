@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+部署任务日志（预写式，追加写 JSONL）
+每次部署一个文件，先写任务头，再记录每个 设备×APK 步骤的状态变化，每条记录都 fsync；
+程序退出或崩溃后可重放日志找出未完成的部署，核对设备上已安装的 versionCode 后只重做未完成的设备
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from shell_pool import ShellError
+
+# 步骤状态
+STEP_STARTED = "started"
+STEP_DONE = "done"
+STEP_FAILED = "failed"
+STEP_SKIPPED = "skipped"
+
+MAX_WORKERS = 32
+
+
+class DeployJob:
+    """一次部署（一个 APK 安装到多台设备）"""
+
+    def __init__(self, path, header):
+        self.path = Path(path)
+        self.id = header["id"]
+        self.apk = header["apk"]
+        self.package = header.get("package")
+        self.version_code = header.get("versionCode")
+        self.devices = list(header["devices"])
+        self.created = header.get("created")
+        self.steps = {}
+        self.closed = None
+        # 崩溃时最后一行可能只写了一半，续写前先补换行
+        self.torn = False
+        self.lock = threading.Lock()
+
+    def _append(self, record):
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if self.torn:
+                    f.write('\n')
+                    self.torn = False
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record(self, device, state, message=""):
+        """记录设备步骤状态"""
+        self._append({"type": "step", "device": device, "state": state,
+                      "message": message, "time": time.time()})
+        self.steps[device] = state
+
+    def close(self, reason="completed"):
+        """标记部署结束，之后不再提示恢复"""
+        self._append({"type": "closed", "reason": reason, "time": time.time()})
+        self.closed = reason
+
+    def pending_devices(self):
+        """未记录为完成的设备"""
+        return [d for d in self.devices if self.steps.get(d) != STEP_DONE]
+
+
+class DeployJournal:
+    """部署日志目录"""
+
+    def __init__(self, jobs_dir):
+        self.jobs_dir = Path(jobs_dir)
+
+    def create(self, apk, package, version_code, devices):
+        """创建新部署并写入任务头"""
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        job_id = time.strftime("%Y%m%d-%H%M%S")
+        path = self.jobs_dir / f"{job_id}.jsonl"
+        index = 1
+        while path.exists():
+            job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{index}"
+            path = self.jobs_dir / f"{job_id}.jsonl"
+            index += 1
+        header = {"type": "job", "id": job_id, "apk": apk, "package": package,
+                  "versionCode": version_code, "devices": list(devices), "created": time.time()}
+        job = DeployJob(path, header)
+        job._append(header)
+        return job
+
+    @staticmethod
+    def load(path):
+        """重放日志文件，末尾写了一半的行会被忽略"""
+        job = None
+        line = '\n'
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("type") == "job":
+                    job = DeployJob(path, record)
+                elif job is None:
+                    continue
+                elif record.get("type") == "step":
+                    job.steps[record["device"]] = record["state"]
+                elif record.get("type") == "closed":
+                    job.closed = record.get("reason", "completed")
+        if job is not None:
+            job.torn = not line.endswith('\n')
+        return job
+
+    def unfinished(self):
+        """返回所有未结束的部署，按创建时间排序"""
+        jobs = []
+        for path in sorted(self.jobs_dir.glob("*.jsonl")):
+            try:
+                job = self.load(path)
+            except OSError:
+                continue
+            if job and not job.closed:
+                jobs.append(job)
+        return jobs
+
+
+def installed_version_code(pool, device, package):
+    """查询设备上已安装的 versionCode，未安装返回 None"""
+    try:
+        _, output = pool.run(device, f"dumpsys package {package} | grep -m1 versionCode=", timeout=15)
+    except ShellError:
+        return None
+    match = re.search(r"versionCode=(\d+)", output)
+    return int(match.group(1)) if match else None
+
+
+def verify_completed(pool, job, devices):
+    """核对设备上的版本，返回仍需安装的设备；已是目标版本的设备记为完成"""
+    if not devices:
+        return []
+    if not job.package or job.version_code is None:
+        return list(devices)
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(devices))) as executor:
+        codes = list(executor.map(lambda d: installed_version_code(pool, d, job.package), devices))
+    remaining = []
+    for device, code in zip(devices, codes):
+        if code == job.version_code:
+            if job.steps.get(device) != STEP_DONE:
+                job.record(device, STEP_DONE, "已核对版本")
+            continue
+        remaining.append(device)
+    return remaining
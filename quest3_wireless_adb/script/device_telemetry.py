@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+设备遥测轮询（电量、温度、存储、Wi-Fi、前台应用）
+每台设备每次只执行一条组合 shell 命令，轮询间隔随数值变化自适应：
+变化快时缩短，稳定时逐渐放长
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from shell_pool import ShellError
+
+MIN_INTERVAL = 2.0
+MAX_INTERVAL = 30.0
+HISTORY_SIZE = 30
+MAX_WORKERS = 16
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+# 各段输出之间的分隔标记
+SECTION = "@@QWA@@"
+
+TELEMETRY_COMMAND = " ; ".join([
+    "dumpsys battery | grep -E 'level:|temperature:|status:|AC powered:|USB powered:'",
+    f"echo {SECTION}",
+    "dumpsys thermalservice | grep -m1 'Thermal Status'",
+    f"echo {SECTION}",
+    "df -k /data | tail -1",
+    f"echo {SECTION}",
+    "dumpsys wifi | grep -m1 'mWifiInfo'",
+    f"echo {SECTION}",
+    "dumpsys activity activities | grep -m1 -E 'topResumedActivity|mResumedActivity'",
+])
+
+# 判定为“明显变化”的阈值
+CHANGE_THRESHOLDS = {
+    "battery": 1,
+    "temperature": 0.5,
+    "storage_free": 100 * 1024 * 1024,
+    "rssi": 5,
+}
+
+RSSI_RE = re.compile(r"RSSI: (-?\d+)")
+LINK_RE = re.compile(r"Link speed: (\d+)")
+ACTIVITY_RE = re.compile(r"\s(\S+)/\S+")
+
+
+def parse_telemetry(output):
+    """解析组合命令的输出"""
+    sections = output.split(SECTION)
+    sections += [""] * (5 - len(sections))
+    battery, thermal, storage, wifi, activity = sections[:5]
+
+    sample = {}
+    for line in battery.split('\n'):
+        key, _, value = line.strip().partition(':')
+        value = value.strip()
+        if key == 'level' and value.isdigit():
+            sample["battery"] = int(value)
+        elif key == 'temperature' and value.lstrip('-').isdigit():
+            sample["temperature"] = int(value) / 10.0
+        elif key == 'status' and value.isdigit():
+            # BatteryManager.BATTERY_STATUS_CHARGING = 2, FULL = 5
+            sample["charging"] = value in ('2', '5')
+
+    match = re.search(r"(\d+)", thermal)
+    if match:
+        sample["thermal_status"] = int(match.group(1))
+
+    parts = storage.split()
+    if len(parts) >= 4 and parts[1].isdigit() and parts[3].isdigit():
+        sample["storage_total"] = int(parts[1]) * 1024
+        sample["storage_free"] = int(parts[3]) * 1024
+
+    match = RSSI_RE.search(wifi)
+    if match:
+        sample["rssi"] = int(match.group(1))
+    match = LINK_RE.search(wifi)
+    if match:
+        sample["link_mbps"] = int(match.group(1))
+
+    match = ACTIVITY_RE.search(activity)
+    if match:
+        sample["foreground"] = match.group(1)
+
+    return sample
+
+
+def sparkline(values):
+    """用方块字符绘制数值历史"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = high - low
+    if span == 0:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2] * len(values)
+    return "".join(SPARK_CHARS[int((v - low) / span * (len(SPARK_CHARS) - 1))] for v in values)
+
+
+def changed(old, new):
+    """判断样本相对上次是否有明显变化"""
+    if not old:
+        return True
+    if old.get("foreground") != new.get("foreground") or old.get("charging") != new.get("charging"):
+        return True
+    for key, threshold in CHANGE_THRESHOLDS.items():
+        if key in old and key in new and abs(new[key] - old[key]) >= threshold:
+            return True
+    return False
+
+
+class DeviceState:
+    """单台设备的轮询状态"""
+
+    def __init__(self):
+        self.interval = MIN_INTERVAL
+        self.next_due = 0.0
+        self.latest = None
+        self.history = {key: deque(maxlen=HISTORY_SIZE) for key in ("battery", "temperature", "rssi")}
+
+
+class TelemetryPoller:
+    """后台轮询所有已连接设备的遥测"""
+
+    def __init__(self, pool, get_devices, on_update=None):
+        self.pool = pool
+        self.get_devices = get_devices
+        self.on_update = on_update
+        self.states = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self.in_flight = set()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def state(self, device):
+        with self.lock:
+            return self.states.get(device)
+
+    def _loop(self):
+        while self.running:
+            now = time.monotonic()
+            devices = set(self.get_devices())
+            with self.lock:
+                for device in list(self.states):
+                    if device not in devices:
+                        del self.states[device]
+                for device in devices:
+                    state = self.states.setdefault(device, DeviceState())
+                    if state.next_due <= now and device not in self.in_flight:
+                        self.in_flight.add(device)
+                        self.executor.submit(self._poll, device)
+            time.sleep(0.5)
+
+    def _poll(self, device):
+        try:
+            try:
+                _, output = self.pool.run(device, TELEMETRY_COMMAND, timeout=10)
+                sample = parse_telemetry(output)
+            except ShellError:
+                sample = None
+
+            with self.lock:
+                state = self.states.get(device)
+                if state is None:
+                    return
+                if sample is None:
+                    state.interval = MAX_INTERVAL
+                else:
+                    # 有变化时加快轮询，稳定时逐步放慢
+                    if changed(state.latest, sample):
+                        state.interval = max(MIN_INTERVAL, state.interval / 2)
+                    else:
+                        state.interval = min(MAX_INTERVAL, state.interval * 1.5)
+                    state.latest = sample
+                    for key, history in state.history.items():
+                        history.append(sample.get(key))
+                state.next_due = time.monotonic() + state.interval
+                history = {key: list(values) for key, values in state.history.items()}
+
+            if sample is not None and self.on_update:
+                self.on_update(device, sample, history)
+        finally:
+            with self.lock:
+                self.in_flight.discard(device)
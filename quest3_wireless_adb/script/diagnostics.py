@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+批量收集诊断包（bugreport、tombstone、ANR）
+多台设备并发收集，共用一个令牌桶限制总带宽；adb exec-out 的输出按块直接写入每台设备的 zip，
+不在内存中缓存整个报告（bugreport 用 bugreportz -s 流式输出）；
+state.json 记录每台设备上次收集的文件大小和修改时间，没有变化的 tombstone/ANR 不再重复传输
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from subprocess import Popen, PIPE, DEVNULL
+
+from adb_errors import run_adb
+from transfer_scheduler import TokenBucket
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_WORKERS = 4
+# 默认总带宽上限（字节/秒），收集诊断不应挤占安装和同一网络上的其他设备；0 表示不限
+DEFAULT_RATE = 10 * 1024 * 1024
+BUGREPORT_TIMEOUT = 600
+FILE_TIMEOUT = 120
+
+# 需要收集的设备目录（user 版本系统上 shell 通常无权读取，此时内容已包含在 bugreport 中）
+REMOTE_DIRS = ("/data/tombstones", "/data/anr")
+STATE_FILENAME = "state.json"
+# 流式 bugreport 过小说明设备不支持 -s 或生成失败
+MIN_BUGREPORT_BYTES = 1024
+
+STAT_RE = re.compile(r"^(\d+) (\d+) (/.+)$")
+
+
+def safe_device_name(device):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", device)
+
+
+def list_command():
+    """列出目录中的文件（大小 修改时间 路径），无权读取的目录输出 DENIED"""
+    parts = []
+    for directory in REMOTE_DIRS:
+        parts.append(f"if [ -r {directory} ]; then for f in {directory}/*; do "
+                     f"[ -f \"$f\" ] && stat -c '%s %Y %n' \"$f\"; done; else echo DENIED {directory}; fi")
+    # 空目录时最后一个 [ -f ] 为假，以 true 结尾使退出码只反映 adb 本身的失败
+    return "; ".join(parts) + "; true"
+
+
+class DeviceDiagnostics:
+    """单台设备的收集结果"""
+
+    def __init__(self, device):
+        self.device = device
+        self.serial = None
+        self.path = None
+        self.collected = []
+        self.unchanged = []
+        self.denied = []
+        self.failed = []
+        # 中途失败、内容不完整的 zip 条目 {条目名: 已写入字节数}
+        self.partial = {}
+        self.bytes = 0
+        self.ok = False
+        self.message = ""
+
+    def to_dict(self):
+        return {
+            "device": self.device,
+            "serial": self.serial,
+            "path": str(self.path) if self.path else None,
+            "collected": self.collected,
+            "unchanged": self.unchanged,
+            "denied": self.denied,
+            "failed": self.failed,
+            "partial": self.partial,
+            "bytes": self.bytes,
+            "ok": self.ok,
+            "message": self.message,
+        }
+
+
+class DiagnosticsCollector:
+    """并发收集多台设备的诊断包"""
+
+    def __init__(self, adb_path, out_dir, rate=DEFAULT_RATE, workers=DEFAULT_WORKERS,
+                 bugreport=True, log=None):
+        self.adb_path = adb_path
+        self.out_dir = Path(out_dir)
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.bugreport = bugreport
+        self.log = log or (lambda message: None)
+        self.cancelled = threading.Event()
+        self.state_lock = threading.Lock()
+        self.state_file = self.out_dir / STATE_FILENAME
+        self.state = self.load_state()
+
+    def load_state(self):
+        """{序列号: {远程路径: [大小, 修改时间, 所在诊断包]}}"""
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        return {}
+
+    def save_state(self):
+        with self.state_lock:
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.state_file.with_suffix(".json.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.state_file)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def collect(self, devices, on_done=None):
+        """收集所有设备，返回 {设备: DeviceDiagnostics}；on_done(结果) 在每台设备完成时调用"""
+        run_dir = self.out_dir / time.strftime('%Y%m%d-%H%M%S')
+        results = {}
+
+        def run(device):
+            result = self.collect_device(device, run_dir)
+            results[device] = result
+            if on_done:
+                on_done(result)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(devices) or 1))) as executor:
+            list(executor.map(run, devices))
+        self.save_state()
+        return results
+
+    def collect_device(self, device, run_dir):
+        result = DeviceDiagnostics(device)
+        serial = run_adb(self.adb_path, ['-s', device, 'shell', 'getprop', 'ro.serialno'], timeout=15)
+        if not serial.ok:
+            result.message = serial.describe()
+            return result
+        result.serial = serial.message or device
+
+        run_dir.mkdir(parents=True, exist_ok=True)
+        result.path = run_dir / f"{safe_device_name(result.serial)}.zip"
+        part = result.path.with_name(result.path.name + ".part")
+        with self.state_lock:
+            previous = dict(self.state.get(result.serial, {}))
+        current = {}
+        try:
+            with zipfile.ZipFile(part, 'w', zipfile.ZIP_DEFLATED) as archive:
+                if self.bugreport:
+                    self.add_bugreport(archive, device, result)
+                files = self.list_files(device, result)
+                if files is None:
+                    # 没能列出目录，保留上次的记录，下次照常只收集新增文件
+                    current = dict(previous)
+                for remote, size, mtime in files or []:
+                    old = previous.get(remote)
+                    if old and old[0] == size and old[1] == mtime:
+                        result.unchanged.append(remote)
+                        current[remote] = old
+                        continue
+                    name = remote.lstrip('/')
+                    if self.stream_entry(archive, name, ['exec-out', 'cat', remote], result, FILE_TIMEOUT):
+                        result.collected.append(remote)
+                        current[remote] = [size, mtime, f"{run_dir.name}/{result.path.name}"]
+                    else:
+                        result.failed.append(remote)
+                # 未变化的文件记录在哪个诊断包中
+                archive.writestr("manifest.json", json.dumps({
+                    "device": device,
+                    "serial": result.serial,
+                    "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+                    "collected": result.collected,
+                    "unchanged": {remote: previous[remote][2] for remote in result.unchanged},
+                    "denied": result.denied,
+                    "failed": result.failed,
+                    # 这些条目在传输中断或超时后被截断，内容不完整
+                    "partial": result.partial,
+                }, ensure_ascii=False, indent=2))
+            os.replace(part, result.path)
+        except OSError as e:
+            result.message = str(e)
+            if part.exists():
+                part.unlink()
+            return result
+
+        with self.state_lock:
+            self.state[result.serial] = current
+        result.ok = not result.failed and not self.cancelled.is_set()
+        result.message = (f"新增 {len(result.collected)}，未变化 {len(result.unchanged)}"
+                          + (f"，失败 {len(result.failed)}" if result.failed else ""))
+        return result
+
+    def list_files(self, device, result):
+        """列出崩溃日志文件 [(路径, 大小, 修改时间)]，无法列出时返回 None"""
+        listing = run_adb(self.adb_path, ['-s', device, 'shell', list_command()], timeout=30)
+        files = []
+        if not listing.ok:
+            # 无法列出目录（超时、设备离线）时不能当作“没有新文件”
+            result.failed.extend(REMOTE_DIRS)
+            self.log(f"{device}: 无法列出崩溃日志目录: {listing.describe()}")
+            return None
+        for line in listing.output.splitlines():
+            line = line.strip()
+            if line.startswith("DENIED "):
+                result.denied.append(line[len("DENIED "):])
+                continue
+            match = STAT_RE.match(line)
+            if match:
+                files.append((match.group(3), int(match.group(1)), int(match.group(2))))
+        return files
+
+    def add_bugreport(self, archive, device, result):
+        """bugreportz -s 把压缩好的报告输出到标准输出，本身已压缩，按 STORED 写入"""
+        self.log(f"{device}: 正在生成 bugreport（约需 1-3 分钟）...")
+        if self.stream_entry(archive, "bugreport.zip", ['exec-out', 'bugreportz', '-s'], result,
+                             BUGREPORT_TIMEOUT, compress=False, min_bytes=MIN_BUGREPORT_BYTES):
+            result.collected.append("bugreport")
+        else:
+            result.failed.append("bugreport")
+
+    def stream_entry(self, archive, name, args, result, timeout, compress=True, min_bytes=0):
+        """把 adb 命令的输出按块写入 zip 条目，每块先从令牌桶取令牌"""
+        if self.cancelled.is_set():
+            return False
+        pipe = Popen([self.adb_path, '-s', result.device, *args], stdout=PIPE, stderr=DEVNULL)
+        # 设备无响应时 read 会一直阻塞，超时后结束进程
+        timer = threading.Timer(timeout, pipe.kill)
+        timer.start()
+        written = 0
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        try:
+            with archive.open(info, 'w', force_zip64=True) as entry:
+                while True:
+                    chunk = pipe.stdout.read1(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.bucket.consume(len(chunk))
+                    entry.write(chunk)
+                    written += len(chunk)
+                    if self.cancelled.is_set():
+                        pipe.kill()
+                        break
+        finally:
+            timer.cancel()
+            pipe.stdout.close()
+            pipe.wait()
+        result.bytes += written
+        ok = pipe.returncode == 0 and written >= min_bytes and not self.cancelled.is_set()
+        if not ok and written:
+            result.partial[name] = written
+        return ok
+
+
+def summarize(results):
+    """汇总文本行"""
+    lines = []
+    for device, result in sorted(results.items()):
+        status = "OK" if result.ok else "失败"
+        extra = f"（无权读取: {', '.join(result.denied)}）" if result.denied else ""
+        lines.append(f"{status} {device}: {result.message}{extra}")
+    return lines
@@ -1,14 +1,32 @@
 #!/usr/bin/env python3
 
 import sys
-import shutil
 import json
+import atexit
 import time
 import threading
 from pathlib import Path
 from subprocess import Popen, PIPE
 from zeroconf import ServiceBrowser, ServiceListener, Zeroconf
 
+import adb_errors
+from adb_server import AdbServerManager, configure_server_port, find_adb
+from apk_manifest import ManifestIndex
+from apk_mirror import CATALOG_FILENAME
+from apk_store import ApkStore
+from deploy_journal import DeployJournal
+from diagnostics import DEFAULT_RATE as DIAGNOSTICS_RATE, DiagnosticsCollector
+from fleet_coordinator import DEFAULT_HOST as COORDINATOR_HOST, DEFAULT_PORT as COORDINATOR_PORT, run_coordinator
+from fleet_daemon import DEFAULT_HOST, DEFAULT_PORT, run_daemon
+from fleet_signal import SIGNALS, send_signal
+from playbook import Playbook, PlaybookError, PlaybookRunner, summarize
+from presence_beacon import DiscoveredDevices, PresenceListener, serial_from_service_name
+from profiling import profiler_from_env
+from release_channels import (GROUPS_FILENAME, ReleaseConfig, ReleaseConfigError, execute_plan,
+                              plan_release, plan_totals, query_inventory)
+from shell_pool import ShellPool
+from transfer_scheduler import TransferScheduler
+
 # 尝试导入平台特定的键盘输入模块
 try:
     import msvcrt  # Windows
@@ -24,6 +42,9 @@ except ImportError:
 # 设备列表文件
 DEVICES_FILE = Path(__file__).parent / "devices.json"
 
+# 需要提前启动 adb 服务并做健康检查的命令（list、signal 等短命令不启动后台线程）
+LONG_RUNNING_COMMANDS = {"scan", "connect", "playbook", "diagnostics", "release"}
+
 
 def check_key_pressed():
     """检测是否有按键（非阻塞）"""
@@ -50,26 +71,29 @@ def clear_input_buffer():
 class MyListener(ServiceListener):
 
     def __init__(self):
-        self.discovered_devices = {}  # {address: {ip, port, name}}
+        # {address: {ip, port, name, serial}}，与存在信标共用，按序列号/IP 去重
+        self.devices = DiscoveredDevices()
         self.adb_path = None
 
+    @property
+    def discovered_devices(self):
+        return self.devices.snapshot()
+
+    def on_beacon(self, info):
+        """配套应用的 UDP 存在信标"""
+        self.devices.add(info["ip"], info["port"], serial=info["serial"], source="beacon",
+                         app_version=info["app_version"] or None, battery=info["battery"])
+
     def get_adb_path(self) -> str:
         """获取 ADB 路径"""
         if self.adb_path:
             return self.adb_path
 
-        adb_path = shutil.which('adb')
+        adb_path = find_adb()
         if not adb_path:
-            # 尝试使用脚本目录下的 platform-tools
-            script_dir = Path(__file__).parent
-            local_adb = script_dir / "platform-tools" / ("adb.exe" if Path.cwd().drive else "adb")
-            if local_adb.exists():
-                adb_path = str(local_adb.absolute())
-                print(f"Using local ADB: {adb_path}")
-            else:
-                print("Error: ADB not found. Please install Android SDK Platform Tools.")
-                print("Or run install_adb.py to install automatically.")
-                return None
+            print("Error: ADB not found. Please install Android SDK Platform Tools.")
+            print("Or run install_adb.py to install automatically.")
+            return None
 
         self.adb_path = adb_path
         return adb_path
@@ -81,19 +105,8 @@ class MyListener(ServiceListener):
 
         ip_bytes = info.addresses[0]
         ip_str = f"{ip_bytes[0]}.{ip_bytes[1]}.{ip_bytes[2]}.{ip_bytes[3]}"
-        device_addr = f"{ip_str}:{info.port}"
-
-        # 跳过已发现的设备
-        if device_addr in self.discovered_devices:
-            return
-
-        self.discovered_devices[device_addr] = {
-            "ip": ip_str,
-            "port": info.port,
-            "name": name,
-            "address": device_addr
-        }
-        # 不在这里打印，避免打断倒计时显示
+        # 同一设备（序列号/IP）只保留最新地址；不在这里打印，避免打断倒计时显示
+        self.devices.add(ip_str, info.port, name, serial_from_service_name(name))
 
     def add_service(self, zc: Zeroconf, type_: str, name: str) -> None:
         self.do_stuff(zc, type_, name)
@@ -135,6 +148,11 @@ def scan_devices(scan_duration=10):
     listener = MyListener()
     ServiceBrowser(zeroconf, "_adb-tls-connect._tcp.local.", listener)
     ServiceBrowser(zeroconf, "_adb_secure_connect._tcp.local.", listener)
+    try:
+        beacons = PresenceListener(callback=listener.on_beacon).start()
+    except OSError as e:
+        print(f"Presence beacon listener unavailable: {e}")
+        beacons = None
 
     last_count = 0
     start_time = time.time()
@@ -172,6 +190,8 @@ def scan_devices(scan_duration=10):
         print("\nScan interrupted.")
     finally:
         zeroconf.close()
+        if beacons:
+            beacons.stop()
 
     # 显示结果
     print("-" * 40)
@@ -205,34 +225,28 @@ def scan_devices(scan_duration=10):
 
 def connect_device(address, adb_path=None):
     """连接单个设备"""
+    result = connect_device_result(address, adb_path)
+    return result is not None and result.ok
+
+
+def connect_device_result(address, adb_path=None):
+    """连接单个设备，返回分类后的结果（暂时性错误自动重试，未授权/拒绝连接等立即失败）"""
     if not adb_path:
-        adb_path = shutil.which('adb')
-        if not adb_path:
-            script_dir = Path(__file__).parent
-            local_adb = script_dir / "platform-tools" / ("adb.exe" if Path.cwd().drive else "adb")
-            if local_adb.exists():
-                adb_path = str(local_adb.absolute())
+        adb_path = find_adb()
 
     if not adb_path:
         print("Error: ADB not found.")
-        return False
+        return None
 
-    try:
-        pipe = Popen([adb_path, 'connect', address], stdout=PIPE, stderr=PIPE)
-        output, error = pipe.communicate()
-        output_str = output.decode("utf-8").strip()
-        error_str = error.decode("utf-8").strip()
-        pipe.wait()
+    def on_retry(result, attempt, delay):
+        print(f"RETRY {attempt}: {address} - {result.kind}: {result.message} (waiting {delay:.1f}s)")
 
-        if pipe.returncode == 0 and ("connected" in output_str or "already connected" in output_str):
-            print(f"OK: {address}")
-            return True
-        else:
-            print(f"FAIL: {address} - {error_str if error_str else output_str}")
-            return False
-    except Exception as e:
-        print(f"Error: {e}")
-        return False
+    result = adb_errors.connect(adb_path, address, on_retry=on_retry)
+    if result.ok:
+        print(f"OK: {address}")
+    else:
+        print(f"FAIL: {address} - {result.kind}: {result.message}")
+    return result
 
 
 def connect_all():
@@ -245,30 +259,25 @@ def connect_all():
     print(f"Connecting to {len(devices)} device(s)...")
     print("-" * 40)
 
-    adb_path = shutil.which('adb')
-    if not adb_path:
-        script_dir = Path(__file__).parent
-        local_adb = script_dir / "platform-tools" / ("adb.exe" if Path.cwd().drive else "adb")
-        if local_adb.exists():
-            adb_path = str(local_adb.absolute())
+    adb_path = find_adb()
 
-    success_count = 0
+    results = {}
     for address in devices:
-        if connect_device(address, adb_path):
-            success_count += 1
+        result = connect_device_result(address, adb_path)
+        if result is None:
+            return
+        results[address] = result
+    success_count = sum(1 for result in results.values() if result.ok)
 
     print("-" * 40)
     print(f"Connected {success_count}/{len(devices)} device(s)")
+    for line in adb_errors.format_summary(results, labels=False):
+        print(f"  {line}")
 
 
 def get_connected_devices():
     """获取当前ADB连接的设备列表"""
-    adb_path = shutil.which('adb')
-    if not adb_path:
-        script_dir = Path(__file__).parent
-        local_adb = script_dir / "platform-tools" / ("adb.exe" if Path.cwd().drive else "adb")
-        if local_adb.exists():
-            adb_path = str(local_adb.absolute())
+    adb_path = find_adb()
 
     if not adb_path:
         return set()
@@ -322,14 +331,272 @@ def get_device_by_index(index):
     return None
 
 
+def signal_devices(signal, target=None):
+    """向已连接设备发送配套应用信号（find/sound/vibrate）"""
+    if signal not in SIGNALS:
+        print(f"Unknown signal: {signal} (choose from {', '.join(SIGNALS)})")
+        return
+
+    adb_path = find_adb()
+    if not adb_path:
+        print("Error: ADB not found.")
+        return
+
+    if target:
+        address = get_device_by_index(int(target)) if target.isdigit() else target
+        if not address:
+            print(f"Invalid device number: {target}")
+            return
+        devices = [address]
+    else:
+        devices = sorted(get_connected_devices())
+    if not devices:
+        print("No connected devices.")
+        return
+
+    print(f"Sending {signal} to {len(devices)} device(s)...")
+    print("-" * 40)
+    start = time.perf_counter()
+    pool = ShellPool(adb_path)
+    try:
+        results = send_signal(pool, devices, signal)
+    finally:
+        pool.close_all()
+    for device, ok, latency, output in results:
+        status = "OK" if ok else f"FAIL - {output}"
+        print(f"  {device:<24} {latency:7.0f} ms  {status}")
+    print("-" * 40)
+    ok_count = sum(1 for r in results if r[1])
+    print(f"Delivered {ok_count}/{len(results)} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def run_playbook(path, targets):
+    """在设备上执行部署剧本"""
+    try:
+        playbook = Playbook.load(path)
+    except (OSError, PlaybookError) as e:
+        print(f"Error: {e}")
+        return
+
+    adb_path = find_adb()
+    if not adb_path:
+        print("Error: ADB not found.")
+        return
+
+    # 目标设备：命令行参数 > 剧本中的 devices > 已保存的设备
+    devices = []
+    for target in targets:
+        address = get_device_by_index(int(target)) if target.isdigit() else target
+        if not address:
+            print(f"Invalid device number: {target}")
+            return
+        devices.append(address)
+    devices = devices or playbook.devices or list(load_devices())
+    if not devices:
+        print("No devices in list. Run scan first.")
+        return
+
+    print(f"Running playbook '{playbook.name}' ({len(playbook.steps)} steps) on {len(devices)} device(s), "
+          f"concurrency {playbook.concurrency}...")
+    print("-" * 40)
+    start = time.perf_counter()
+    store = ApkStore(Path(__file__).parent / "apks" / "store")
+    try:
+        results = PlaybookRunner(adb_path, playbook, store=store).run(devices)
+    finally:
+        store.close()
+    ok_count, failed = summarize(results)
+    print("-" * 40)
+    for device, problems in failed.items():
+        print(f"  {device}")
+        for step_id, message in problems:
+            print(f"    {step_id}: {message}")
+    print(f"Completed {ok_count}/{len(results)} device(s) in {time.perf_counter() - start:.1f} s")
+
+
+def collect_diagnostics(args):
+    """收集已连接设备的诊断包
+    参数: [n|ip:port ...] [--no-bugreport] [--rate MB/s]（默认限速，0 表示不限）"""
+    targets, bugreport, rate = [], True, DIAGNOSTICS_RATE
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--no-bugreport":
+            bugreport = False
+        elif arg == "--rate" and args:
+            rate = int(float(args.pop(0)) * 1024 * 1024)
+        else:
+            address = get_device_by_index(int(arg)) if arg.isdigit() else arg
+            if not address:
+                print(f"Invalid device number: {arg}")
+                return
+            targets.append(address)
+
+    adb_path = find_adb()
+    if not adb_path:
+        print("Error: ADB not found.")
+        return
+    devices = targets or sorted(get_connected_devices())
+    if not devices:
+        print("No connected devices.")
+        return
+
+    out_dir = Path(__file__).parent / "diagnostics"
+    print(f"Collecting diagnostics from {len(devices)} device(s)"
+          f"{' (with bugreport, 1-3 min each)' if bugreport else ''}...")
+    print("-" * 40)
+    start = time.perf_counter()
+
+    def on_done(result):
+        status = "OK" if result.ok else "FAIL"
+        detail = (f"{len(result.collected)} new, {len(result.unchanged)} unchanged"
+                  + (f", {len(result.failed)} failed" if result.failed else "")
+                  + (f", no access to {', '.join(result.denied)}" if result.denied else "")
+                  if result.path else result.message)
+        print(f"  {status:<4} {result.device:<24} {result.bytes / 1024 / 1024:7.1f} MB  {detail}")
+
+    results = DiagnosticsCollector(adb_path, out_dir, rate=rate, bugreport=bugreport).collect(devices, on_done)
+    print("-" * 40)
+    ok_count = sum(1 for r in results.values() if r.ok)
+    print(f"Collected {ok_count}/{len(results)} in {time.perf_counter() - start:.1f} s, saved to {out_dir}")
+
+
+def release(args):
+    """按分组和发布通道计算并执行安装计划
+    参数: [n|ip:port ...] [--plan-only] [--allow-downgrade]"""
+    targets, plan_only, allow_downgrade = [], False, False
+    for arg in args:
+        if arg == "--plan-only":
+            plan_only = True
+        elif arg == "--allow-downgrade":
+            allow_downgrade = True
+        else:
+            address = get_device_by_index(int(arg)) if arg.isdigit() else arg
+            if not address:
+                print(f"Invalid device number: {arg}")
+                return
+            targets.append(address)
+
+    base_dir = Path(__file__).parent
+    apks_dir = base_dir / "apks"
+    try:
+        config = ReleaseConfig.load(base_dir / GROUPS_FILENAME)
+        with open(apks_dir / CATALOG_FILENAME, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except (ReleaseConfigError, OSError, json.JSONDecodeError) as e:
+        print(f"Error: {e}")
+        return
+
+    adb_path = find_adb()
+    if not adb_path:
+        print("Error: ADB not found.")
+        return
+    devices = targets or sorted(get_connected_devices())
+    if not devices:
+        print("No connected devices.")
+        return
+
+    store = ApkStore(apks_dir / "store")
+    manifest_index = ManifestIndex(apks_dir / "manifest_cache.json")
+    pool = ShellPool(adb_path)
+    try:
+        start = time.perf_counter()
+        plans = plan_release(config, catalog, store, manifest_index, query_inventory(pool, devices))
+        manifest_index.save()
+        print(f"Release plan for {len(devices)} device(s) ({time.perf_counter() - start:.1f} s):")
+        print("-" * 40)
+        for plan in plans:
+            where = f"{plan.group or 'ungrouped'}/{plan.channel}"
+            if plan.error:
+                print(f"  {plan.device:<24} [{where}] ERROR - {plan.error}")
+                continue
+            steps = [f"{a.kind} {a.package}" + (f" -> {a.version}" if a.version else "") for a in plan.actions]
+            steps += [f"missing {name} {version}" for name, version in plan.missing]
+            print(f"  {plan.device:<24} [{where}] {', '.join(steps) or 'up to date'}")
+        changed, installs, uninstalls, unchanged = plan_totals(plans)
+        print("-" * 40)
+        print(f"{changed} device(s) to change ({installs} install, {uninstalls} uninstall), {unchanged} up to date")
+        if plan_only or not changed:
+            return
+
+        start = time.perf_counter()
+        scheduler = TransferScheduler(adb_path)
+        results = execute_plan(plans, store, scheduler, pool, DeployJournal(base_dir / "jobs"),
+                               allow_downgrade=allow_downgrade)
+        print("-" * 40)
+        steps = [(device, step) for device, items in results.items() for step in items]
+        for device, (action, ok, message) in steps:
+            if not ok:
+                print(f"  FAIL {device:<24} {action} - {message}")
+        ok_count = sum(1 for _, (_, ok, _) in steps if ok)
+        print(f"Completed {ok_count}/{len(steps)} step(s) in {time.perf_counter() - start:.1f} s")
+    finally:
+        pool.close_all()
+        store.close()
+
+
+def start_daemon(args):
+    """以常驻服务模式运行（本地 HTTP/WebSocket 接口）
+    参数: [port] [--host H] [--coordinator URL] [--subnet CIDR ...]"""
+    port, host, coordinator, subnets = DEFAULT_PORT, DEFAULT_HOST, None, []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--host" and args:
+            host = args.pop(0)
+        elif arg == "--coordinator" and args:
+            coordinator = args.pop(0)
+        elif arg == "--subnet" and args:
+            subnets.append(args.pop(0))
+        elif arg.isdigit():
+            port = int(arg)
+        else:
+            print(f"Unknown daemon option: {arg}")
+            return
+
+    adb_path = find_adb()
+    if not adb_path:
+        print("Error: ADB not found.")
+        return
+    run_daemon(adb_path, port, host, coordinator=coordinator, subnets=subnets or None)
+
+
+def start_coordinator(args):
+    """运行多主机协调器
+    参数: [port] [--host H]"""
+    port, host = COORDINATOR_PORT, COORDINATOR_HOST
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--host" and args:
+            host = args.pop(0)
+        elif arg.isdigit():
+            port = int(arg)
+        else:
+            print(f"Unknown coordinator option: {arg}")
+            return
+    run_coordinator(port, host)
+
+
 def main():
+    # QWA_PROFILE=1 时记录性能数据，退出时保存 trace 文件
+    profiler = profiler_from_env(Path(__file__).parent / "logs")
+    if profiler:
+        profiler.start()
+        atexit.register(lambda: print(f"Trace saved to {profiler.stop()}"))
+
+    # 所有命令都使用本工具专属端口上的 adb 服务
+    configure_server_port()
+    command = sys.argv[1].lower() if len(sys.argv) > 1 else "scan"
+    # 较长的命令在后台提前启动服务并做健康检查，与扫描等操作并行；daemon 自己管理服务
+    if command in LONG_RUNNING_COMMANDS:
+        AdbServerManager(find_adb(), log=print).start()
+
     if len(sys.argv) < 2:
         # 默认行为：扫描并连接
         scan_devices()
         return
 
-    command = sys.argv[1].lower()
-
     if command == "scan":
         scan_devices()
     elif command == "connect":
@@ -351,12 +618,35 @@ def main():
             connect_all()
     elif command == "list":
         list_devices()
+    elif command == "signal":
+        signal = sys.argv[2].lower() if len(sys.argv) > 2 else "find"
+        signal_devices(signal, sys.argv[3] if len(sys.argv) > 3 else None)
+    elif command == "daemon":
+        start_daemon(sys.argv[2:])
+    elif command == "coordinator":
+        start_coordinator(sys.argv[2:])
+    elif command == "playbook" and len(sys.argv) > 2:
+        run_playbook(sys.argv[2], sys.argv[3:])
+    elif command == "diagnostics":
+        collect_diagnostics(sys.argv[2:])
+    elif command == "release":
+        release(sys.argv[2:])
     else:
         print("Usage:")
         print("  python discover-and-connect.py scan     - Scan for devices")
         print("  python discover-and-connect.py connect  - Connect all saved devices")
         print("  python discover-and-connect.py connect <ip:port> - Connect one device")
         print("  python discover-and-connect.py list     - List saved devices")
+        print("  python discover-and-connect.py signal [find|sound|vibrate] [n|ip:port] - Signal connected devices")
+        print("  python discover-and-connect.py playbook <file> [n|ip:port ...] - Run a deployment playbook")
+        print("  python discover-and-connect.py diagnostics [n|ip:port ...] [--no-bugreport] [--rate MB/s]"
+              f" - Collect bugreport/tombstones/ANR (default {DIAGNOSTICS_RATE // 1024 // 1024} MB/s, 0 = unlimited)")
+        print("  python discover-and-connect.py release [n|ip:port ...] [--plan-only] [--allow-downgrade]"
+              f" - Install per-group channel versions ({GROUPS_FILENAME})")
+        print(f"  python discover-and-connect.py daemon [port] - Run the local fleet API (default port {DEFAULT_PORT})")
+        print("      [--host 0.0.0.0] [--coordinator http://host:port] [--subnet 192.168.1.0/24] - Join a coordinator")
+        print(f"  python discover-and-connect.py coordinator [port] [--host 0.0.0.0] - Shard devices across hosts"
+              f" (default {COORDINATOR_HOST}:{COORDINATOR_PORT}, hosts share fleet_token)")
 
 
 if __name__ == "__main__":
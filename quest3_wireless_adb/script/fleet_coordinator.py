@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+多主机设备分片协调器
+各主机以常驻服务模式运行并注册到协调器，定期上报设备表和负载；
+协调器按 已连接主机 > 子网匹配 > 负载 把每台设备分配给一台主机（分配结果保持稳定，主机失联后重新分配），
+连接、安装、执行命令按设备路由到所属主机并汇总结果。
+协调器和各主机共用同一个令牌（fleet_token），注册、心跳和转发的调用都需要令牌；默认只监听本机。
+同一台机器上用多个端口启动多个常驻服务即可测试
+"""
+
+import ipaddress
+import itertools
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from fleet_daemon import (DEFAULT_CAPACITY, TOKEN_FILE, FleetClient, body_devices, body_number, body_str,
+                          check_request, load_or_create_token, read_json_body)
+
+DEFAULT_PORT = 8780
+# 默认只监听本机，多主机时用 --host 0.0.0.0 并把 fleet_token 复制到各主机
+DEFAULT_HOST = "127.0.0.1"
+# 超过该时间没有心跳的主机视为失联
+HOST_TIMEOUT = 20.0
+MAX_WORKERS = 16
+MAX_OPERATIONS = 200
+
+
+class HostInfo:
+    """已注册的主机"""
+
+    def __init__(self, host_id, url, subnets, capacity, token=None):
+        self.id = host_id
+        self.url = url
+        self.client = FleetClient(url, timeout=60, token=token)
+        self.subnets = []
+        for subnet in subnets or []:
+            try:
+                self.subnets.append(ipaddress.ip_network(subnet, strict=False))
+            except ValueError:
+                pass
+        self.capacity = max(1, int(capacity or DEFAULT_CAPACITY))
+        self.devices = {}
+        self.load = {}
+        self.last_heartbeat = time.monotonic()
+
+    @property
+    def alive(self):
+        return time.monotonic() - self.last_heartbeat < HOST_TIMEOUT
+
+    def covers(self, address):
+        """设备 IP 是否在主机负责的子网内"""
+        try:
+            ip = ipaddress.ip_address(address.rsplit(':', 1)[0])
+        except ValueError:
+            return False
+        return any(ip in subnet for subnet in self.subnets)
+
+    def to_dict(self, assigned=0):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "subnets": [str(s) for s in self.subnets],
+            "capacity": self.capacity,
+            "alive": self.alive,
+            "devices": len(self.devices),
+            "connected": sum(1 for d in self.devices.values() if d.get("connected")),
+            "assigned": assigned,
+            "load": self.load,
+        }
+
+
+class Coordinator:
+    """主机注册表、设备分配与命令路由"""
+
+    _op_ids = itertools.count(1)
+
+    def __init__(self, log=print, token=None):
+        self.log = log
+        # 转发到各主机时使用的令牌（与注册时校验的令牌相同）
+        self.token = token
+        self.lock = threading.Lock()
+        self.hosts = {}
+        # 设备 -> 主机 id（保持稳定，减少设备在主机间迁移）
+        self.assignments = {}
+        self.operations = {}
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+    def register(self, host_id, url, subnets, capacity):
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+            raise ValueError(f"无效的主机地址: {url}")
+        with self.lock:
+            host = HostInfo(host_id, url, subnets, capacity, token=self.token)
+            old = self.hosts.get(host_id)
+            if old:
+                host.devices = old.devices
+            self.hosts[host_id] = host
+        self.log(f"主机注册: {host_id} {url}")
+
+    def heartbeat(self, host_id, devices, load):
+        with self.lock:
+            host = self.hosts.get(host_id)
+            if host is None:
+                raise KeyError(f"未注册的主机: {host_id}")
+            host.devices = {d["address"]: d for d in devices}
+            host.load = load or {}
+            host.last_heartbeat = time.monotonic()
+
+    def _assigned_counts(self):
+        counts = {}
+        for host_id in self.assignments.values():
+            counts[host_id] = counts.get(host_id, 0) + 1
+        return counts
+
+    def _owner(self, address, counts):
+        """为设备选择主机（调用方持有锁）"""
+        alive = [h for h in self.hosts.values() if h.alive]
+        if not alive:
+            return None
+        # 1. 已经连接着该设备的主机
+        for host in alive:
+            if host.devices.get(address, {}).get("connected"):
+                return host
+        # 2. 保持之前的分配
+        current = self.hosts.get(self.assignments.get(address))
+        if current and current.alive:
+            return current
+        # 3. 子网匹配的主机中负载最低的，没有匹配时在所有主机中选
+        candidates = [h for h in alive if h.covers(address)] or alive
+        return min(candidates, key=lambda h: (counts.get(h.id, 0) / h.capacity, h.id))
+
+    def shard(self, devices):
+        """把设备分配到主机，返回 ({主机 id: [设备]}, [无可用主机的设备])"""
+        groups = {}
+        unassigned = []
+        with self.lock:
+            counts = self._assigned_counts()
+            for address in devices:
+                host = self._owner(address, counts)
+                if host is None:
+                    unassigned.append(address)
+                    continue
+                previous = self.assignments.get(address)
+                if previous != host.id:
+                    if previous:
+                        counts[previous] = counts.get(previous, 1) - 1
+                    counts[host.id] = counts.get(host.id, 0) + 1
+                    self.assignments[address] = host.id
+                groups.setdefault(host.id, []).append(address)
+        return groups, unassigned
+
+    def all_devices(self):
+        """汇总所有主机上报的设备，附带所属主机"""
+        with self.lock:
+            hosts = list(self.hosts.values())
+        merged = {}
+        for host in hosts:
+            for address, device in host.devices.items():
+                entry = merged.get(address)
+                if entry is None or (device.get("connected") and not entry.get("connected")):
+                    merged[address] = dict(device, host=host.id)
+        with self.lock:
+            for address, entry in merged.items():
+                entry["owner"] = self.assignments.get(address)
+        return sorted(merged.values(), key=lambda d: d["address"])
+
+    def host_list(self):
+        with self.lock:
+            counts = self._assigned_counts()
+            return [h.to_dict(counts.get(h.id, 0)) for h in self.hosts.values()]
+
+    def _target_devices(self, devices, connected_only):
+        if devices:
+            return devices
+        return [d["address"] for d in self.all_devices() if d.get("connected") or not connected_only]
+
+    def _host(self, host_id):
+        with self.lock:
+            return self.hosts[host_id]
+
+    def route(self, kind, devices=None, **params):
+        """把连接/安装分发到各主机，返回汇总操作。
+        安装只转发仓库文件名，由各主机从自己的 APK 仓库解析（调用方的本机路径在其他主机上不存在），
+        没有该 APK 的主机拒绝安装，其设备在结果中记为失败"""
+        devices = self._target_devices(devices, connected_only=(kind != "connect"))
+        if kind == "install":
+            params["apk"] = Path(params["apk"]).name
+        groups, unassigned = self.shard(devices)
+
+        def dispatch(host_id, subset):
+            client = self._host(host_id).client
+            try:
+                if kind == "connect":
+                    op = client.connect(subset)
+                else:
+                    op = client.install(params["apk"], subset)
+                return host_id, op["id"], None
+            except (OSError, RuntimeError, ValueError) as e:
+                if kind == "install":
+                    return host_id, None, f"{e}（请先在主机 {host_id} 上同步该 APK）"
+                return host_id, None, str(e)
+
+        parts = list(self.executor.map(lambda item: dispatch(*item), groups.items()))
+        op_id = next(self._op_ids)
+        with self.lock:
+            self.operations[op_id] = {"kind": kind, "groups": groups, "parts": parts, "unassigned": unassigned}
+            while len(self.operations) > MAX_OPERATIONS:
+                del self.operations[next(iter(self.operations))]
+        return self.operation(op_id)
+
+    def operation(self, op_id):
+        """查询各主机上的子操作并汇总"""
+        with self.lock:
+            record = self.operations.get(op_id)
+        if record is None:
+            return None
+
+        def fetch(part):
+            host_id, host_op, error = part
+            if error is None:
+                try:
+                    return host_id, self._host(host_id).client.operation(host_op), None
+                except (OSError, RuntimeError, ValueError, KeyError) as e:
+                    error = str(e)
+            return host_id, None, error
+
+        results = {}
+        done = True
+        hosts = {}
+        for host_id, op, error in self.executor.map(fetch, record["parts"]):
+            hosts[host_id] = op["status"] if op else f"error: {error}"
+            if op is None:
+                for device in record["groups"][host_id]:
+                    results[device] = {"ok": False, "message": error, "host": host_id}
+                continue
+            if op["status"] != "done":
+                done = False
+            for device, result in op["results"].items():
+                results[device] = dict(result, host=host_id)
+        for device in record["unassigned"]:
+            results[device] = {"ok": False, "message": "没有可用的主机", "host": None}
+        return {"id": op_id, "kind": record["kind"], "status": "done" if done else "running",
+                "hosts": hosts, "results": results}
+
+    def exec(self, command, devices=None, timeout=30):
+        """在各主机上并发执行命令并合并结果"""
+        groups, unassigned = self.shard(self._target_devices(devices, connected_only=True))
+
+        def run(item):
+            host_id, subset = item
+            try:
+                rows = self._host(host_id).client.exec(command, subset, timeout)
+            except (OSError, RuntimeError, ValueError) as e:
+                rows = [{"device": d, "code": -1, "output": str(e)} for d in subset]
+            return [dict(row, host=host_id) for row in rows]
+
+        results = [row for rows in self.executor.map(run, groups.items()) for row in rows]
+        results += [{"device": d, "code": -1, "output": "没有可用的主机", "host": None} for d in unassigned]
+        return results
+
+
+class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    """协调器 HTTP 接口（与常驻服务接口一致，客户端可直接使用 FleetClient）"""
+
+    server_version = "QuestFleetCoordinator/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        return
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        error = check_request(self, self.server.token)
+        if error:
+            self.close_connection = True
+            self.send_json({"error": error[1]}, error[0])
+            return False
+        return True
+
+    def do_GET(self):
+        coordinator = self.server.coordinator
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        if not self.authorized():
+            return
+        if path == "/api/health":
+            self.send_json({"ok": True, "hosts": len(coordinator.host_list())})
+        elif path == "/api/hosts":
+            self.send_json(coordinator.host_list())
+        elif path == "/api/devices":
+            self.send_json(coordinator.all_devices())
+        elif path.startswith("/api/ops/") and path[len("/api/ops/"):].isdigit():
+            op = coordinator.operation(int(path[len("/api/ops/"):]))
+            self.send_json(op if op else {"error": "not found"}, 200 if op else 404)
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        if not self.authorized():
+            return
+        try:
+            body = read_json_body(self)
+            if path == "/api/hosts/register":
+                subnets = body.get("subnets")
+                if subnets is not None and not (isinstance(subnets, list)
+                                                and all(isinstance(s, str) for s in subnets)):
+                    raise ValueError("subnets 必须是字符串列表或 null")
+                coordinator.register(body_str(body, "id"), body_str(body, "url"), subnets,
+                                     body_number(body, "capacity"))
+                self.send_json({"ok": True})
+            elif path == "/api/hosts/heartbeat":
+                host_devices = body.get("devices") or []
+                if not (isinstance(host_devices, list)
+                        and all(isinstance(d, dict) and isinstance(d.get("address"), str) for d in host_devices)):
+                    raise ValueError("devices 必须是含 address 的对象列表")
+                load = body.get("load")
+                if load is not None and not isinstance(load, dict):
+                    raise ValueError("load 必须是对象")
+                coordinator.heartbeat(body_str(body, "id"), host_devices, load)
+                self.send_json({"ok": True})
+            elif path == "/api/connect":
+                self.send_json(coordinator.route("connect", body_devices(body)), 202)
+            elif path == "/api/install":
+                self.send_json(coordinator.route("install", body_devices(body), apk=body_str(body, "apk")), 202)
+            elif path == "/api/exec":
+                self.send_json(coordinator.exec(body_str(body, "command"), body_devices(body),
+                                                body_number(body, "timeout", 30)))
+            else:
+                self.send_json({"error": "not found"}, 404)
+        except KeyError as e:
+            self.send_json({"error": str(e)}, 404 if path == "/api/hosts/heartbeat" else 400)
+        except ValueError as e:
+            self.send_json({"error": str(e)}, 400)
+
+
+class CoordinatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, coordinator, port=DEFAULT_PORT, host=DEFAULT_HOST, token=None):
+        self.coordinator = coordinator
+        self.token = token or coordinator.token or load_or_create_token()
+        super().__init__((host, port), CoordinatorRequestHandler)
+
+
+def run_coordinator(port=DEFAULT_PORT, host=DEFAULT_HOST):
+    """前台运行协调器，Ctrl+C 退出"""
+    token = load_or_create_token()
+    server = CoordinatorServer(Coordinator(token=token), port=port, host=host, token=token)
+    print(f"Fleet coordinator listening on http://{host}:{port}")
+    print(f"Shared token: {TOKEN_FILE} (copy it to every daemon host)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    run_coordinator(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT)
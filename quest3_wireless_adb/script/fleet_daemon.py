@@ -0,0 +1,814 @@
+#!/usr/bin/env python3
+"""
+设备集群常驻服务（本地 HTTP + WebSocket 接口）
+常驻进程持续运行 Zeroconf 发现和 adb 连接状态刷新，维护一份设备表，
+所有客户端共享同一个 shell 会话池和传输调度器；
+连接、安装、执行命令通过 HTTP 提交，进度通过 /events WebSocket 实时推送。
+所有请求都需要 Bearer 令牌（首次启动时生成到 fleet_token），并校验 Host/Origin，防止网页跨站调用
+"""
+
+import base64
+import hashlib
+import hmac
+import ipaddress
+import itertools
+import json
+import os
+import queue
+import secrets
+import socket
+import struct
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from subprocess import Popen, PIPE
+
+from zeroconf import ServiceBrowser, ServiceListener, Zeroconf
+
+import adb_errors
+from adb_server import AdbServerManager, find_adb
+from apk_mirror import get_lan_ip
+from apk_store import ApkStore
+from diagnostics import DEFAULT_RATE as DIAGNOSTICS_RATE, DiagnosticsCollector
+from shell_pool import ShellError, ShellPool
+from transfer_scheduler import TransferScheduler
+
+DEFAULT_PORT = 8770
+# 只监听本机，避免局域网内其他机器控制设备
+DEFAULT_HOST = "127.0.0.1"
+
+SERVICE_TYPES = ("_adb-tls-connect._tcp.local.", "_adb_secure_connect._tcp.local.")
+# adb devices 刷新间隔
+REFRESH_INTERVAL = 5.0
+# 保留的已完成操作数
+MAX_OPERATIONS = 200
+MAX_WORKERS = 32
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+WS_PING_INTERVAL = 15.0
+# 单个客户端积压的事件数上限，超过后断开该客户端
+EVENT_QUEUE_SIZE = 1000
+
+# 向协调器上报的间隔
+HEARTBEAT_INTERVAL = 5.0
+# 单台主机建议承载的无线设备数
+DEFAULT_CAPACITY = 40
+
+# 接口令牌（常驻服务、协调器和客户端共用，多主机时把该文件复制到各主机或设置环境变量）
+TOKEN_FILE = Path(__file__).parent / "fleet_token"
+TOKEN_ENV = "QWA_FLEET_TOKEN"
+
+
+def read_token(path=TOKEN_FILE):
+    """读取接口令牌：环境变量优先，其次令牌文件，都没有时返回 None"""
+    token = os.environ.get(TOKEN_ENV, "").strip()
+    if token:
+        return token
+    try:
+        return Path(path).read_text(encoding='utf-8').strip() or None
+    except OSError:
+        return None
+
+
+def load_or_create_token(path=TOKEN_FILE):
+    """读取接口令牌，没有时生成并写入令牌文件（仅当前用户可读写）"""
+    token = read_token(path)
+    if token:
+        return token
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    return token
+
+
+def host_allowed(value):
+    """Host 中的主机名只能是 IP 或 localhost（域名可能是 DNS 重绑定到本机的网页）"""
+    try:
+        hostname = urllib.parse.urlsplit(f"//{value}").hostname
+    except ValueError:
+        return False
+    if hostname == "localhost":
+        return True
+    try:
+        ipaddress.ip_address(hostname or "")
+        return True
+    except ValueError:
+        return False
+
+
+def check_request(handler, token, allow_query_token=False):
+    """校验 Host、Origin 和令牌，通过时返回 None，否则返回 (状态码, 错误)。
+    浏览器发出的跨站请求带有 Origin，必须与 Host 一致；WebSocket 无法设置请求头，允许 ?token="""
+    host = handler.headers.get('Host') or ''
+    if not host_allowed(host):
+        return 403, "Host 不允许"
+    origin = handler.headers.get('Origin')
+    if origin is not None and urllib.parse.urlsplit(origin).netloc != host:
+        return 403, "Origin 不允许"
+    supplied = ''
+    authorization = handler.headers.get('Authorization') or ''
+    if authorization.startswith('Bearer '):
+        supplied = authorization[len('Bearer '):].strip()
+    elif allow_query_token:
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(handler.path).query)
+        supplied = query.get('token', [''])[0]
+    if not token or not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+        return 401, "未授权（需要 fleet_token 中的令牌）"
+    return None
+
+
+def read_json_body(handler):
+    """读取请求体：只接受 application/json（表单和 text/plain 是浏览器无需预检即可跨站发送的类型），且必须是对象"""
+    content_type = (handler.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type != 'application/json':
+        raise ValueError("Content-Type 必须是 application/json")
+    length = int(handler.headers.get('Content-Length') or 0)
+    body = json.loads(handler.rfile.read(length).decode('utf-8')) if length else {}
+    if not isinstance(body, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    return body
+
+
+def body_devices(body):
+    """请求体中的 devices：null（全部设备）或字符串列表，否则抛出 ValueError"""
+    devices = body.get("devices")
+    if devices is not None and not (isinstance(devices, list) and all(isinstance(d, str) for d in devices)):
+        raise ValueError("devices 必须是字符串列表或 null")
+    return devices
+
+
+def body_str(body, key):
+    """必填的字符串字段，缺少时抛出 KeyError，类型不对时抛出 ValueError"""
+    value = body[key]
+    if not isinstance(value, str):
+        raise ValueError(f"{key} 必须是字符串")
+    return value
+
+
+def body_number(body, key, default=None):
+    """可选的数字字段，缺少或为 null 时返回 default"""
+    value = body.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{key} 必须是数字")
+    return value
+
+
+def body_bool(body, key, default):
+    value = body.get(key)
+    if value is None:
+        return default
+    if not isinstance(value, bool):
+        raise ValueError(f"{key} 必须是 true 或 false")
+    return value
+
+
+class EventBus:
+    """把事件广播给所有 WebSocket 订阅者"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def publish(self, event):
+        event = dict(event, time=time.time())
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # 读取太慢的客户端直接放弃，避免拖慢整个服务
+                self.unsubscribe(q)
+                try:
+                    q.get_nowait()
+                    q.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+class Operation:
+    """一次批量操作（连接/安装）"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, devices, detail=""):
+        self.id = next(self._ids)
+        self.kind = kind
+        self.devices = list(devices)
+        self.detail = detail
+        self.results = {}
+        self.created = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "detail": self.detail,
+            "devices": self.devices,
+            "results": self.results,
+            "status": "done" if self.done.is_set() else "running",
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class DiscoveryListener(ServiceListener):
+    """Zeroconf 发现回调"""
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def add_service(self, zc, type_, name):
+        info = zc.get_service_info(type_, name)
+        if info and info.addresses:
+            ip_bytes = info.addresses[0]
+            ip_str = f"{ip_bytes[0]}.{ip_bytes[1]}.{ip_bytes[2]}.{ip_bytes[3]}"
+            self.daemon.on_discovered(ip_str, info.port, name)
+
+    def update_service(self, zc, type_, name):
+        self.add_service(zc, type_, name)
+
+    def remove_service(self, zc, type_, name):
+        return
+
+
+class FleetDaemon:
+    """常驻的设备表、连接池与操作执行"""
+
+    def __init__(self, adb_path, devices_file, apks_dir=None, log=print):
+        self.adb_path = adb_path
+        self.devices_file = Path(devices_file)
+        self.store = ApkStore(Path(apks_dir) / "store") if apks_dir else None
+        self.log = log
+        self.events = EventBus()
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.operations = OrderedDict()
+        self.pool = ShellPool(adb_path)
+        self.scheduler = TransferScheduler(adb_path, log=log)
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self.zeroconf = None
+        self.running = False
+
+        for address, info in self._load_saved().items():
+            self.devices[address] = self._entry(address, info.get("name", ""), saved=True)
+
+    def _load_saved(self):
+        if self.devices_file.exists():
+            try:
+                with open(self.devices_file, 'r') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        return {}
+
+    def _save(self):
+        """把已保存和新发现的设备写回 devices.json（与扫描命令格式一致），持有锁避免并发写入"""
+        with self.lock:
+            saved = {address: {"ip": address.rsplit(':', 1)[0], "port": int(address.rsplit(':', 1)[1]),
+                               "name": entry["name"], "address": address}
+                     for address, entry in self.devices.items() if entry["saved"]}
+            tmp_file = self.devices_file.with_suffix(".json.tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(saved, f, indent=2)
+            os.replace(tmp_file, self.devices_file)
+
+    @staticmethod
+    def _entry(address, name="", saved=False):
+        return {"address": address, "name": name, "saved": saved, "connected": False,
+                "discovered": None, "last_seen": None}
+
+    def start(self):
+        self.running = True
+        self.zeroconf = Zeroconf()
+        listener = DiscoveryListener(self)
+        for service_type in SERVICE_TYPES:
+            ServiceBrowser(self.zeroconf, service_type, listener)
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.zeroconf:
+            self.zeroconf.close()
+            self.zeroconf = None
+        self.scheduler.stop()
+        self.pool.close_all()
+        if self.store:
+            self.store.close()
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(entry) for entry in self.devices.values()]
+
+    def connected(self):
+        with self.lock:
+            return sorted(a for a, entry in self.devices.items() if entry["connected"])
+
+    def on_discovered(self, ip, port, name):
+        address = f"{ip}:{port}"
+        with self.lock:
+            entry = self.devices.get(address)
+            is_new = entry is None or not entry["saved"]
+            if entry is None:
+                entry = self.devices[address] = self._entry(address, name)
+            entry.update(name=name, saved=True, discovered=time.time())
+            event = {"type": "device", "device": dict(entry)}
+        if is_new:
+            self._save()
+            self.log(f"发现设备 {address}")
+        self.events.publish(event)
+
+    def _refresh_loop(self):
+        while self.running:
+            try:
+                self.refresh()
+            except OSError as e:
+                self.log(f"刷新连接状态失败: {e}")
+            time.sleep(REFRESH_INTERVAL)
+
+    def refresh(self):
+        """读取 adb devices，状态变化时推送事件"""
+        pipe = Popen([self.adb_path, 'devices'], stdout=PIPE, stderr=PIPE)
+        output, _ = pipe.communicate()
+        connected = set()
+        for line in output.decode('utf-8', errors='ignore').strip().split('\n')[1:]:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1] == 'device':
+                connected.add(parts[0])
+
+        changed = []
+        now = time.time()
+        with self.lock:
+            for address in connected - set(self.devices):
+                self.devices[address] = self._entry(address)
+            for address, entry in self.devices.items():
+                is_connected = address in connected
+                if is_connected:
+                    entry["last_seen"] = now
+                if entry["connected"] != is_connected:
+                    entry["connected"] = is_connected
+                    changed.append(dict(entry))
+        for entry in changed:
+            self.events.publish({"type": "device", "device": entry})
+
+    def _new_operation(self, kind, devices, detail=""):
+        op = Operation(kind, devices, detail)
+        with self.lock:
+            self.operations[op.id] = op
+            while len(self.operations) > MAX_OPERATIONS:
+                self.operations.popitem(last=False)
+        self.events.publish({"type": "op_started", "op": op.to_dict()})
+        return op
+
+    def _step_done(self, op, device, ok, message, error=None):
+        with self.lock:
+            op.results[device] = {"ok": ok, "message": message, "error": error}
+            finished = len(op.results) == len(op.devices)
+            if finished:
+                op.finished = time.time()
+        self.events.publish({"type": "op_progress", "id": op.id, "device": device, "ok": ok,
+                             "message": message, "error": error})
+        if finished:
+            op.done.set()
+            self.events.publish({"type": "op_done", "op": op.to_dict()})
+
+    def operation(self, op_id):
+        with self.lock:
+            op = self.operations.get(op_id)
+            return op.to_dict() if op else None
+
+    def list_operations(self):
+        with self.lock:
+            return [op.to_dict() for op in self.operations.values()]
+
+    def connect(self, devices=None):
+        """连接设备（默认所有已保存的设备）"""
+        if not devices:
+            with self.lock:
+                devices = [a for a, entry in self.devices.items() if entry["saved"]]
+        op = self._new_operation("connect", devices)
+        if not devices:
+            op.done.set()
+            return op
+
+        def connect_one(device):
+            result = adb_errors.connect(self.adb_path, device, timeout=30)
+            self._step_done(op, device, result.ok, result.message, None if result.ok else result.code or result.kind)
+
+        def refresh_after():
+            # 连接完成后尽快刷新状态
+            op.done.wait(60)
+            self.refresh()
+
+        for device in devices:
+            self.executor.submit(connect_one, device)
+        self.executor.submit(refresh_after)
+        return op
+
+    def resolve_apk(self, apk):
+        """APK 可以是本机路径或仓库中的文件名"""
+        path = Path(apk)
+        if path.is_absolute() and path.is_file():
+            return path
+        if self.store:
+            return self.store.path(path.name)
+        return None
+
+    def install(self, apk, devices=None):
+        """通过传输调度器安装 APK（默认所有已连接设备）"""
+        apk_path = self.resolve_apk(apk)
+        if not apk_path or not apk_path.exists():
+            raise ValueError(f"APK 不存在: {apk}")
+        devices = devices or self.connected()
+        op = self._new_operation("install", devices, apk_path.name)
+        if not devices:
+            op.done.set()
+            return op
+
+        def on_done(job):
+            error = None if job.success or job.error is None else job.error.code or job.error.kind
+            self._step_done(op, job.device, bool(job.success), job.message, error)
+
+        for device in devices:
+            self.scheduler.submit(device, apk_path, kind="install", on_done=on_done)
+        return op
+
+    def diagnostics(self, devices=None, bugreport=True, rate=None):
+        """收集诊断包（默认所有已连接设备），保存到 devices.json 同目录的 diagnostics；
+        rate 为字节/秒，None 使用默认上限，0 表示不限"""
+        if rate is None:
+            rate = DIAGNOSTICS_RATE
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate < 0:
+            raise ValueError(f"rate 必须是非负数（字节/秒）: {rate!r}")
+        devices = devices or self.connected()
+        op = self._new_operation("diagnostics", devices, "bugreport" if bugreport else "")
+        if not devices:
+            op.done.set()
+            return op
+
+        collector = DiagnosticsCollector(self.adb_path, self.devices_file.parent / "diagnostics",
+                                         rate=rate, bugreport=bugreport, log=self.log)
+        future = self.executor.submit(collector.collect, devices, on_done=lambda r: self._step_done(
+            op, r.device, r.ok, str(r.path) if r.ok else r.message))
+
+        def finished(future):
+            # 收集过程异常时把尚未完成的设备记为失败，否则操作永远不会结束
+            error = future.exception()
+            if error is None:
+                return
+            self.log(f"收集诊断出错: {error}")
+            with self.lock:
+                pending = [d for d in op.devices if d not in op.results]
+            for device in pending:
+                self._step_done(op, device, False, f"收集出错: {error}")
+
+        future.add_done_callback(finished)
+        return op
+
+    def exec(self, command, devices=None, timeout=30):
+        """在设备上并发执行 shell 命令，直接返回结果"""
+        devices = devices or self.connected()
+
+        def run(device):
+            start = time.perf_counter()
+            try:
+                code, output = self.pool.run(device, command, timeout=timeout)
+            except ShellError as e:
+                code, output = -1, str(e)
+            return {"device": device, "code": code, "output": output,
+                    "ms": round((time.perf_counter() - start) * 1000)}
+
+        return list(self.executor.map(run, devices))
+
+
+def websocket_frame(payload, opcode=0x1):
+    """生成服务端 WebSocket 帧（不加掩码）"""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack('>H', length)
+    else:
+        header += bytes([127]) + struct.pack('>Q', length)
+    return header + payload
+
+
+def read_websocket_frame(rfile):
+    """读取客户端帧，返回 (opcode, payload)，连接关闭时返回 (None, b'')"""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, b''
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', rfile.read(8))[0]
+    mask = rfile.read(4) if masked else b''
+    payload = rfile.read(length)
+    if masked:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """HTTP / WebSocket 请求处理"""
+
+    server_version = "QuestFleetDaemon/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        return
+
+    @property
+    def fleet(self):
+        return self.server.fleet
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self, allow_query_token=False):
+        error = check_request(self, self.server.token, allow_query_token)
+        if error:
+            # 未读取的请求体会污染同一连接上的下一个请求
+            self.close_connection = True
+            self.send_json({"error": error[1]}, error[0])
+            return False
+        return True
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        if not self.authorized(allow_query_token=(path == "/events")):
+            return
+        if path == "/events":
+            self.handle_websocket()
+        elif path == "/api/devices":
+            self.send_json(self.fleet.snapshot())
+        elif path == "/api/ops":
+            self.send_json(self.fleet.list_operations())
+        elif path.startswith("/api/ops/") and path[len("/api/ops/"):].isdigit():
+            op = self.fleet.operation(int(path[len("/api/ops/"):]))
+            self.send_json(op if op else {"error": "not found"}, 200 if op else 404)
+        elif path == "/api/health":
+            self.send_json({"ok": True, "devices": len(self.fleet.snapshot())})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        if not self.authorized():
+            return
+        try:
+            body = read_json_body(self)
+            devices = body_devices(body)
+            if path == "/api/connect":
+                self.send_json(self.fleet.connect(devices).to_dict(), 202)
+            elif path == "/api/install":
+                self.send_json(self.fleet.install(body_str(body, "apk"), devices).to_dict(), 202)
+            elif path == "/api/exec":
+                self.send_json(self.fleet.exec(body_str(body, "command"), devices,
+                                               body_number(body, "timeout", 30)))
+            elif path == "/api/diagnostics":
+                self.send_json(self.fleet.diagnostics(devices, body_bool(body, "bugreport", True),
+                                                      body_number(body, "rate")).to_dict(), 202)
+            else:
+                self.send_json({"error": "not found"}, 404)
+        except (KeyError, ValueError) as e:
+            self.send_json({"error": str(e)}, 400)
+
+    def handle_websocket(self):
+        key = self.headers.get('Sec-WebSocket-Key')
+        if not key or 'websocket' not in (self.headers.get('Upgrade') or '').lower():
+            self.send_json({"error": "websocket upgrade required"}, 400)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.close_connection = True
+
+        events = self.fleet.events.subscribe()
+        closed = threading.Event()
+
+        def reader():
+            # 处理客户端的 ping/close，其余消息忽略
+            try:
+                while not closed.is_set():
+                    opcode, payload = read_websocket_frame(self.rfile)
+                    if opcode is None or opcode == 0x8:
+                        break
+                    if opcode == 0x9:
+                        self.send_frame(payload, 0xA)
+            except (OSError, struct.error):
+                pass
+            closed.set()
+            events.put(None)
+
+        self.write_lock = threading.Lock()
+        threading.Thread(target=reader, daemon=True).start()
+        try:
+            self.send_frame(json.dumps({"type": "snapshot", "devices": self.fleet.snapshot()}).encode('utf-8'))
+            while not closed.is_set():
+                try:
+                    event = events.get(timeout=WS_PING_INTERVAL)
+                except queue.Empty:
+                    self.send_frame(b'', 0x9)
+                    continue
+                if event is None:
+                    break
+                self.send_frame(json.dumps(event, ensure_ascii=False).encode('utf-8'))
+            self.send_frame(b'', 0x8)
+        except OSError:
+            pass
+        finally:
+            closed.set()
+            self.fleet.events.unsubscribe(events)
+
+    def send_frame(self, payload, opcode=0x1):
+        with self.write_lock:
+            self.wfile.write(websocket_frame(payload, opcode))
+            self.wfile.flush()
+
+
+class FleetDaemonServer(ThreadingHTTPServer):
+    """常驻服务的 HTTP 服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, fleet, port=DEFAULT_PORT, host=DEFAULT_HOST, token=None):
+        self.fleet = fleet
+        self.token = token or load_or_create_token()
+        super().__init__((host, port), DaemonRequestHandler)
+
+
+class FleetClient:
+    """常驻服务的 HTTP 客户端，供其他脚本调用"""
+
+    def __init__(self, base_url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=30, token=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        # 默认使用本机 fleet_token（或环境变量）中的令牌
+        self.token = token or read_token()
+
+    def request(self, method, path, data=None):
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        req = urllib.request.Request(f"{self.base_url}{path}", data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read().decode('utf-8') or '{}').get("error", str(e)))
+
+    def is_running(self):
+        try:
+            return self.request('GET', "/api/health").get("ok", False)
+        except (OSError, RuntimeError, ValueError):
+            return False
+
+    def devices(self):
+        return self.request('GET', "/api/devices")
+
+    def connect(self, devices=None):
+        return self.request('POST', "/api/connect", {"devices": devices})
+
+    def install(self, apk, devices=None):
+        return self.request('POST', "/api/install", {"apk": str(apk), "devices": devices})
+
+    def exec(self, command, devices=None, timeout=30):
+        return self.request('POST', "/api/exec", {"command": command, "devices": devices, "timeout": timeout})
+
+    def diagnostics(self, devices=None, bugreport=True, rate=None):
+        """rate 为字节/秒，None 使用服务端默认上限，0 表示不限"""
+        return self.request('POST', "/api/diagnostics", {"devices": devices, "bugreport": bugreport, "rate": rate})
+
+    def operation(self, op_id):
+        return self.request('GET', f"/api/ops/{op_id}")
+
+    def wait(self, op_id, poll=1.0, timeout=None):
+        """等待操作完成并返回结果"""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            op = self.operation(op_id)
+            if op["status"] == "done" or (deadline and time.monotonic() > deadline):
+                return op
+            time.sleep(poll)
+
+
+class CoordinatorAgent:
+    """把本机常驻服务注册到协调器，并定期上报设备表和负载"""
+
+    def __init__(self, fleet, coordinator_url, host_id, public_url, subnets=None, capacity=DEFAULT_CAPACITY,
+                 token=None):
+        self.fleet = fleet
+        # 协调器与各主机共用同一个令牌
+        self.client = FleetClient(coordinator_url, timeout=10, token=token)
+        self.host_id = host_id
+        self.public_url = public_url
+        self.subnets = subnets or [str(ipaddress.ip_network(f"{get_lan_ip()}/24", strict=False))]
+        self.capacity = capacity
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _loop(self):
+        registered = False
+        while self.running:
+            try:
+                if not registered:
+                    self.client.request('POST', "/api/hosts/register", {
+                        "id": self.host_id, "url": self.public_url,
+                        "subnets": self.subnets, "capacity": self.capacity})
+                    registered = True
+                    self.fleet.log(f"已注册到协调器 {self.client.base_url}")
+                self.client.request('POST', "/api/hosts/heartbeat", {
+                    "id": self.host_id,
+                    "devices": self.fleet.snapshot(),
+                    "load": {"transfers": self.fleet.scheduler.active_count(),
+                             "connected": len(self.fleet.connected())}})
+            except (OSError, RuntimeError, ValueError) as e:
+                # 协调器重启后会丢失注册信息，下次重新注册
+                if registered:
+                    self.fleet.log(f"协调器不可用: {e}")
+                registered = False
+            time.sleep(HEARTBEAT_INTERVAL)
+
+
+def run_daemon(adb_path, port=DEFAULT_PORT, host=DEFAULT_HOST, coordinator=None, subnets=None):
+    """前台运行常驻服务，Ctrl+C 退出；指定 coordinator 时注册到协调器"""
+    script_dir = Path(__file__).parent
+    fleet = FleetDaemon(adb_path, script_dir / "devices.json", apks_dir=script_dir / "apks")
+    AdbServerManager(adb_path, log=fleet.log, on_restart=fleet.connect).start()
+    token = load_or_create_token()
+    server = FleetDaemonServer(fleet, port=port, host=host, token=token)
+    fleet.start()
+    print(f"Fleet daemon listening on http://{host}:{port} (events: ws://{host}:{port}/events)")
+    print(f"API token: {TOKEN_FILE} (send as 'Authorization: Bearer <token>')")
+
+    agent = None
+    if coordinator:
+        public_host = get_lan_ip() if host == "0.0.0.0" else host
+        agent = CoordinatorAgent(fleet, coordinator, f"{socket.gethostname()}:{port}",
+                                 f"http://{public_host}:{port}", subnets=subnets, token=token)
+        agent.start()
+        print(f"Reporting to coordinator {coordinator} as {agent.host_id} (subnets: {', '.join(agent.subnets)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if agent:
+            agent.stop()
+        server.server_close()
+        fleet.stop()
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    adb_path = find_adb()
+    if not adb_path:
+        print("Error: ADB not found.")
+        return
+    run_daemon(adb_path, port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+向头显上的配套应用并发发送广播命令（查找设备、播放声音、振动手柄）
+应用通过 ADBCommandBroadcastReceiver 接收，每台设备单独记录往返耗时
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from shell_pool import ShellError
+
+APP_PACKAGE = "com.ChuJiao.quest3_wireless_adb"
+
+# 信号名 -> 广播 action（与 ADBCommandBroadcastReceiver 保持一致）
+SIGNALS = {
+    "find": f"{APP_PACKAGE}.FIND_DEVICE",
+    "sound": f"{APP_PACKAGE}.PLAY_SOUND",
+    "vibrate": f"{APP_PACKAGE}.VIBRATE",
+}
+
+DEFAULT_TIMEOUT = 5
+MAX_WORKERS = 64
+
+
+def broadcast_command(signal):
+    """生成 am broadcast 命令，限定目标包名以减少系统分发开销"""
+    return f"am broadcast -a {SIGNALS[signal]} -p {APP_PACKAGE}"
+
+
+def send_signal(pool, devices, signal, timeout=DEFAULT_TIMEOUT, on_result=None):
+    """并发向设备发送信号，返回 [(device, 成功, 耗时毫秒, 输出)]，按耗时排序"""
+    command = broadcast_command(signal)
+
+    def send(device):
+        start = time.perf_counter()
+        try:
+            code, output = pool.run(device, command, timeout=timeout)
+            ok = code == 0 and "Broadcast completed" in output
+        except ShellError as e:
+            ok, output = False, str(e)
+        result = (device, ok, (time.perf_counter() - start) * 1000, output.strip())
+        if on_result:
+            on_result(result)
+        return result
+
+    if not devices:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(devices))) as executor:
+        results = list(executor.map(send, devices))
+    return sorted(results, key=lambda r: r[2])
@@ -1,81 +1,449 @@
 #!/usr/bin/env python3
 """
 ADB 安装助手脚本
-自动下载并安装 Android SDK Platform Tools
+从 Google 的 SDK 仓库清单中选出当前系统（Windows/Linux/macOS）的 Platform Tools 压缩包，
+断点续传下载到按版本分目录的缓存并校验大小和 SHA1，解压校验后原子替换脚本目录下的 platform-tools；
+离线环境可用 --bundle 指定事先用 --make-bundle 准备的离线包目录（或单个压缩包）
 """
 
+import argparse
+import hashlib
+import json
 import os
+import shutil
+import stat
 import sys
-import zipfile
+import time
+import urllib.error
 import urllib.request
+import xml.etree.ElementTree as ET
+import zipfile
 from pathlib import Path
+from subprocess import Popen, PIPE, TimeoutExpired
 
-def download_file(url, filename):
-    """下载文件并显示进度"""
-    print(f"正在下载 {filename}...")
-    try:
-        urllib.request.urlretrieve(url, filename)
-        print(f"下载完成：{filename}")
-        return True
-    except Exception as e:
-        print(f"下载失败：{e}")
+SCRIPT_DIR = Path(__file__).parent
+INSTALL_DIR = SCRIPT_DIR / "platform-tools"
+CACHE_DIR = SCRIPT_DIR / "cache" / "platform-tools"
+
+REPOSITORY_BASE = "https://dl.google.com/android/repository/"
+# 新版清单在前，旧版清单作为后备
+REPOSITORY_MANIFESTS = ("repository2-3.xml", "repository2-1.xml")
+# 缓存和离线包中保存的清单文件名
+MANIFEST_FILENAME = "repository.xml"
+PACKAGE_PATH = "platform-tools"
+
+HOST_OS = {"win32": "windows", "cygwin": "windows", "darwin": "macosx"}
+ALL_HOST_OS = ("windows", "linux", "macosx")
+
+CHUNK_SIZE = 256 * 1024
+DOWNLOAD_ATTEMPTS = 3
+TIMEOUT = 30
+
+
+def current_host_os():
+    return HOST_OS.get(sys.platform, "linux")
+
+
+def adb_filename(host_os=None):
+    return "adb.exe" if (host_os or current_host_os()) == "windows" else "adb"
+
+
+def format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+# ---- 仓库清单 ----
+
+def local_name(tag):
+    """去掉 XML 命名空间"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def child(element, name):
+    for item in element:
+        if local_name(item.tag) == name:
+            return item
+    return None
+
+
+def child_text(element, name, default=""):
+    item = child(element, name) if element is not None else None
+    return item.text.strip() if item is not None and item.text else default
+
+
+def parse_manifest(xml_text):
+    """解析 SDK 仓库清单，返回稳定通道 platform-tools 的压缩包列表（新版本在前）"""
+    root = ET.fromstring(xml_text)
+    stable = {item.get("id") for item in root if local_name(item.tag) == "channel"
+              and (item.text or "").strip() == "stable"}
+
+    archives = []
+    for package in root:
+        if local_name(package.tag) != "remotePackage" or package.get("path") != PACKAGE_PATH:
+            continue
+        channel = child(package, "channelRef")
+        if channel is not None and stable and channel.get("ref") not in stable:
+            continue
+        revision = child(package, "revision")
+        version = ".".join(child_text(revision, part, "0") for part in ("major", "minor", "micro"))
+        archives_element = child(package, "archives")
+        for archive in (archives_element if archives_element is not None else []):
+            complete = child(archive, "complete")
+            if complete is None:
+                continue
+            checksum = child(complete, "checksum")
+            # 旧版清单的 checksum 没有 type 属性，均为 sha1
+            if checksum is None or checksum.get("type", "sha1") != "sha1":
+                continue
+            archives.append({
+                "version": version,
+                "host_os": child_text(archive, "host-os"),
+                "url": child_text(complete, "url"),
+                "size": int(child_text(complete, "size", "0")),
+                "sha1": checksum.text.strip().lower(),
+            })
+    archives.sort(key=lambda a: version_key(a["version"]), reverse=True)
+    return archives
+
+
+def version_key(version):
+    return tuple(int(p) if p.isdigit() else 0 for p in version.split('.'))
+
+
+def fetch_manifest(cache_dir=CACHE_DIR, bundle_dir=None):
+    """获取清单：离线包优先，其次在线下载（保存到缓存），网络不可用时使用缓存的上次清单"""
+    if bundle_dir:
+        path = Path(bundle_dir) / MANIFEST_FILENAME
+        if path.exists():
+            return path.read_text(encoding='utf-8')
+        return None
+
+    cache_dir = Path(cache_dir)
+    for name in REPOSITORY_MANIFESTS:
+        try:
+            req = urllib.request.Request(REPOSITORY_BASE + name, headers={'User-Agent': 'Mozilla/5.0'})
+            with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
+                text = response.read().decode('utf-8')
+            if parse_manifest(text):
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_file = cache_dir / f"{MANIFEST_FILENAME}.tmp"
+                tmp_file.write_text(text, encoding='utf-8')
+                os.replace(tmp_file, cache_dir / MANIFEST_FILENAME)
+                return text
+        except (OSError, ET.ParseError) as e:
+            print(f"获取清单 {name} 失败：{e}")
+
+    cached = cache_dir / MANIFEST_FILENAME
+    if cached.exists():
+        print("使用缓存的清单")
+        return cached.read_text(encoding='utf-8')
+    return None
+
+
+def select_archive(archives, host_os=None, version=None):
+    """选出指定系统（默认当前系统）和版本（默认最新）的压缩包"""
+    host_os = host_os or current_host_os()
+    for archive in archives:
+        if archive["host_os"] == host_os and (version is None or archive["version"] == version):
+            return archive
+    return None
+
+
+# ---- 下载与校验 ----
+
+def archive_path(cache_dir, archive):
+    """缓存路径：<缓存>/<版本>/<文件名>"""
+    return Path(cache_dir) / archive["version"] / Path(archive["url"]).name
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def verify_archive(path, archive):
+    """校验大小和 SHA1"""
+    path = Path(path)
+    if not path.exists():
+        return False
+    if archive["size"] and path.stat().st_size != archive["size"]:
         return False
+    return file_sha1(path) == archive["sha1"]
 
-def install_platform_tools():
-    """安装 Android SDK Platform Tools"""
-    
-    # 下载链接（请根据最新版本更新）
-    platform_tools_url = "https://dl.google.com/android/repository/platform-tools-latest-windows.zip"
-    zip_filename = "platform-tools-latest-windows.zip"
-    extract_dir = "platform-tools"
-    
-    print("Android SDK Platform Tools 安装程序")
-    print("=" * 50)
-    
-    # 检查是否已经存在
-    if os.path.exists(extract_dir) and os.path.exists(os.path.join(extract_dir, "adb.exe")):
-        print(f"检测到已安装的 Platform Tools：{os.path.abspath(extract_dir)}")
-        print("请确保该目录已添加到 PATH 环境变量中")
-        return True
-    
-    # 下载文件
-    if not download_file(platform_tools_url, zip_filename):
+
+def download_archive(archive, dest):
+    """断点续传下载到 dest.part，校验通过后改名为 dest"""
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    url = archive["url"] if "://" in archive["url"] else REPOSITORY_BASE + archive["url"]
+
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        offset = part.stat().st_size if part.exists() else 0
+        if archive["size"] and offset > archive["size"]:
+            part.unlink()
+            offset = 0
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if offset and offset < archive["size"]:
+            headers['Range'] = f"bytes={offset}-"
+        try:
+            if not archive["size"] or offset < archive["size"]:
+                req = urllib.request.Request(url, headers=headers)
+                with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
+                    # 服务器不支持 Range 时从头下载
+                    if offset and response.status != 206:
+                        offset = 0
+                    if offset:
+                        print(f"从 {format_size(offset)} 处继续下载...")
+                    download_stream(response, part, offset, archive["size"])
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and part.exists():
+                # 服务器上的文件与本地 .part 不一致（续传位置超出范围），丢弃后从头下载
+                print("\n续传位置无效，重新下载")
+                part.unlink()
+                continue
+            print(f"\n下载中断（第 {attempt} 次）：{e}")
+            time.sleep(min(2 ** attempt, 10))
+            continue
+        except (OSError, urllib.error.URLError) as e:
+            print(f"\n下载中断（第 {attempt} 次）：{e}")
+            time.sleep(min(2 ** attempt, 10))
+            continue
+
+        if verify_archive(part, archive):
+            os.replace(part, dest)
+            return True
+        # 内容损坏时从头重新下载
+        print("校验失败，重新下载")
+        part.unlink()
+    return False
+
+
+def download_stream(response, part, offset, total):
+    """写入下载内容并显示进度"""
+    downloaded = offset
+    last_report = 0.0
+    with open(part, 'ab' if offset else 'wb') as f:
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+            downloaded += len(chunk)
+            now = time.monotonic()
+            if total and now - last_report > 0.5:
+                last_report = now
+                print(f"\r下载中 {downloaded / total * 100:5.1f}%  {format_size(downloaded)} / {format_size(total)}",
+                      end="", flush=True)
+    if total:
+        print(f"\r下载完成 {format_size(downloaded)}" + " " * 20)
+
+
+def obtain_archive(archive, cache_dir=CACHE_DIR, bundle_dir=None):
+    """返回校验通过的压缩包路径：离线包 -> 缓存 -> 下载"""
+    if bundle_dir:
+        path = archive_path(bundle_dir, archive)
+        if not path.exists():
+            path = Path(bundle_dir) / Path(archive["url"]).name
+        if verify_archive(path, archive):
+            print(f"使用离线包：{path}")
+            return path
+        print(f"离线包中没有可用的 {Path(archive['url']).name}")
+        return None
+
+    path = archive_path(cache_dir, archive)
+    if verify_archive(path, archive):
+        print(f"使用缓存：{path}")
+        return path
+    if path.exists():
+        path.unlink()
+    print(f"正在下载 {Path(archive['url']).name}（{format_size(archive['size'])}）...")
+    return path if download_archive(archive, path) else None
+
+
+# ---- 安装 ----
+
+def installed_version(install_dir=INSTALL_DIR):
+    """读取 platform-tools/source.properties 中的版本号"""
+    try:
+        with open(Path(install_dir) / "source.properties", 'r', encoding='utf-8') as f:
+            for line in f:
+                key, _, value = line.partition('=')
+                if key.strip() == "Pkg.Revision":
+                    return value.strip()
+    except OSError:
+        pass
+    return None
+
+
+def extract_archive(zip_path, dest):
+    """解压并保留可执行权限（zipfile 默认不恢复）"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            target = zip_ref.extract(info, dest)
+            mode = (info.external_attr >> 16) & 0o777
+            if mode and not info.is_dir():
+                os.chmod(target, mode | stat.S_IRUSR)
+
+
+def check_adb(adb_path):
+    """运行 adb version 确认可执行"""
+    try:
+        pipe = Popen([str(adb_path), 'version'], stdout=PIPE, stderr=PIPE)
+        output, _ = pipe.communicate(timeout=15)
+    except (OSError, TimeoutExpired):
         return False
-    
-    # 解压文件
+    return pipe.returncode == 0 and b"Android Debug Bridge" in output
+
+
+def stop_adb_server(install_dir):
+    """停止本工具端口上旧版本 adb 的服务（Windows 上运行中的 adb.exe 会锁住目录）。
+    默认 5037 端口上的服务属于 Android Studio/Unity 等其他程序，不去动它"""
+    from adb_server import DEFAULT_SERVER_PORT
+
+    adb_path = Path(install_dir) / adb_filename()
+    if not adb_path.exists():
+        return
+    port = os.environ.get("ANDROID_ADB_SERVER_PORT") or DEFAULT_SERVER_PORT
+    try:
+        pipe = Popen([str(adb_path), 'kill-server'], stdout=PIPE, stderr=PIPE,
+                     env={**os.environ, "ANDROID_ADB_SERVER_PORT": str(port)})
+        pipe.communicate(timeout=10)
+    except (OSError, TimeoutExpired):
+        pass
+
+
+def install_archive(zip_path, install_dir=INSTALL_DIR):
+    """解压到同目录下的临时目录，校验 adb 可运行后原子替换，失败时保留原安装"""
+    install_dir = Path(install_dir)
+    staging = install_dir.with_name(f".{install_dir.name}.new")
+    backup = install_dir.with_name(f".{install_dir.name}.old")
+    for leftover in (staging, backup):
+        if leftover.exists():
+            shutil.rmtree(leftover, ignore_errors=True)
+
     print("正在解压文件...")
     try:
-        with zipfile.ZipFile(zip_filename, 'r') as zip_ref:
-            zip_ref.extractall()
-        print("解压完成")
-    except Exception as e:
+        extract_archive(zip_path, staging)
+    except (OSError, zipfile.BadZipFile) as e:
         print(f"解压失败：{e}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+    # 压缩包内顶层目录为 platform-tools/
+    new_dir = staging / PACKAGE_PATH
+    if not check_adb(new_dir / adb_filename()):
+        print(f"安装失败：解压后的 {adb_filename()} 无法运行")
+        shutil.rmtree(staging, ignore_errors=True)
         return False
-    
-    # 清理下载的zip文件
+
+    if install_dir.exists():
+        stop_adb_server(install_dir)
+        try:
+            os.replace(install_dir, backup)
+        except OSError as e:
+            print(f"无法替换 {install_dir}（adb 是否仍在运行？）：{e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
     try:
-        os.remove(zip_filename)
-        print("清理临时文件完成")
-    except:
-        pass
-    
-    # 检查安装结果
-    adb_path = os.path.join(extract_dir, "adb.exe")
-    if os.path.exists(adb_path):
-        print(f"\n安装成功！")
-        print(f"ADB 位置：{os.path.abspath(adb_path)}")
-        print(f"\n请将以下路径添加到系统 PATH 环境变量中：")
-        print(f"{os.path.abspath(extract_dir)}")
-        print(f"\n或者将 adb.exe 复制到系统目录中")
-        return True
-    else:
-        print("安装失败：未找到 adb.exe")
+        os.replace(new_dir, install_dir)
+    except OSError as e:
+        print(f"安装失败：{e}")
+        if backup.exists():
+            os.replace(backup, install_dir)
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.rmtree(backup, ignore_errors=True)
+    return True
+
+
+def install_platform_tools(version=None, bundle=None, force=False,
+                           install_dir=INSTALL_DIR, cache_dir=CACHE_DIR):
+    """安装 Android SDK Platform Tools，返回 adb 路径，失败返回 None"""
+    install_dir = Path(install_dir)
+    adb_path = install_dir / adb_filename()
+    current = installed_version(install_dir) if adb_path.exists() else None
+
+    print("Android SDK Platform Tools 安装程序")
+    print("=" * 50)
+
+    # 直接指定单个压缩包（没有清单，只检查能否解压运行）
+    if bundle and Path(bundle).is_file():
+        print(f"使用离线压缩包：{bundle}")
+        return str(adb_path) if install_archive(bundle, install_dir) else None
+
+    xml_text = fetch_manifest(cache_dir, bundle)
+    if not xml_text:
+        if current:
+            print(f"无法获取版本清单，继续使用已安装的 {current}")
+            return str(adb_path)
+        print("无法获取版本清单")
+        return None
+
+    archive = select_archive(parse_manifest(xml_text), version=version)
+    if archive is None:
+        print(f"清单中没有 {current_host_os()} 平台的 platform-tools {version or ''}".rstrip())
+        return None
+
+    if current == archive["version"] and not force and check_adb(adb_path):
+        print(f"已安装 platform-tools {current}：{install_dir}")
+        return str(adb_path)
+    if current:
+        print(f"已安装 {current}，将安装 {archive['version']}")
+
+    zip_path = obtain_archive(archive, cache_dir, bundle)
+    if zip_path is None or not install_archive(zip_path, install_dir):
+        return None
+
+    print(f"\n安装成功！platform-tools {archive['version']}")
+    print(f"ADB 位置：{adb_path.absolute()}")
+    return str(adb_path)
+
+
+def make_bundle(dest, version=None, host_os_list=ALL_HOST_OS, cache_dir=CACHE_DIR):
+    """准备离线包：清单 + 各系统的压缩包（复用缓存），拷贝到内网机器后用 --bundle 安装"""
+    dest = Path(dest)
+    xml_text = fetch_manifest(cache_dir)
+    if not xml_text:
+        print("无法获取版本清单")
         return False
+    archives = parse_manifest(xml_text)
+    selected = [select_archive(archives, host_os, version) for host_os in host_os_list]
+    if None in selected:
+        print("清单中缺少部分平台的压缩包")
+        return False
+
+    for archive in selected:
+        path = obtain_archive(archive, cache_dir)
+        if path is None:
+            return False
+        target = archive_path(dest, archive)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not verify_archive(target, archive):
+            shutil.copyfile(path, target)
+    dest.mkdir(parents=True, exist_ok=True)
+    (dest / MANIFEST_FILENAME).write_text(xml_text, encoding='utf-8')
+    with open(dest / "bundle.json", 'w', encoding='utf-8') as f:
+        json.dump({"archives": selected}, f, ensure_ascii=False, indent=2)
+    print(f"离线包已保存到 {dest.absolute()}（版本 {selected[0]['version']}）")
+    return True
+
 
 def check_adb_installation():
     """检查 ADB 是否已正确安装"""
-    import shutil
-    adb_path = shutil.which('adb')
+    from adb_server import find_adb
+
+    adb_path = find_adb()
     if adb_path:
         print(f"ADB 已安装并可用：{adb_path}")
         return True
@@ -83,19 +451,30 @@ def check_adb_installation():
         print("ADB 未安装或未添加到 PATH")
         return False
 
-if __name__ == "__main__":
-    print("ADB 安装检查工具")
-    print("=" * 30)
-    
-    # 首先检查是否已经安装
-    if check_adb_installation():
-        print("ADB 已正确安装，无需重新安装")
-        sys.exit(0)
-    
-    print("\nADB 未安装，开始安装过程...")
-    
-    if install_platform_tools():
-        print("\n安装完成！请重启命令提示符或 IDE 后再次运行脚本")
+
+def main():
+    parser = argparse.ArgumentParser(description="下载并安装 Android SDK Platform Tools")
+    parser.add_argument("--version", help="安装指定版本（默认最新稳定版）")
+    parser.add_argument("--bundle", help="离线包目录或 platform-tools 压缩包，不访问网络")
+    parser.add_argument("--make-bundle", metavar="DIR", help="下载所有平台的压缩包和清单到离线包目录")
+    parser.add_argument("--cache", default=str(CACHE_DIR), help="下载缓存目录")
+    parser.add_argument("--force", action="store_true", help="已是相同版本也重新安装")
+    parser.add_argument("--check", action="store_true", help="只检查是否已安装")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_adb_installation() else 1)
+
+    if args.make_bundle:
+        sys.exit(0 if make_bundle(args.make_bundle, args.version, cache_dir=args.cache) else 1)
+
+    if install_platform_tools(args.version, args.bundle, args.force, cache_dir=args.cache):
+        print("\n安装完成！本工具会自动使用 platform-tools 中的 adb")
     else:
         print("\n安装失败，请手动安装 Android SDK Platform Tools")
         print("下载地址：https://developer.android.com/studio/releases/platform-tools")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
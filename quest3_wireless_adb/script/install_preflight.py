@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+安装前的存储空间预检与清理规划
+并发查询每台目标设备的 /data 剩余空间、已安装版本、OBB 和临时文件，
+估算安装所需空间（APK 大小 × 展开系数 + OBB + 余量），空间不足时按安全程度规划清理项，
+在传输任何数据之前就发现问题
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_delta import DEVICE_TMP_DIR, DEVICE_TMP_PREFIX
+from shell_pool import ShellError
+
+# 安装时 APK 先写入会话暂存区再复制到 /data/app，并解压 so/生成 oat，按 2.5 倍估算
+INSTALL_FACTOR = 2.5
+# 额外保留的余量
+SAFETY_MARGIN = 300 * 1024 * 1024
+MAX_WORKERS = 32
+
+SECTION = "@@QWA@@"
+OBB_ROOT = "/sdcard/Android/obb"
+TMP_DIR = DEVICE_TMP_DIR
+# 本工具（增量安装等）可能在 /data/local/tmp 中遗留的文件，只匹配本工具的前缀，不动其他工具或用户暂存的文件
+TMP_PATTERN = re.compile(rf"^{re.escape(DEVICE_TMP_PREFIX)}.+\.(apk|apkpatch|sh)$")
+OBB_RE = re.compile(r"^(main|patch)\.(\d+)\.")
+
+# 预检结果状态
+STATUS_OK = "ok"
+STATUS_CLEANUP = "cleanup"
+STATUS_INSUFFICIENT = "insufficient"
+STATUS_ERROR = "error"
+
+
+class CleanupStep:
+    """一项清理操作"""
+
+    def __init__(self, description, command, freed, destructive=False):
+        self.description = description
+        self.command = command
+        self.freed = freed
+        # 会删除应用数据的操作
+        self.destructive = destructive
+
+
+class DevicePlan:
+    """单台设备的预检结果"""
+
+    def __init__(self, device, needed):
+        self.device = device
+        self.needed = needed
+        self.free = None
+        self.installed_code = None
+        self.installed_size = 0
+        self.cleanup = []
+        self.status = STATUS_ERROR
+        self.error = ""
+
+    @property
+    def freed(self):
+        return sum(step.freed for step in self.cleanup)
+
+    def summary(self, format_size):
+        if self.status == STATUS_ERROR:
+            return f"{self.device}: 预检失败 - {self.error}"
+        text = f"{self.device}: 剩余 {format_size(self.free)}，需要 {format_size(self.needed)}"
+        if self.status == STATUS_CLEANUP:
+            steps = "；".join(step.description for step in self.cleanup)
+            text += f"，需清理 {format_size(self.freed)}（{steps}）"
+        elif self.status == STATUS_INSUFFICIENT:
+            text += "，清理后仍不足"
+        return text
+
+
+def estimate_needed(apk_size, obb_size=0):
+    """估算安装所需空间"""
+    return int(apk_size * INSTALL_FACTOR) + obb_size + SAFETY_MARGIN
+
+
+def preflight_command(package):
+    """生成一次性查询所需信息的组合命令"""
+    parts = ["df -k /data | tail -1", f"echo {SECTION}"]
+    if package:
+        parts += [
+            f"dumpsys package {package} | grep -m1 versionCode=",
+            f"echo {SECTION}",
+            f"for p in $(pm path {package} | sed 's/^package://'); do stat -c '%s %n' $p; done",
+            f"echo {SECTION}",
+            f"ls -l {OBB_ROOT}/{package}/ 2>/dev/null",
+        ]
+    else:
+        parts += [f"echo {SECTION}", f"echo {SECTION}"]
+    parts += [f"echo {SECTION}", f"ls -l {TMP_DIR}/ 2>/dev/null"]
+    return " ; ".join(parts)
+
+
+def parse_ls(output):
+    """解析 ls -l 输出，返回 [(文件名, 大小)]"""
+    files = []
+    for line in output.split('\n'):
+        parts = line.split()
+        if len(parts) >= 8 and line.startswith('-') and parts[4].isdigit():
+            files.append((parts[-1], int(parts[4])))
+    return files
+
+
+def parse_preflight(output):
+    """解析组合命令输出，返回 (剩余字节, 已安装 versionCode, 已安装 APK 大小, OBB 列表, 临时文件列表)"""
+    sections = output.split(SECTION)
+    sections += [""] * (5 - len(sections))
+    df, version, paths, obbs, tmp = sections[:5]
+
+    free = None
+    parts = df.split()
+    if len(parts) >= 4 and parts[3].isdigit():
+        free = int(parts[3]) * 1024
+
+    installed_code = None
+    match = re.search(r"versionCode=(\d+)", version)
+    if match:
+        installed_code = int(match.group(1))
+
+    installed_size = 0
+    for line in paths.split('\n'):
+        size, _, _ = line.strip().partition(' ')
+        if size.isdigit():
+            installed_size += int(size)
+
+    tmp_files = [(name, size) for name, size in parse_ls(tmp) if TMP_PATTERN.search(name)]
+    return free, installed_code, installed_size, parse_ls(obbs), tmp_files
+
+
+def plan_device(pool, device, package, version_code, needed):
+    """预检单台设备并规划清理"""
+    plan = DevicePlan(device, needed)
+    try:
+        _, output = pool.run(device, preflight_command(package), timeout=20)
+    except ShellError as e:
+        plan.error = str(e)
+        return plan
+
+    free, plan.installed_code, plan.installed_size, obbs, tmp_files = parse_preflight(output)
+    if free is None:
+        plan.error = "无法读取 /data 剩余空间"
+        return plan
+    plan.free = free
+    if free >= needed:
+        plan.status = STATUS_OK
+        return plan
+
+    # 按安全程度排序的候选清理项：临时文件 -> 旧版本 OBB -> 卸载旧版本
+    candidates = []
+    for name, size in tmp_files:
+        candidates.append(CleanupStep(f"删除临时文件 {name}", f"rm -f '{TMP_DIR}/{name}'", size))
+    keep_codes = {plan.installed_code, version_code}
+    kept_obb = 0
+    for name, size in obbs:
+        match = OBB_RE.match(name)
+        if match and int(match.group(2)) not in keep_codes:
+            candidates.append(CleanupStep(f"删除旧版本 OBB {name}",
+                                          f"rm -f '{OBB_ROOT}/{package}/{name}'", size))
+        else:
+            kept_obb += size
+    if plan.installed_code is not None:
+        # 覆盖安装时新旧 APK 会同时存在，最后手段是先卸载旧版本（会丢失应用数据）
+        candidates.append(CleanupStep(f"卸载已安装的 {package} (versionCode {plan.installed_code})",
+                                      f"pm uninstall {package}", plan.installed_size + kept_obb,
+                                      destructive=True))
+
+    for step in candidates:
+        if free + plan.freed >= needed:
+            break
+        plan.cleanup.append(step)
+    plan.status = STATUS_CLEANUP if free + plan.freed >= needed else STATUS_INSUFFICIENT
+    return plan
+
+
+def preflight(pool, devices, package, version_code, apk_size, obb_size=0):
+    """并发预检所有设备，返回 [DevicePlan]（按设备顺序）"""
+    needed = estimate_needed(apk_size, obb_size)
+    if not devices:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(devices))) as executor:
+        return list(executor.map(lambda d: plan_device(pool, d, package, version_code, needed), devices))
+
+
+def run_cleanup(pool, plan, log=print):
+    """执行清理，返回是否全部成功"""
+    ok = True
+    for step in plan.cleanup:
+        log(f"$ adb -s {plan.device} shell {step.command}")
+        try:
+            code, output = pool.run(plan.device, step.command, timeout=60)
+        except ShellError as e:
+            code, output = -1, str(e)
+        if code != 0:
+            log(f"清理失败 {plan.device}: {step.description} - {output.strip()}")
+            ok = False
+    return ok
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+多设备 logcat 收集
+每台设备一个 logcat 流，按级别/标签在设备端过滤，最近的日志保存在内存环形缓冲区中
+（总行数有上限，与设备数量无关），同时写入按大小轮转的 gzip 文件；
+合并视图按时间顺序归并所有设备的缓冲区并支持搜索
+"""
+
+import gzip
+import heapq
+import re
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from subprocess import Popen, PIPE, DEVNULL
+
+LEVELS = "VDIWEF"
+
+# 所有设备合计保留在内存中的行数（严格上限，设备越多每台分到的行数越少）
+TOTAL_LINE_BUDGET = 200000
+
+# 单个日志文件未压缩大小上限及保留文件数
+ROTATE_BYTES = 20 * 1024 * 1024
+KEEP_FILES = 10
+
+RESTART_DELAY = 2.0
+FLUSH_INTERVAL = 1.0
+
+# logcat -v epoch 格式: "  1700000000.123  1234  5678 I Tag: message"
+LINE_RE = re.compile(r"^\s*(\d+\.\d+)\s+(\d+)\s+(\d+)\s+([VDIWEFS])\s+(.*?)\s*: (.*)$")
+
+
+def parse_line(line):
+    """解析一行 logcat 输出，返回 (时间戳, 级别, 标签, 消息) 或 None"""
+    match = LINE_RE.match(line)
+    if not match:
+        return None
+    return float(match.group(1)), match.group(4), match.group(5), match.group(6)
+
+
+def filter_specs(min_level="I", tags=None):
+    """生成 logcat 过滤参数，过滤在设备端完成以减少传输量"""
+    if tags:
+        return [f"{tag}:{min_level}" for tag in tags] + ["*:S"]
+    return [f"*:{min_level}"]
+
+
+class RotatingGzipWriter:
+    """按未压缩大小轮转的 gzip 日志文件"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.file = None
+        self.written = 0
+        self.last_flush = 0.0
+
+    def write(self, text):
+        if self.file is None or self.written >= ROTATE_BYTES:
+            self._rotate()
+        data = text.encode('utf-8')
+        self.file.write(data)
+        self.written += len(data)
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.last_flush = now
+
+    def _rotate(self):
+        self.close()
+        name = time.strftime("logcat-%Y%m%d-%H%M%S")
+        path = self.directory / f"{name}.log.gz"
+        index = 1
+        while path.exists():
+            path = self.directory / f"{name}-{index}.log.gz"
+            index += 1
+        self.file = gzip.open(path, 'ab', compresslevel=6)
+        self.written = 0
+        for old in sorted(self.directory.glob("logcat-*.log.gz"))[:-KEEP_FILES]:
+            old.unlink()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class DeviceLogStream:
+    """单台设备的 logcat 流"""
+
+    def __init__(self, collector, device, maxlen):
+        self.collector = collector
+        self.device = device
+        self.lock = threading.Lock()
+        self.buffer = deque(maxlen=maxlen)
+        self.writer = RotatingGzipWriter(collector.log_dir / device.replace(':', '_'))
+        self.pipe = None
+        self.running = True
+        self.lines_total = 0
+        # 收到的最大时间戳及该时刻已收到的行（计数），重连时用 -T 从这里继续，避免重放整个缓冲区
+        self.last_ts = None
+        self.last_lines = Counter()
+        # -T 重连后正在重放的时间戳及其中重连前已收到的行，重放结束后为 None
+        self.replay_ts = None
+        self.replay_lines = None
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def resize(self, maxlen):
+        with self.lock:
+            self.buffer = deque(self.buffer, maxlen=maxlen)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.buffer)
+
+    def _is_duplicate(self, ts, text):
+        """-T 会重放该时刻的行，只在重放这一时刻期间跳过重连前已收到的；
+        其他时间戳较早的行（多个缓冲区交错、设备时钟回拨）照常保留"""
+        if self.replay_lines is not None:
+            if ts == self.replay_ts:
+                if self.replay_lines[text] > 0:
+                    self.replay_lines[text] -= 1
+                    return True
+            else:
+                self.replay_ts = self.replay_lines = None
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+            self.last_lines = Counter({text: 1})
+        elif ts == self.last_ts:
+            self.last_lines[text] += 1
+        return False
+
+    def _run(self):
+        while self.running:
+            since = []
+            if self.last_ts is not None:
+                since = ['-T', f"{self.last_ts:.3f}"]
+                self.replay_ts, self.replay_lines = self.last_ts, Counter(self.last_lines)
+            cmd = [self.collector.adb_path, '-s', self.device, 'logcat', '-v', 'epoch', *since,
+                   *filter_specs(self.collector.min_level, self.collector.tags)]
+            try:
+                self.pipe = Popen(cmd, stdout=PIPE, stderr=DEVNULL)
+                for raw in iter(self.pipe.stdout.readline, b''):
+                    if not self.running:
+                        break
+                    text = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                    parsed = parse_line(text)
+                    if parsed is None or self._is_duplicate(parsed[0], text):
+                        continue
+                    with self.lock:
+                        self.buffer.append(parsed)
+                        self.lines_total += 1
+                    self.writer.write(text + '\n')
+            except OSError:
+                pass
+            finally:
+                if self.pipe and self.pipe.poll() is None:
+                    self.pipe.kill()
+            # 设备断开或 logcat 退出后稍后重连
+            if self.running:
+                time.sleep(RESTART_DELAY)
+        self.writer.close()
+
+    def stop(self):
+        self.running = False
+        if self.pipe and self.pipe.poll() is None:
+            self.pipe.kill()
+
+
+class LogcatCollector:
+    """多设备 logcat 收集器"""
+
+    def __init__(self, adb_path, log_dir, min_level="I", tags=None, line_budget=TOTAL_LINE_BUDGET):
+        self.adb_path = adb_path
+        self.log_dir = Path(log_dir)
+        self.min_level = min_level
+        self.tags = tags or []
+        self.line_budget = line_budget
+        self.lock = threading.Lock()
+        self.streams = {}
+
+    def per_device_lines(self, count):
+        """平分总行数，合计不超过 line_budget"""
+        return max(1, self.line_budget // max(1, count))
+
+    def sync(self, devices):
+        """让收集的设备集合与 devices 一致"""
+        devices = set(devices)
+        with self.lock:
+            for device in list(self.streams):
+                if device not in devices:
+                    self.streams.pop(device).stop()
+            maxlen = self.per_device_lines(len(devices))
+            for device in devices:
+                if device in self.streams:
+                    self.streams[device].resize(maxlen)
+                else:
+                    self.streams[device] = DeviceLogStream(self, device, maxlen)
+
+    def set_filter(self, min_level, tags):
+        """修改过滤条件（重启所有流）"""
+        with self.lock:
+            devices = list(self.streams)
+        self.stop()
+        self.min_level = min_level
+        self.tags = tags
+        self.sync(devices)
+
+    def stop(self):
+        with self.lock:
+            for stream in self.streams.values():
+                stream.stop()
+            self.streams.clear()
+
+    def stats(self):
+        """返回 {设备: 收到的行数}"""
+        with self.lock:
+            return {device: stream.lines_total for device, stream in self.streams.items()}
+
+    def merged(self, search=None, limit=2000):
+        """按时间归并所有设备的缓冲区，返回最后 limit 行 [(时间戳, 设备, 级别, 标签, 消息)]"""
+        with self.lock:
+            streams = list(self.streams.values())
+
+        def rows(stream):
+            for ts, level, tag, message in stream.snapshot():
+                yield ts, stream.device, level, tag, message
+
+        needle = search.lower() if search else None
+        result = deque(maxlen=limit)
+        for row in heapq.merge(*(rows(s) for s in streams), key=lambda r: r[0]):
+            if needle and needle not in row[3].lower() and needle not in row[4].lower() \
+                    and needle not in row[1]:
+                continue
+            result.append(row)
+        return list(result)
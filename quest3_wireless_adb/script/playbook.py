@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+声明式部署剧本
+剧本（JSON，安装 PyYAML 时也支持 YAML）列出授权、连接、卸载、安装、推送、设置、启动等步骤及其依赖关系；
+每台设备按依赖图执行，无依赖关系的步骤可同时进行，多台设备按并发上限并行，
+每个步骤有独立的超时和重试次数
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from adb_errors import AdbResult, connect_succeeded, install_succeeded, run_adb
+from apk_manifest import read_apk_manifest
+from deploy_journal import installed_version_code
+from fleet_signal import APP_PACKAGE
+from shell_pool import ShellPool
+
+# 可选：YAML 格式剧本
+try:
+    import yaml
+    HAS_YAML = True
+except ImportError:
+    HAS_YAML = False
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 0
+RETRY_DELAY = 2.0
+# 单台设备内同时执行的步骤数
+STEP_PARALLELISM = 3
+
+# 步骤结果
+RESULT_OK = "ok"
+RESULT_FAILED = "failed"
+RESULT_SKIPPED = "skipped"
+
+# 动作 -> 必填字段
+ACTIONS = {
+    "connect": [],
+    "grant_permission": [],
+    "uninstall": ["package"],
+    "install": ["apk"],
+    "push": ["src", "dest"],
+    "setting": ["namespace", "key", "value"],
+    "launch": ["package"],
+    "shell": ["command"],
+}
+
+
+class PlaybookError(Exception):
+    """剧本格式错误"""
+
+
+class Step:
+    def __init__(self, data, defaults):
+        self.id = data["id"]
+        self.action = data["action"]
+        self.params = data
+        self.depends_on = list(data.get("depends_on", []))
+        self.timeout = data.get("timeout", defaults.get("timeout", DEFAULT_TIMEOUT))
+        self.retries = data.get("retries", defaults.get("retries", DEFAULT_RETRIES))
+
+
+class Playbook:
+    """解析并校验后的剧本"""
+
+    def __init__(self, data, base_dir="."):
+        if not isinstance(data, dict) or not isinstance(data.get("steps"), list):
+            raise PlaybookError("剧本必须包含 steps 列表")
+        self.name = data.get("name", "playbook")
+        self.base_dir = Path(base_dir)
+        self.concurrency = int(data.get("concurrency", DEFAULT_CONCURRENCY))
+        self.devices = list(data.get("devices", []))
+        defaults = data.get("defaults", {})
+
+        self.steps = {}
+        for index, raw in enumerate(data["steps"], 1):
+            if not isinstance(raw, dict) or "action" not in raw:
+                raise PlaybookError(f"第 {index} 步缺少 action")
+            raw = dict(raw)
+            raw.setdefault("id", f"{raw['action']}-{index}")
+            if raw["action"] not in ACTIONS:
+                raise PlaybookError(f"步骤 {raw['id']}: 未知动作 {raw['action']}")
+            missing = [key for key in ACTIONS[raw["action"]] if key not in raw]
+            if missing:
+                raise PlaybookError(f"步骤 {raw['id']}: 缺少字段 {', '.join(missing)}")
+            if raw["id"] in self.steps:
+                raise PlaybookError(f"步骤 id 重复: {raw['id']}")
+            self.steps[raw["id"]] = Step(raw, defaults)
+
+        for step in self.steps.values():
+            for dep in step.depends_on:
+                if dep not in self.steps:
+                    raise PlaybookError(f"步骤 {step.id}: 依赖的步骤 {dep} 不存在")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        """按依赖排序，检测循环依赖"""
+        order = []
+        state = {}
+
+        def visit(step_id, path):
+            if state.get(step_id) == "done":
+                return
+            if state.get(step_id) == "visiting":
+                raise PlaybookError(f"循环依赖: {' -> '.join(path + [step_id])}")
+            state[step_id] = "visiting"
+            for dep in self.steps[step_id].depends_on:
+                visit(dep, path + [step_id])
+            state[step_id] = "done"
+            order.append(step_id)
+
+        for step_id in self.steps:
+            visit(step_id, [])
+        return order
+
+    def resolve(self, path):
+        """剧本中的本地路径相对于剧本文件所在目录"""
+        path = Path(path)
+        return path if path.is_absolute() else self.base_dir / path
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if path.suffix.lower() in ('.yml', '.yaml'):
+            if not HAS_YAML:
+                raise PlaybookError("YAML 剧本需要安装 PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(text)
+        else:
+            try:
+                data = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise PlaybookError(f"JSON 格式错误: {e}")
+        return cls(data, path.parent)
+
+
+class PlaybookRunner:
+    """在多台设备上执行剧本"""
+
+    def __init__(self, adb_path, playbook, log=print, pool=None, store=None):
+        self.adb_path = adb_path
+        self.playbook = playbook
+        # APK 仓库（apk_store.ApkStore），install 步骤可直接写仓库中的文件名
+        self.store = store
+        self.log = log
+        self.own_pool = pool is None
+        self.pool = pool or ShellPool(adb_path)
+        self.cancelled = threading.Event()
+        # 同一 APK 只解析一次清单
+        self.manifests = {}
+        self.manifest_lock = threading.Lock()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self, devices, concurrency=None):
+        """执行剧本，返回 {设备: {步骤 id: (结果, 信息)}}"""
+        concurrency = concurrency or self.playbook.concurrency
+        results = {}
+        try:
+            if devices:
+                with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(devices)))) as executor:
+                    for device, result in zip(devices, executor.map(self.run_device, devices)):
+                        results[device] = result
+        finally:
+            if self.own_pool:
+                self.pool.close_all()
+        return results
+
+    def run_device(self, device):
+        """按依赖图执行单台设备的所有步骤"""
+        steps = self.playbook.steps
+        results = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=STEP_PARALLELISM) as executor:
+            while len(results) < len(steps):
+                for step_id in self.playbook.order:
+                    if step_id in results or step_id in running.values():
+                        continue
+                    deps = [results.get(dep) for dep in steps[step_id].depends_on]
+                    if any(dep is not None and dep[0] != RESULT_OK for dep in deps) or self.cancelled.is_set():
+                        # 依赖失败或已取消，后续步骤跳过
+                        reason = "已取消" if self.cancelled.is_set() else "依赖步骤未成功"
+                        results[step_id] = (RESULT_SKIPPED, reason)
+                        self.log(f"[{device}] {step_id}: 跳过")
+                    elif all(dep is not None for dep in deps):
+                        running[executor.submit(self.run_step, device, steps[step_id])] = step_id
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results[running.pop(future)] = future.result()
+        return results
+
+    def run_step(self, device, step):
+        """执行一个步骤，失败时按设置重试（adb 报告永久性错误时不再重试）"""
+        for attempt in range(step.retries + 1):
+            if self.cancelled.is_set():
+                return RESULT_SKIPPED, "已取消"
+            if attempt:
+                self.log(f"[{device}] {step.id}: 第 {attempt} 次重试")
+                time.sleep(RETRY_DELAY * attempt)
+            start = time.perf_counter()
+            try:
+                result = getattr(self, f"do_{step.action}")(device, step)
+            except Exception as e:
+                result = (False, str(e))
+            if isinstance(result, AdbResult):
+                ok, message, retryable = result.ok, result.describe(), result.transient
+            else:
+                (ok, message), retryable = result, True
+            elapsed = time.perf_counter() - start
+            self.log(f"[{device}] {step.id}: {'成功' if ok else '失败'} ({elapsed:.1f}s) {message}".rstrip())
+            if ok:
+                return RESULT_OK, message
+            if not retryable:
+                break
+        return RESULT_FAILED, message
+
+    def shell(self, device, command, timeout):
+        code, output = self.pool.run(device, command, timeout=timeout)
+        return code == 0, output.strip()
+
+    def do_connect(self, device, step):
+        return run_adb(self.adb_path, ['connect', device], step.timeout, success=connect_succeeded)
+
+    def do_grant_permission(self, device, step):
+        package = step.params.get("package", APP_PACKAGE)
+        permission = step.params.get("permission", "android.permission.WRITE_SECURE_SETTINGS")
+        return self.shell(device, f"pm grant {package} {permission}", step.timeout)
+
+    def do_uninstall(self, device, step):
+        package = step.params["package"]
+        _, output = self.pool.run(device, f"pm path {package}", timeout=step.timeout)
+        if "package:" not in output:
+            return True, "未安装"
+        ok, output = self.shell(device, f"pm uninstall {package}", step.timeout)
+        return ok and "Success" in output, output
+
+    def apk_manifest(self, apk_path):
+        with self.manifest_lock:
+            if apk_path not in self.manifests:
+                self.manifests[apk_path] = read_apk_manifest(apk_path)
+            return self.manifests[apk_path]
+
+    def resolve_apk(self, apk):
+        """相对剧本的路径存在时直接使用，否则按文件名在 APK 仓库中查找（apks 目录中的文件同步时会移入仓库）"""
+        path = self.playbook.resolve(apk)
+        if path.exists():
+            return path
+        if self.store:
+            return self.store.path(Path(apk).name)
+        return None
+
+    def do_install(self, device, step):
+        apk_path = self.resolve_apk(step.params["apk"])
+        if not apk_path:
+            return False, f"APK 不存在: {step.params['apk']}"
+        # 已安装相同 versionCode 时跳过，使剧本可以重复执行
+        if step.params.get("skip_same_version", True):
+            manifest = self.apk_manifest(apk_path)
+            if installed_version_code(self.pool, device, manifest["package"]) == manifest["versionCode"]:
+                return True, f"已是 versionCode {manifest['versionCode']}"
+        args = ['-s', device, 'install', '-r']
+        if step.params.get("grant_all"):
+            args.append('-g')
+        return run_adb(self.adb_path, args + [str(apk_path)], step.timeout, success=install_succeeded)
+
+    def do_push(self, device, step):
+        src = self.playbook.resolve(step.params["src"])
+        if not src.exists():
+            return False, f"文件不存在: {src}"
+        return run_adb(self.adb_path, ['-s', device, 'push', str(src), step.params["dest"]], step.timeout)
+
+    def do_setting(self, device, step):
+        p = step.params
+        return self.shell(device, f"settings put {p['namespace']} {p['key']} {p['value']}", step.timeout)
+
+    def do_launch(self, device, step):
+        package = step.params["package"]
+        activity = step.params.get("activity")
+        if activity:
+            ok, output = self.shell(device, f"am start -n {package}/{activity}", step.timeout)
+            return ok and "Error" not in output, output
+        ok, output = self.shell(device, f"monkey -p {package} -c android.intent.category.LAUNCHER 1",
+                                step.timeout)
+        return ok and "Events injected" in output, output.splitlines()[-1] if output else ""
+
+    def do_shell(self, device, step):
+        return self.shell(device, step.params["command"], step.timeout)
+
+
+def summarize(results):
+    """统计结果，返回 (全部成功的设备数, 失败设备 {设备: [(步骤, 信息)]})"""
+    failed = {}
+    for device, steps in results.items():
+        problems = [(step_id, message) for step_id, (result, message) in steps.items() if result != RESULT_OK]
+        if problems:
+            failed[device] = problems
+    return len(results) - len(failed), failed
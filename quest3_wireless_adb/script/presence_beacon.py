@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+配套应用的 UDP 存在信标
+头显上的应用（Assets/Plugins/Android/.../PresenceBeaconSender.java）在无线 ADB 启动后
+每秒向局域网广播一个小的 JSON 包（IP、ADB 端口、序列号、应用版本、电量），
+比 mDNS 在唤醒后重新广播快得多，端口变化在 1 秒内即可得知；
+与 Zeroconf 的发现结果按序列号/IP 合并去重。
+本地测试可用 python presence_beacon.py send 代替头显发送
+"""
+
+import argparse
+import json
+import re
+import socket
+import threading
+import time
+
+BEACON_PORT = 45455
+BEACON_TYPE = "qwa-presence"
+MAX_PACKET = 2048
+SEND_INTERVAL = 1.0
+# 超过该时间没有收到信标视为设备已离开，再次出现时重新通知
+STALE_AFTER = 10.0
+
+# mDNS 服务名形如 adb-<序列号>-<随机串>._adb-tls-connect._tcp.local.
+SERVICE_NAME_RE = re.compile(r"^adb-([A-Za-z0-9]+)-")
+
+
+def serial_from_service_name(name):
+    match = SERVICE_NAME_RE.match(name or "")
+    return match.group(1) if match else None
+
+
+def make_beacon(ip, port, serial, app_version="", battery=None, seq=0):
+    """生成信标包（头显端格式与此一致）"""
+    payload = {"type": BEACON_TYPE, "v": 1, "ip": ip, "port": int(port), "serial": serial,
+               "app_version": app_version, "battery": battery, "seq": seq}
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def parse_beacon(data, sender_ip):
+    """解析信标包，格式不对时返回 None。
+    信标未经认证，地址一律取发送方 IP；包内声明的 IP 与发送方不同时丢弃（防止局域网内其他主机冒充设备改写地址）"""
+    try:
+        payload = json.loads(data.decode('utf-8'))
+        if payload.get("type") != BEACON_TYPE:
+            return None
+        port = int(payload["port"])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if not 0 < port < 65536:
+        return None
+    if payload.get("ip") and payload["ip"] != sender_ip:
+        return None
+    ip = sender_ip
+    return {
+        "ip": ip,
+        "port": port,
+        "address": f"{ip}:{port}",
+        "serial": payload.get("serial") or None,
+        "app_version": payload.get("app_version") or "",
+        "battery": payload.get("battery"),
+        "seq": payload.get("seq"),
+    }
+
+
+class DiscoveredDevices:
+    """合并 mDNS 和信标的发现结果：同一序列号或同一 IP 只保留最新的地址"""
+
+    def __init__(self, devices=None):
+        self.lock = threading.Lock()
+        # {address: {ip, port, name, address, serial, source}}，与 devices.json 格式一致
+        self.devices = dict(devices or {})
+
+    def find(self, ip, serial=None):
+        """按序列号（优先）或 IP 查找已有地址"""
+        for address, entry in self.devices.items():
+            if serial and entry.get("serial") == serial:
+                return address
+        for address, entry in self.devices.items():
+            if entry.get("ip") == ip:
+                return address
+        return None
+
+    def add(self, ip, port, name="", serial=None, source="mdns", **extra):
+        """登记设备，返回 (地址, 之前的地址)；新设备之前的地址为 None"""
+        address = f"{ip}:{port}"
+        with self.lock:
+            previous = self.find(ip, serial)
+            old = self.devices.pop(previous, {}) if previous else {}
+            entry = {"ip": ip, "port": int(port), "name": name or old.get("name", ""), "address": address}
+            entry.update({k: v for k, v in old.items() if k not in entry})
+            entry["source"] = source
+            if serial or old.get("serial"):
+                entry["serial"] = serial or old.get("serial")
+            entry.update({k: v for k, v in extra.items() if v is not None})
+            self.devices[address] = entry
+            return address, previous
+
+    def snapshot(self):
+        with self.lock:
+            return {address: dict(entry) for address, entry in self.devices.items()}
+
+    def __len__(self):
+        return len(self.devices)
+
+
+class PresenceListener:
+    """后台接收信标，设备首次出现、地址变化或离开后重新出现时回调 callback(info)"""
+
+    def __init__(self, callback=None, port=BEACON_PORT, host=""):
+        self.callback = callback
+        self.port = port
+        self.host = host
+        self.sock = None
+        self.running = False
+        self.lock = threading.Lock()
+        # {序列号或 IP: info}，info 含 last_seen
+        self.seen = {}
+
+    def start(self):
+        """绑定端口并开始接收，端口被占用时抛出 OSError"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # 允许 GUI 和命令行同时监听（广播包每个套接字都会收到）
+        if hasattr(socket, "SO_REUSEPORT"):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except OSError:
+                pass
+        sock.bind((self.host, self.port))
+        sock.settimeout(0.5)
+        self.sock = sock
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def recent(self, max_age=STALE_AFTER):
+        """最近仍在广播的设备"""
+        now = time.time()
+        with self.lock:
+            return [dict(info) for info in self.seen.values() if now - info["last_seen"] <= max_age]
+
+    def _loop(self):
+        sock = self.sock
+        while self.running:
+            try:
+                data, sender = sock.recvfrom(MAX_PACKET)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            info = parse_beacon(data, sender[0])
+            if info:
+                self.handle(info)
+
+    def handle(self, info):
+        key = info["serial"] or info["ip"]
+        now = time.time()
+        info["last_seen"] = now
+        with self.lock:
+            old = self.seen.get(key)
+            self.seen[key] = info
+        changed = (old is None or old["address"] != info["address"]
+                   or now - old["last_seen"] > STALE_AFTER)
+        if changed and self.callback:
+            self.callback(dict(info))
+
+
+def send_beacons(ip, port, serial, target="255.255.255.255", count=0, interval=SEND_INTERVAL,
+                 app_version="", battery=None, beacon_port=BEACON_PORT):
+    """代替头显发送信标（count 为 0 时一直发送）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    seq = 0
+    try:
+        while not count or seq < count:
+            sock.sendto(make_beacon(ip, port, serial, app_version, battery, seq), (target, beacon_port))
+            seq += 1
+            if not count or seq < count:
+                time.sleep(interval)
+    finally:
+        sock.close()
+    return seq
+
+
+def main():
+    parser = argparse.ArgumentParser(description="配套应用 UDP 存在信标")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    listen = sub.add_parser("listen", help="打印收到的信标")
+    listen.add_argument("--port", type=int, default=BEACON_PORT)
+
+    send = sub.add_parser("send", help="模拟头显发送信标")
+    send.add_argument("ip")
+    send.add_argument("adb_port", type=int)
+    send.add_argument("--serial", default="SIMULATED0001")
+    send.add_argument("--target", default="255.255.255.255", help="目标地址（本机测试用 127.0.0.1）")
+    send.add_argument("--count", type=int, default=0, help="发送次数，0 表示一直发送")
+    send.add_argument("--interval", type=float, default=SEND_INTERVAL)
+    send.add_argument("--app-version", default="")
+    send.add_argument("--battery", type=int)
+    send.add_argument("--port", type=int, default=BEACON_PORT)
+    args = parser.parse_args()
+
+    if args.command == "send":
+        try:
+            sent = send_beacons(args.ip, args.adb_port, args.serial, args.target, args.count,
+                                args.interval, args.app_version, args.battery, args.port)
+            print(f"已发送 {sent} 个信标")
+        except KeyboardInterrupt:
+            pass
+        return
+
+    def show(info):
+        battery = f" 电量 {info['battery']}%" if info["battery"] is not None else ""
+        print(f"{time.strftime('%H:%M:%S')} {info['address']} {info['serial'] or ''} "
+              f"{info['app_version']}{battery}")
+
+    PresenceListener(show, port=args.port).start()
+    print(f"正在监听 UDP {args.port}，按 Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+性能分析与慢操作追踪
+开启后：采样分析器定期记录所有线程的调用栈；Tk 卡顿检测在主线程超过阈值未响应时记录其调用栈；
+所有 subprocess（启动、communicate、wait）和 socket（connect、send、recv）调用按线程记录耗时。
+结果保存为 Chrome Trace JSON，可在 chrome://tracing 或 https://ui.perfetto.dev 中查看。
+设置环境变量 QWA_PROFILE=1 启动时即开启（QWA_STALL_MS 可修改卡顿阈值）
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+PROFILE_ENV = "QWA_PROFILE"
+STALL_ENV = "QWA_STALL_MS"
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+# 主线程超过该时间未处理事件视为卡顿（毫秒）
+STALL_THRESHOLD_MS = 200
+# 主线程心跳间隔（毫秒）
+HEARTBEAT_MS = 50
+# 事件数上限，防止长时间开启占满内存
+MAX_EVENTS = 1000000
+MAX_STACK_DEPTH = 64
+
+SOCKET_METHODS = ("connect", "accept", "send", "sendall", "recv", "recv_into")
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+def stack_names(frame):
+    """调用栈，从最外层到最内层"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def describe_args(args):
+    if isinstance(args, (list, tuple)):
+        return " ".join(str(a) for a in args)
+    return str(args)
+
+
+class Profiler:
+    """采样分析器 + Tk 卡顿检测 + subprocess/socket 追踪"""
+
+    def __init__(self, trace_dir, sample_interval=SAMPLE_INTERVAL, stall_ms=STALL_THRESHOLD_MS, log=None):
+        self.trace_dir = Path(trace_dir)
+        self.sample_interval = sample_interval
+        self.stall_ms = stall_ms
+        self.log = log
+        self.events = []
+        self.lock = threading.Lock()
+        self.running = False
+        self.origin = 0.0
+        self.root = None
+        self.main_ident = threading.main_thread().ident
+        self.own_threads = set()
+        self.threads = []
+        # 每个线程当前打开的采样栈 [(名称, 开始时间)]
+        self.open_stacks = {}
+        self.last_tick = 0.0
+        self.stall_start = None
+        self.stall_stack = None
+        self.stalls = 0
+        self.originals = {}
+        # 被替换的方法原本是否定义在该类自身（否则来自基类，恢复时删除即可）
+        self.owned = {}
+
+    def now_us(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def add_event(self, event):
+        with self.lock:
+            if len(self.events) < MAX_EVENTS:
+                event.setdefault("pid", os.getpid())
+                self.events.append(event)
+
+    def complete(self, name, category, start_us, end_us, tid=None, args=None):
+        event = {"name": name, "cat": category, "ph": "X", "ts": start_us,
+                 "dur": max(0.0, end_us - start_us), "tid": tid or threading.get_ident()}
+        if args:
+            event["args"] = args
+        self.add_event(event)
+
+    def start(self, root=None):
+        """开始记录；传入 Tk 根窗口时同时检测主线程卡顿"""
+        if self.running:
+            return
+        self.running = True
+        self.origin = time.perf_counter()
+        self.events = []
+        self.open_stacks = {}
+        self.stalls = 0
+        self.install_hooks()
+        self.spawn(self._sample_loop, "profiler-sampler")
+        if root is not None:
+            self.root = root
+            self.last_tick = time.perf_counter()
+            root.after(HEARTBEAT_MS, self._tick)
+            self.spawn(self._watchdog_loop, "profiler-watchdog")
+
+    def spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.own_threads.add(thread.ident)
+        self.threads.append(thread)
+
+    def stop(self):
+        """停止记录并写入 trace 文件，返回文件路径"""
+        if not self.running:
+            return None
+        self.running = False
+        for thread in self.threads:
+            thread.join(1.0)
+        self.threads = []
+        self.remove_hooks()
+        end = self.now_us()
+        for tid, stack in self.open_stacks.items():
+            for name, start in reversed(stack):
+                self.complete(name, "sample", start, end, tid)
+        self.open_stacks = {}
+        return self.save()
+
+    def save(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                     "args": {"name": "Tk 主线程" if tid == self.main_ident else name}}
+                    for tid, name in names.items()]
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        path = self.trace_dir / f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        with self.lock:
+            events = metadata + self.events
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return path
+
+    # ---- 采样 ----
+
+    def _sample_loop(self):
+        while self.running:
+            ts = self.now_us()
+            frames = sys._current_frames()
+            for tid, frame in frames.items():
+                if tid in self.own_threads:
+                    continue
+                self._record_stack(tid, stack_names(frame), ts)
+            # 已结束的线程
+            for tid in [t for t in self.open_stacks if t not in frames]:
+                self._record_stack(tid, [], ts)
+                del self.open_stacks[tid]
+            time.sleep(self.sample_interval)
+
+    def _record_stack(self, tid, names, ts):
+        """与上次采样比较：结束已退出的帧，打开新进入的帧（生成火焰图式的嵌套区间）"""
+        stack = self.open_stacks.setdefault(tid, [])
+        common = 0
+        while common < len(stack) and common < len(names) and stack[common][0] == names[common]:
+            common += 1
+        for name, start in reversed(stack[common:]):
+            self.complete(name, "sample", start, ts, tid)
+        del stack[common:]
+        stack.extend((name, ts) for name in names[common:])
+
+    # ---- Tk 卡顿检测 ----
+
+    def _tick(self):
+        """主线程心跳；卡顿结束时记录总时长"""
+        now = time.perf_counter()
+        if self.stall_start is not None:
+            duration = (now - self.stall_start) * 1000
+            start_us = (self.stall_start - self.origin) * 1e6
+            self.complete("Tk 卡顿", "stall", start_us, self.now_us(), self.main_ident,
+                          {"ms": round(duration), "stack": self.stall_stack})
+            self.stalls += 1
+            if self.log:
+                where = self.stall_stack[-1] if self.stall_stack else "?"
+                self.log(f"界面卡顿 {duration:.0f} ms: {where}")
+            self.stall_start = None
+            self.stall_stack = None
+        self.last_tick = now
+        if self.running:
+            self.root.after(HEARTBEAT_MS, self._tick)
+
+    def _watchdog_loop(self):
+        """主线程超过阈值没有心跳时抓取其调用栈"""
+        threshold = (self.stall_ms + HEARTBEAT_MS) / 1000
+        while self.running:
+            time.sleep(self.stall_ms / 4000)
+            last = self.last_tick
+            if self.stall_start is None and time.perf_counter() - last > threshold:
+                frame = sys._current_frames().get(self.main_ident)
+                self.stall_stack = [frame_name(f) for f in self._frames(frame)]
+                self.stall_start = last + HEARTBEAT_MS / 1000
+
+    @staticmethod
+    def _frames(frame):
+        frames = []
+        while frame is not None and len(frames) < MAX_STACK_DEPTH:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+        return frames
+
+    # ---- subprocess / socket 追踪 ----
+
+    def install_hooks(self):
+        """替换 Popen 和 socket 的方法（各模块用 from subprocess import Popen 导入的也是同一个类）"""
+        profiler = self
+        popen = subprocess.Popen
+        self.originals = {("popen", name): getattr(popen, name) for name in ("__init__", "communicate", "wait")}
+        self.originals.update({("socket", name): getattr(socket.socket, name) for name in SOCKET_METHODS})
+        self.owned = {key: key[1] in vars(subprocess.Popen if key[0] == "popen" else socket.socket)
+                      for key in self.originals}
+
+        def wrap(original, category, label):
+            def traced(obj, *args, **kwargs):
+                if not profiler.running:
+                    return original(obj, *args, **kwargs)
+                start = profiler.now_us()
+                try:
+                    return original(obj, *args, **kwargs)
+                finally:
+                    detail = label(obj, args)
+                    profiler.complete(detail[0], category, start, profiler.now_us(), args=detail[1])
+            traced.__wrapped__ = original
+            return traced
+
+        def popen_label(name):
+            def label(pipe, args):
+                command = describe_args(args[0] if name == "__init__" and args else getattr(pipe, 'args', ""))
+                return f"Popen.{name}", {"command": command[:500]}
+            return label
+
+        def socket_label(name):
+            def label(sock, args):
+                info = {}
+                if name == "connect" and args:
+                    info["address"] = str(args[0])
+                elif name.startswith("send") and args:
+                    info["bytes"] = len(args[0])
+                try:
+                    info["peer"] = str(sock.getpeername())
+                except OSError:
+                    pass
+                return f"socket.{name}", info
+            return label
+
+        for name in ("__init__", "communicate", "wait"):
+            setattr(popen, name, wrap(self.originals[("popen", name)], "subprocess", popen_label(name)))
+        for name in SOCKET_METHODS:
+            setattr(socket.socket, name, wrap(self.originals[("socket", name)], "socket", socket_label(name)))
+
+    def remove_hooks(self):
+        for (kind, name), original in self.originals.items():
+            cls = subprocess.Popen if kind == "popen" else socket.socket
+            if self.owned[(kind, name)]:
+                setattr(cls, name, original)
+            else:
+                delattr(cls, name)
+        self.originals = {}
+
+
+def profiler_from_env(trace_dir, log=None):
+    """QWA_PROFILE 已设置时返回 Profiler，否则返回 None"""
+    if not os.environ.get(PROFILE_ENV):
+        return None
+    stall_ms = int(os.environ.get(STALL_ENV) or STALL_THRESHOLD_MS)
+    return Profiler(trace_dir, stall_ms=stall_ms, log=log)
@@ -1 +1,5 @@
+@echo off
+setlocal
+rem Use the same dedicated adb server port as the Python tools (adb_server.py), keep a user override
+if not defined ANDROID_ADB_SERVER_PORT set ANDROID_ADB_SERVER_PORT=5038
 adb shell pm grant com.ChuJiao.quest3_wireless_adb android.permission.WRITE_SECURE_SETTINGS
\ No newline at end of file
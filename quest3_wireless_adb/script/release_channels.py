@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+按设备分组的发布通道与安装计划
+groups.json 定义通道（stable/beta……，可固定部分应用的版本）和设备分组（按序列号、IP 或地址匹配，
+每组选择一个通道并可再单独固定版本）。规划器根据云端目录、本地 APK 仓库和每台设备
+一次 pm list packages --show-versioncode 的结果，算出每台设备最少需要的安装/卸载操作，
+执行时直接按计划并发进行（安装经传输调度器并写入部署日志），不再逐个应用重复检查
+"""
+
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from apk_mirror import safe_name
+from deploy_journal import STEP_DONE, STEP_FAILED, STEP_STARTED
+from shell_pool import ShellError
+
+GROUPS_FILENAME = "groups.json"
+DEFAULT_CHANNEL = "latest"
+MAX_WORKERS = 32
+
+# 操作类型
+INSTALL = "install"
+UPGRADE = "upgrade"
+DOWNGRADE = "downgrade"
+UNINSTALL = "uninstall"
+
+ACTION_LABELS = {INSTALL: "安装", UPGRADE: "升级", DOWNGRADE: "降级", UNINSTALL: "卸载"}
+
+INVENTORY_RE = re.compile(r"^package:(\S+)\s+versionCode:(\d+)")
+SERIAL_MARKER = "__QWA_SERIAL__"
+
+
+def apk_filename(app_name, version):
+    """本地仓库中的文件名（与同步下载、Unity 端一致）"""
+    return f"{safe_name(app_name)}_{version}.apk"
+
+
+class ReleaseConfigError(Exception):
+    """groups.json 格式错误"""
+
+
+class ReleaseConfig:
+    """通道与分组配置"""
+
+    def __init__(self, data=None, path=None):
+        data = data or {}
+        self.path = path
+        self.default_channel = data.get("default_channel", DEFAULT_CHANNEL)
+        self.channels = data.get("channels") or {DEFAULT_CHANNEL: {"pins": {}}}
+        self.groups = data.get("groups") or {}
+        for name, group in self.groups.items():
+            channel = group.get("channel", self.default_channel)
+            if channel not in self.channels and channel != DEFAULT_CHANNEL:
+                raise ReleaseConfigError(f"分组 {name} 使用了未定义的通道 {channel}")
+
+    @classmethod
+    def load(cls, path):
+        """读取 groups.json，文件不存在时所有设备使用默认通道"""
+        if not os.path.exists(path):
+            return cls(path=path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f), path=path)
+        except json.JSONDecodeError as e:
+            raise ReleaseConfigError(f"{path}: {e}")
+
+    def group_for(self, device, serial=None):
+        """按序列号、地址、IP 的顺序匹配分组，返回 (分组名, 分组)；未分组返回 (None, {})"""
+        ip = device.rsplit(':', 1)[0]
+        for key in (serial, device, ip):
+            if not key:
+                continue
+            for name, group in self.groups.items():
+                if key in (group.get("devices") or []):
+                    return name, group
+        return None, {}
+
+    def channel_of(self, group):
+        return group.get("channel", self.default_channel)
+
+    def pins_for(self, group):
+        """通道固定版本，分组的固定版本优先"""
+        pins = dict((self.channels.get(self.channel_of(group)) or {}).get("pins") or {})
+        pins.update(group.get("pins") or {})
+        return pins
+
+    def target_versions(self, group, catalog):
+        """{应用名: 目标版本}；分组指定 apps 时只包含这些应用"""
+        pins = self.pins_for(group)
+        apps = group.get("apps")
+        targets = {}
+        for app in catalog:
+            app_name = app.get('app_name', '')
+            if not app_name or (apps is not None and app_name not in apps):
+                continue
+            version = pins.get(app_name) or app.get('latest_version', '')
+            if version:
+                targets[app_name] = version
+        return targets
+
+    def pinned_filenames(self):
+        """所有通道和分组固定的 APK 文件名（仓库淘汰时保留）"""
+        pins = []
+        for channel in self.channels.values():
+            pins.extend((channel.get("pins") or {}).items())
+        for group in self.groups.values():
+            pins.extend((group.get("pins") or {}).items())
+        return {apk_filename(app, version) for app, version in pins}
+
+
+def inventory_command():
+    """一次查询序列号和第三方应用的 versionCode"""
+    return f"echo {SERIAL_MARKER}$(getprop ro.serialno); pm list packages -3 --show-versioncode"
+
+
+def parse_inventory(output):
+    """返回 (序列号, {包名: versionCode})"""
+    serial, packages = None, {}
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith(SERIAL_MARKER):
+            serial = line[len(SERIAL_MARKER):] or None
+            continue
+        match = INVENTORY_RE.match(line)
+        if match:
+            packages[match.group(1)] = int(match.group(2))
+    return serial, packages
+
+
+def query_inventory(pool, devices, timeout=20):
+    """并发查询所有设备，返回 {设备: (序列号, {包名: versionCode})}，失败的设备为 None"""
+    def query(device):
+        try:
+            code, output = pool.run(device, inventory_command(), timeout=timeout)
+        except ShellError:
+            return None
+        return parse_inventory(output) if code == 0 else None
+
+    if not devices:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(devices))) as executor:
+        return dict(zip(devices, executor.map(query, devices)))
+
+
+class PlanAction:
+    """计划中的一个操作"""
+
+    def __init__(self, kind, package, app_name="", version="", version_code=None, filename=None,
+                 installed_code=None):
+        self.kind = kind
+        self.package = package
+        self.app_name = app_name
+        self.version = version
+        self.version_code = version_code
+        self.filename = filename
+        self.installed_code = installed_code
+
+    def describe(self):
+        label = ACTION_LABELS[self.kind]
+        if self.kind == UNINSTALL:
+            return f"{label} {self.package}"
+        current = f" (当前 {self.installed_code})" if self.installed_code is not None else ""
+        return f"{label} {self.app_name} v{self.version}{current}"
+
+
+class DevicePlan:
+    """单台设备的计划"""
+
+    def __init__(self, device, serial=None, group=None, channel=None):
+        self.device = device
+        self.serial = serial
+        self.group = group
+        self.channel = channel
+        self.actions = []
+        # 目标版本在本地仓库中不存在的应用
+        self.missing = []
+        self.error = None
+
+    @property
+    def installs(self):
+        return [a for a in self.actions if a.kind != UNINSTALL]
+
+    @property
+    def uninstalls(self):
+        return [a for a in self.actions if a.kind == UNINSTALL]
+
+    def summary(self):
+        where = f"{self.group or '未分组'}/{self.channel}"
+        if self.error:
+            return f"{self.device} [{where}]: {self.error}"
+        if not self.actions and not self.missing:
+            return f"{self.device} [{where}]: 无需变更"
+        parts = [a.describe() for a in self.actions]
+        parts += [f"缺少 {name} v{version}" for name, version in self.missing]
+        return f"{self.device} [{where}]: " + "，".join(parts)
+
+
+def local_builds(store, manifest_index):
+    """{文件名(小写): (文件名, 包名, versionCode, 应用)}，只包含能解析清单的完整 APK"""
+    builds = {}
+    for filename, entry in store.entries():
+        info = manifest_index.get(store.blob_path(entry["blob"]))
+        if info and info.get("package") and not info.get("split"):
+            builds[filename.lower()] = (filename, info["package"], info.get("versionCode"), entry["app"])
+    return builds
+
+
+def plan_release(config, catalog, store, manifest_index, inventory):
+    """计算每台设备的最少操作，返回 [DevicePlan]"""
+    builds = local_builds(store, manifest_index)
+    # 目录中应用对应的包名（任一本地版本可解析即可），用于判断“不属于本组”的应用
+    app_names = {safe_name(app.get('app_name', '')): app.get('app_name', '') for app in catalog}
+    catalog_packages = {}
+    for _, package, _, app in builds.values():
+        if app in app_names:
+            catalog_packages[package] = app_names[app]
+
+    plans = []
+    for device, result in inventory.items():
+        if result is None:
+            group_name, group = config.group_for(device)
+            plan = DevicePlan(device, group=group_name, channel=config.channel_of(group))
+            plan.error = "无法读取已安装应用"
+            plans.append(plan)
+            continue
+        serial, installed = result
+        group_name, group = config.group_for(device, serial)
+        plan = DevicePlan(device, serial, group_name, config.channel_of(group))
+
+        targets = config.target_versions(group, catalog)
+        for app_name, version in targets.items():
+            build = builds.get(apk_filename(app_name, version).lower())
+            # 清单无法解析、versionCode 未知的构建无法与已安装版本比较，按缺失处理，避免每次都计划升级
+            if not build or build[2] is None:
+                plan.missing.append((app_name, version))
+                continue
+            filename, package, version_code, _ = build
+            current = installed.get(package)
+            if current is not None and current == version_code:
+                continue
+            if current is None:
+                kind = INSTALL
+            elif version_code < current:
+                kind = DOWNGRADE
+            else:
+                kind = UPGRADE
+            plan.actions.append(PlanAction(kind, package, app_name, version, version_code, filename, current))
+
+        # 分组限定 apps 时，卸载目录中其余已安装的应用（目标版本缺失的应用不卸载）；remove 中的包名总是卸载
+        removals = set(group.get("remove") or [])
+        if group.get("apps") is not None:
+            removals |= {p for p, name in catalog_packages.items() if name not in targets}
+        for package in sorted(removals):
+            if package in installed:
+                plan.actions.append(PlanAction(UNINSTALL, package, catalog_packages.get(package, ""),
+                                               installed_code=installed[package]))
+        plans.append(plan)
+    return plans
+
+
+def plan_totals(plans):
+    """(需要变更的设备数, 安装数, 卸载数, 无需变更的设备数)"""
+    changed = [p for p in plans if p.actions]
+    installs = sum(len(p.installs) for p in plans)
+    uninstalls = sum(len(p.uninstalls) for p in plans)
+    unchanged = sum(1 for p in plans if not p.actions and not p.error)
+    return len(changed), installs, uninstalls, unchanged
+
+
+def execute_plan(plans, store, scheduler, pool, journal, allow_downgrade=False, log=None, on_done=None):
+    """按计划执行：先并发卸载，再按 APK 分批提交安装（同一 APK 一个部署日志）。
+    降级需要先卸载旧版本（会清除应用数据），allow_downgrade 为 False 时跳过。
+    返回 {设备: [(操作说明, 成功, 消息)]}"""
+    log = log or (lambda message: None)
+    results = {plan.device: [] for plan in plans}
+
+    def uninstall(device, action):
+        try:
+            code, output = pool.run(device, f"pm uninstall {action.package}", timeout=60)
+            ok = code == 0 and "Success" in output
+        except ShellError as e:
+            ok, output = False, str(e)
+        results[device].append((action.describe(), ok, output.strip()))
+        log(f"{'完成' if ok else '失败'}: {device} {action.describe()}" + ("" if ok else f" - {output.strip()}"))
+        return ok
+
+    uninstalls = [(plan.device, action) for plan in plans for action in plan.uninstalls]
+    if uninstalls:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(uninstalls))) as executor:
+            list(executor.map(lambda item: uninstall(*item), uninstalls))
+
+    # 按 APK 分组提交，调度器保证每台设备同时只安装一个
+    by_file = {}
+    for plan in plans:
+        for action in plan.installs:
+            if action.kind == DOWNGRADE and not allow_downgrade:
+                results[plan.device].append((action.describe(), False, "已跳过（需要允许降级）"))
+                continue
+            by_file.setdefault(action.filename, []).append((plan.device, action))
+
+    # on_done 在 job.done 之后才调用，等待回调本身结束再关闭部署日志
+    finished_events = []
+    deploys = []
+    for filename, targets in by_file.items():
+        apk_path = store.path(filename)
+        if not apk_path:
+            for device, action in targets:
+                results[device].append((action.describe(), False, "本地 APK 已不存在"))
+            continue
+        action = targets[0][1]
+        deploy = journal.create(filename, action.package, action.version_code, [d for d, _ in targets])
+        deploys.append(deploy)
+        actions = dict(targets)
+        events = {device: threading.Event() for device, _ in targets}
+        finished_events.extend(events.values())
+
+        def prepare(job, deploy=deploy, actions=actions):
+            deploy.record(job.device, STEP_STARTED)
+            action = actions[job.device]
+            if action.kind == DOWNGRADE:
+                # 设备上的版本更新，pm install -r 不允许降级，只能先卸载
+                uninstall(job.device, PlanAction(UNINSTALL, action.package))
+            return False
+
+        def finished(job, deploy=deploy, actions=actions, events=events):
+            try:
+                action = actions[job.device]
+                deploy.record(job.device, STEP_DONE if job.success else STEP_FAILED, "" if job.success else job.message)
+                results[job.device].append((action.describe(), bool(job.success), job.message))
+                log(f"{'完成' if job.success else '失败'}: {job.device} {action.describe()}"
+                    + ("" if job.success else f" - {job.message}"))
+                if on_done:
+                    on_done(job)
+            finally:
+                events[job.device].set()
+
+        for device, _ in targets:
+            scheduler.submit(device, apk_path, kind="install", before=prepare, on_done=finished)
+
+    for event in finished_events:
+        event.wait()
+    for deploy in deploys:
+        deploy.close()
+    return results
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+多设备屏幕缩略图墙
+定期通过 exec-out screencap 抓取每台设备的屏幕并缩小缓存；画面未变化（哈希相同）时
+逐步降低该设备的抓取频率，全局按字节限速，并在有安装/推送任务时暂停，避免与传输争抢带宽
+"""
+
+import hashlib
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, PIPE, TimeoutExpired
+
+from transfer_scheduler import TokenBucket
+
+# Pillow 已列入 requirements.txt，用于在后台线程缩小图片；缺失时退回 Tk 的 subsample
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+MIN_INTERVAL = 2.0
+MAX_INTERVAL = 30.0
+# 同时进行的抓取数
+MAX_CONCURRENT_CAPTURES = 2
+# 默认全局带宽上限（字节/秒）
+DEFAULT_BYTES_PER_SEC = 2 * 1024 * 1024
+THUMB_WIDTH = 320
+
+
+class Frame:
+    """一帧缓存的缩略图"""
+
+    def __init__(self, png, digest, captured, thumbnail):
+        self.png = png
+        self.digest = digest
+        self.captured = captured
+        # thumbnail 为 True 表示 png 已是缩略图，否则需要显示端自行缩小
+        self.thumbnail = thumbnail
+
+
+def capture_screen(adb_path, device, timeout=15):
+    """抓取设备屏幕，返回 PNG 字节"""
+    pipe = Popen([adb_path, '-s', device, 'exec-out', 'screencap', '-p'], stdout=PIPE, stderr=PIPE)
+    try:
+        output, _ = pipe.communicate(timeout=timeout)
+    except TimeoutExpired:
+        pipe.kill()
+        pipe.communicate()
+        return None
+    if pipe.returncode != 0 or not output.startswith(b'\x89PNG'):
+        return None
+    return output
+
+
+def make_thumbnail(png, width=THUMB_WIDTH):
+    """缩小图片，没有 Pillow 时返回 None"""
+    if not HAS_PIL:
+        return None
+    image = Image.open(io.BytesIO(png))
+    image.thumbnail((width, width * image.height // max(1, image.width)))
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+
+class DeviceCaptureState:
+    def __init__(self):
+        self.interval = MIN_INTERVAL
+        self.next_due = 0.0
+        self.frame = None
+        self.version = 0
+
+
+class ScreenWall:
+    """屏幕墙抓取器"""
+
+    def __init__(self, adb_path, get_devices, is_busy=None, bytes_per_sec=DEFAULT_BYTES_PER_SEC):
+        self.adb_path = adb_path
+        self.get_devices = get_devices
+        self.is_busy = is_busy or (lambda: False)
+        self.bucket = TokenBucket(bytes_per_sec)
+        self.lock = threading.Lock()
+        self.states = {}
+        self.in_flight = set()
+        self.running = False
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CAPTURES)
+        # 上一帧的大小用于预估本次抓取需要的令牌
+        self.last_frame_size = 512 * 1024
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            # 排队中的抓取在开始时发现已停止直接返回，线程随后退出
+            self.executor.shutdown(wait=False)
+
+    def frames(self):
+        """返回 {设备: (版本号, Frame, 当前间隔)}"""
+        with self.lock:
+            return {device: (state.version, state.frame, state.interval)
+                    for device, state in self.states.items() if state.frame}
+
+    def _loop(self):
+        while self.running:
+            # 有安装/推送任务时让出带宽
+            if self.is_busy():
+                time.sleep(1.0)
+                continue
+            now = time.monotonic()
+            devices = set(self.get_devices())
+            with self.lock:
+                if not self.running:
+                    break
+                for device in list(self.states):
+                    if device not in devices:
+                        del self.states[device]
+                due = []
+                for device in devices:
+                    state = self.states.setdefault(device, DeviceCaptureState())
+                    if state.next_due <= now and device not in self.in_flight:
+                        due.append((state.next_due, device))
+                # 最久未更新的优先
+                for _, device in sorted(due)[:MAX_CONCURRENT_CAPTURES - len(self.in_flight)]:
+                    self.in_flight.add(device)
+                    self.executor.submit(self._capture, device)
+            time.sleep(0.2)
+
+    def _capture(self, device):
+        try:
+            if not self.running:
+                return
+            self.bucket.consume(self.last_frame_size)
+            try:
+                png = capture_screen(self.adb_path, device)
+            except OSError:
+                png = None
+            if png:
+                self.last_frame_size = len(png)
+            digest = hashlib.sha1(png).hexdigest() if png else None
+
+            with self.lock:
+                state = self.states.get(device)
+                if state is None:
+                    return
+                if png is None:
+                    state.interval = MAX_INTERVAL
+                elif state.frame and state.frame.digest == digest:
+                    # 画面没变，降低频率
+                    state.interval = min(MAX_INTERVAL, state.interval * 2)
+                else:
+                    state.interval = MIN_INTERVAL
+                state.next_due = time.monotonic() + state.interval
+                need_frame = png is not None and (state.frame is None or state.frame.digest != digest)
+
+            if need_frame:
+                try:
+                    thumbnail = make_thumbnail(png)
+                except (OSError, ValueError):
+                    thumbnail = None
+                frame = Frame(thumbnail or png, digest, time.time(), thumbnail is not None)
+                with self.lock:
+                    state = self.states.get(device)
+                    if state is not None:
+                        state.frame = frame
+                        state.version += 1
+        finally:
+            with self.lock:
+                self.in_flight.discard(device)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+每台设备一个常驻 adb shell 会话
+命令通过同一个 shell 进程串行执行，用带随机标记的结束行分隔输出，
+避免每条命令都重新启动 adb 进程、打开传输通道和 shell
+"""
+
+import queue
+import threading
+import uuid
+from subprocess import Popen, PIPE, STDOUT
+
+DEFAULT_TIMEOUT = 30
+
+
+class ShellError(Exception):
+    """会话执行失败（进程退出、超时等），会话会被回收"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        # 命令尚未送达设备时可以安全地换新会话重试
+        self.retryable = retryable
+
+
+class ShellSession:
+    """单台设备的常驻 shell"""
+
+    def __init__(self, adb_path, device):
+        self.adb_path = adb_path
+        self.device = device
+        self.lock = threading.Lock()
+        self.lines = queue.Queue()
+        self.pipe = Popen([adb_path, '-s', device, 'shell', '-T'],
+                          stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        """后台读取输出行，进程结束时放入 None"""
+        try:
+            for line in iter(self.pipe.stdout.readline, b''):
+                self.lines.put(line)
+        finally:
+            self.lines.put(None)
+
+    @property
+    def alive(self):
+        return self.pipe.poll() is None
+
+    def run(self, command, timeout=DEFAULT_TIMEOUT):
+        """执行命令，返回 (退出码, 输出)"""
+        marker = f"__QWA_END_{uuid.uuid4().hex}__"
+        with self.lock:
+            if not self.alive:
+                raise ShellError(f"{self.device} shell 已退出", retryable=True)
+            try:
+                # 命令放在子 shell 中执行，避免 exit/cd 等影响常驻会话；</dev/null 防止命令读走后续输入
+                script = f"( {command} ) </dev/null 2>&1; echo \"{marker} $?\"\n"
+                self.pipe.stdin.write(script.encode('utf-8'))
+                self.pipe.stdin.flush()
+            except OSError as e:
+                raise ShellError(f"{self.device} 写入失败: {e}", retryable=True)
+
+            output = []
+            while True:
+                try:
+                    line = self.lines.get(timeout=timeout)
+                except queue.Empty:
+                    self.close()
+                    raise ShellError(f"{self.device} 命令超时: {command}")
+                if line is None:
+                    raise ShellError(f"{self.device} shell 已退出")
+                text = line.decode('utf-8', errors='ignore').rstrip('\r\n')
+                pos = text.find(marker)
+                if pos >= 0:
+                    if pos > 0:
+                        output.append(text[:pos])
+                    code = text[pos + len(marker):].strip()
+                    return (int(code) if code.lstrip('-').isdigit() else -1), '\n'.join(output)
+                output.append(text)
+
+    def close(self):
+        try:
+            self.pipe.stdin.close()
+        except OSError:
+            pass
+        if self.pipe.poll() is None:
+            self.pipe.kill()
+
+
+class ShellPool:
+    """按设备复用 shell 会话，出错时自动重建一次"""
+
+    def __init__(self, adb_path):
+        self.adb_path = adb_path
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def session(self, device):
+        with self.lock:
+            session = self.sessions.get(device)
+            if session is None or not session.alive:
+                session = ShellSession(self.adb_path, device)
+                self.sessions[device] = session
+            return session
+
+    def run(self, device, command, timeout=DEFAULT_TIMEOUT):
+        """在设备上执行命令，返回 (退出码, 输出)"""
+        for attempt in range(2):
+            session = self.session(device)
+            try:
+                return session.run(command, timeout=timeout)
+            except ShellError as e:
+                self.discard(device, session)
+                if attempt or not e.retryable:
+                    raise
+
+    def discard(self, device, session=None):
+        """回收设备的会话"""
+        with self.lock:
+            current = self.sessions.get(device)
+            if current is not None and (session is None or current is session):
+                del self.sessions[device]
+                current.close()
+
+    def close_all(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+带宽自适应的传输调度器
+多台头显共用一个无线接入点时，同时推送过多会导致总吞吐下降，逐台推送又浪费带宽。
+调度器按实际总吞吐用 AIMD（加性增、乘性减）调整并发数，并支持全局和单设备限速
+"""
+
+import threading
+import time
+from pathlib import Path
+from subprocess import Popen, PIPE, TimeoutExpired
+
+from adb_errors import OK, TIMEOUT, TRANSPORT, UNKNOWN, AdbResult, backoff_delay, classify, install_succeeded
+
+CHUNK_SIZE = 64 * 1024
+# 单次传输（含设备端安装）的超时秒数
+TRANSFER_TIMEOUT = 1800
+
+# AIMD 参数
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_INITIAL_CONCURRENCY = 2
+# 每个观测窗口的秒数
+DEFAULT_WINDOW = 3.0
+# 增加并发后吞吐至少提升这个比例才继续增加
+INCREASE_THRESHOLD = 0.05
+# 吞吐未提升或出错时的乘性减因子
+DECREASE_FACTOR = 0.7
+
+
+class TokenBucket:
+    """令牌桶限速，rate 为字节/秒，None 或 0 表示不限速"""
+
+    def __init__(self, rate=None, burst=None):
+        self.lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        with self.lock:
+            self.rate = rate or None
+            self.capacity = burst or (rate or 0)
+            self.tokens = self.capacity
+            self.last = time.monotonic()
+
+    def consume(self, amount):
+        """取走 amount 个令牌，不足时阻塞等待"""
+        while True:
+            with self.lock:
+                if not self.rate:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                # 单次请求超过桶容量时允许透支，避免永远等不到
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                wait = (min(amount, self.capacity) - self.tokens) / self.rate
+            time.sleep(min(wait, 0.5))
+
+
+class TransferJob:
+    """一次安装或推送"""
+
+    def __init__(self, device, local_path, kind, remote_path=None, before=None, on_done=None):
+        self.device = device
+        self.local_path = Path(local_path)
+        self.kind = kind  # "install" 或 "push"
+        self.remote_path = remote_path
+        self.before = before
+        self.on_done = on_done
+        self.size = self.local_path.stat().st_size
+        self.transferred = 0
+        # 传输中断（网络问题）才作为拥塞信号，安装失败不算
+        self.interrupted = False
+        self.success = None
+        self.message = ""
+        # 失败时的分类结果（adb_errors.AdbResult）
+        self.error = None
+        self.attempts = 0
+        # 退避重试时重新排队，在此时间（monotonic）之前不会被调度
+        self.not_before = 0.0
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+
+class TransferScheduler:
+    """AIMD 并发控制的传输调度器"""
+
+    def __init__(self, adb_path, global_rate=None, per_device_rate=None,
+                 min_concurrency=DEFAULT_MIN_CONCURRENCY, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 initial_concurrency=DEFAULT_INITIAL_CONCURRENCY, window=DEFAULT_WINDOW, log=None):
+        self.adb_path = adb_path
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = max(min_concurrency, min(initial_concurrency, max_concurrency))
+        self.window = window
+        self.log = log
+
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_device_rate = per_device_rate
+        self.device_buckets = {}
+
+        self.cond = threading.Condition()
+        self.pending = []
+        self.active = []
+        self.bytes_in_window = 0
+        self.errors_in_window = 0
+        self.last_throughput = None
+        self.last_change = 0  # 上个窗口并发的变化: +1 增加, -1 减少, 0 不变
+        self.throughput = 0.0
+        self.running = True
+
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+        threading.Thread(target=self._control_loop, daemon=True).start()
+
+    def set_rates(self, global_rate=None, per_device_rate=None):
+        """修改限速（字节/秒）"""
+        self.global_bucket.set_rate(global_rate)
+        with self.cond:
+            self.per_device_rate = per_device_rate
+            for bucket in self.device_buckets.values():
+                bucket.set_rate(per_device_rate)
+
+    def submit(self, device, local_path, kind="install", remote_path=None, before=None, on_done=None):
+        """提交任务。before(job) 在占用并发名额后、传输前调用，返回 True 表示已完成无需传输；
+        返回 True 前将 job.success 置为 False 表示任务在传输前失败"""
+        job = TransferJob(device, local_path, kind, remote_path, before, on_done)
+        with self.cond:
+            self.pending.append(job)
+            self.cond.notify_all()
+        return job
+
+    def active_count(self):
+        with self.cond:
+            return len(self.active)
+
+    def is_busy(self):
+        with self.cond:
+            return bool(self.active or self.pending)
+
+    def wait_all(self, jobs):
+        for job in jobs:
+            job.done.wait()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def _device_bucket(self, device):
+        with self.cond:
+            if device not in self.device_buckets:
+                self.device_buckets[device] = TokenBucket(self.per_device_rate)
+            return self.device_buckets[device]
+
+    def _dispatch_loop(self):
+        while True:
+            with self.cond:
+                while self.running and not (self.pending and len(self.active) < self.concurrency):
+                    self.cond.wait()
+                if not self.running:
+                    return
+                # 同一设备同时只跑一个任务，等待退避的任务暂不调度
+                busy = {job.device for job in self.active}
+                now = time.monotonic()
+                job = next((j for j in self.pending if j.device not in busy and j.not_before <= now), None)
+                if job is None:
+                    self.cond.wait(0.5)
+                    continue
+                self.pending.remove(job)
+                self.active.append(job)
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _control_loop(self):
+        """每个窗口测量总吞吐并调整并发数"""
+        while True:
+            time.sleep(self.window)
+            with self.cond:
+                if not self.running:
+                    return
+                throughput = self.bytes_in_window / self.window
+                errors = self.errors_in_window
+                self.bytes_in_window = 0
+                self.errors_in_window = 0
+                self.throughput = throughput
+
+                saturated = len(self.active) >= self.concurrency
+                old = self.concurrency
+                if errors:
+                    self.concurrency = max(self.min_concurrency, int(self.concurrency * DECREASE_FACTOR))
+                elif saturated and self.active:
+                    if (self.last_change > 0 and self.last_throughput
+                            and throughput < self.last_throughput * (1 + INCREASE_THRESHOLD)):
+                        # 增加并发没有带来吞吐提升，说明已接近信道上限
+                        self.concurrency = max(self.min_concurrency, int(self.concurrency * DECREASE_FACTOR))
+                    else:
+                        self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+                self.last_change = (self.concurrency > old) - (self.concurrency < old)
+                if self.active:
+                    self.last_throughput = throughput
+                if self.concurrency != old:
+                    if self.log:
+                        self.log(f"传输并发 {old} -> {self.concurrency}，总吞吐 {throughput / 1024 / 1024:.1f} MB/s")
+                    self.cond.notify_all()
+
+    def _run_job(self, job):
+        if job.started is None:
+            job.started = time.time()
+        retry = False
+        try:
+            # before 只在第一次尝试前调用，重试时不再重复清理/记录
+            if not job.attempts and job.before and job.before(job):
+                if job.success is None:
+                    job.success = True
+            else:
+                job.attempts += 1
+                self._transfer(job)
+                retry = self._should_retry(job)
+        except Exception as e:
+            job.success = False
+            job.interrupted = True
+            job.message = str(e)
+        finally:
+            with self.cond:
+                self.active.remove(job)
+                if job.interrupted:
+                    self.errors_in_window += 1
+                # 退避期间释放并发名额，重新排队而不是在工作线程中等待
+                if retry:
+                    self.pending.append(job)
+                self.cond.notify_all()
+            if not retry:
+                job.finished = time.time()
+                job.done.set()
+                if job.on_done:
+                    job.on_done(job)
+
+    def _should_retry(self, job):
+        """暂时性错误（传输中断、超时、设备离线）按退避重试，存储不足、版本降级等永久性错误立即失败"""
+        if job.success or job.error is None or job.attempts > job.error.max_retries:
+            return False
+        delay = backoff_delay(job.attempts)
+        if self.log:
+            self.log(f"{job.device}: {job.error.label}，{delay:.1f}s 后第 {job.attempts} 次重试")
+        job.not_before = time.monotonic() + delay
+        return True
+
+    def _transfer(self, job):
+        """通过 exec-in 把文件流式写入设备，期间按令牌桶限速并计量字节数"""
+        if job.kind == "install":
+            remote_cmd = f"pm install -r -S {job.size}"
+        else:
+            remote_cmd = f"cat > '{job.remote_path}'"
+
+        job.transferred = 0
+        job.interrupted = False
+        device_bucket = self._device_bucket(job.device)
+        pipe = Popen([self.adb_path, '-s', job.device, 'exec-in', remote_cmd],
+                     stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        try:
+            with open(job.local_path, 'rb') as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.global_bucket.consume(len(chunk))
+                    device_bucket.consume(len(chunk))
+                    pipe.stdin.write(chunk)
+                    job.transferred += len(chunk)
+                    with self.cond:
+                        self.bytes_in_window += len(chunk)
+        except (BrokenPipeError, OSError):
+            job.interrupted = True
+
+        timed_out = False
+        try:
+            output, error = pipe.communicate(timeout=TRANSFER_TIMEOUT)
+        except TimeoutExpired:
+            # 设备无响应时结束 adb 进程，按超时分类（可重试）
+            pipe.kill()
+            output, error = pipe.communicate()
+            timed_out = True
+        output_str = output.decode("utf-8", errors='ignore').strip()
+        error_str = error.decode("utf-8", errors='ignore').strip()
+
+        if timed_out:
+            result = AdbResult(TIMEOUT, f"{TRANSFER_TIMEOUT}s 无响应")
+        elif job.kind == "install":
+            result = classify(pipe.returncode, output_str, error_str, install_succeeded)
+        elif pipe.returncode == 0 and job.transferred == job.size:
+            result = AdbResult(OK, output_str)
+        else:
+            result = classify(1, output_str, error_str)
+        if job.interrupted and result.kind == UNKNOWN:
+            # 写入中断且没有可识别的错误信息，按传输中断处理
+            result.kind = TRANSPORT
+        job.success = result.ok
+        job.error = None if result.ok else result
+        job.message = output_str if job.success else (result.describe() or "传输中断")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+按键值增量更新的虚拟化列表
+Treeview 中只保留可见窗口大小的几十行并循环复用，滚动时只替换行内容；
+数据刷新时按键（设备地址/包名/文件名）比较新旧数据，只更新有变化的行，
+选中状态按键保存，刷新和滚动后保持不变；筛选使用三字索引，数千行时也能即时响应
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+DEFAULT_ROW_HEIGHT = 20
+# 滚轮每格滚动的行数
+WHEEL_ROWS = 3
+# 索引的子串长度
+NGRAM = 3
+
+
+def ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class SearchIndex:
+    """子串搜索索引（三字索引，短查询直接扫描）"""
+
+    def __init__(self):
+        self.texts = {}
+        self.grams = {}
+
+    def set(self, key, text):
+        text = text.lower()
+        if self.texts.get(key) == text:
+            return
+        self.remove(key)
+        self.texts[key] = text
+        for gram in ngrams(text):
+            self.grams.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        for gram in ngrams(text):
+            keys = self.grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.grams[gram]
+
+    def search(self, query):
+        """返回文本包含 query 的键集合"""
+        query = query.lower()
+        if len(query) < NGRAM:
+            return {key for key, text in self.texts.items() if query in text}
+        candidates = None
+        # 从最少的候选集合开始求交集
+        for gram in sorted(ngrams(query), key=lambda g: len(self.grams.get(g, ()))):
+            keys = self.grams.get(gram)
+            if not keys:
+                return set()
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                return set()
+        return {key for key in candidates if query in self.texts[key]}
+
+
+class TreeModel:
+    """Treeview 的键控视图模型"""
+
+    def __init__(self, tree, scrollbar=None, numbered=False):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        # 在 #0 列显示序号
+        self.numbered = numbered
+        self.keys = []
+        self.rows = {}
+        self.positions = {}
+        self.index = SearchIndex()
+        self.query = ""
+        self.visible = []
+        self.offset = 0
+        self.selected = set()
+        # 复用的 Treeview 行 -> 当前显示的 (键, 序号, values)
+        self.slots = []
+        self.rendered = {}
+        self.row_height = self._row_height()
+
+        if scrollbar is not None:
+            scrollbar.configure(command=self.yview)
+        tree.configure(yscrollcommand='')
+        tree.bind('<<TreeviewSelect>>', lambda e: self.sync_selection(), add='+')
+        tree.bind('<Configure>', lambda e: self.render(), add='+')
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            tree.bind(sequence, self.on_wheel)
+        tree.bind('<Up>', lambda e: self.on_arrow(-1))
+        tree.bind('<Down>', lambda e: self.on_arrow(1))
+        tree.bind('<Prior>', lambda e: self.yview('scroll', -1, 'pages'))
+        tree.bind('<Next>', lambda e: self.yview('scroll', 1, 'pages'))
+
+    def _row_height(self):
+        try:
+            return int(ttk.Style().lookup('Treeview', 'rowheight') or DEFAULT_ROW_HEIGHT)
+        except (ValueError, tk.TclError):
+            return DEFAULT_ROW_HEIGHT
+
+    def set_rows(self, rows):
+        """用新数据替换全部行，rows 为 [(键, values)]，只更新有变化的行"""
+        self.sync_selection()
+        keys = []
+        new_rows = {}
+        for key, values in rows:
+            keys.append(key)
+            new_rows[key] = tuple(values)
+        for key in self.rows.keys() - new_rows.keys():
+            self.index.remove(key)
+            self.selected.discard(key)
+        for key, values in new_rows.items():
+            if self.rows.get(key) != values:
+                self.index.set(key, " ".join(str(v) for v in values))
+        self.keys = keys
+        self.rows = new_rows
+        self.positions = {key: i for i, key in enumerate(keys)}
+        self.apply_filter()
+
+    def update_row(self, key, values):
+        """更新单行"""
+        if key not in self.rows:
+            return
+        values = tuple(values)
+        if self.rows[key] == values:
+            return
+        self.rows[key] = values
+        self.index.set(key, " ".join(str(v) for v in values))
+        if self.query:
+            self.apply_filter()
+        else:
+            self.render()
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def clear(self):
+        self.set_rows([])
+
+    def selection(self):
+        """选中的键（按列表顺序，只含筛选后可见的行）"""
+        self.sync_selection()
+        visible = set(self.visible)
+        return [key for key in self.keys if key in self.selected and key in visible]
+
+    def set_filter(self, query):
+        query = query.strip()
+        if query != self.query:
+            self.query = query
+            self.offset = 0
+            self.apply_filter()
+
+    def apply_filter(self):
+        terms = self.query.split()
+        if not terms:
+            self.visible = list(self.keys)
+        else:
+            matched = None
+            for term in terms:
+                keys = self.index.search(term)
+                matched = keys if matched is None else matched & keys
+            self.visible = [key for key in self.keys if key in matched]
+        self.render()
+
+    def window_size(self):
+        """可见行数（减去表头一行）"""
+        height = self.tree.winfo_height()
+        if height <= 1:
+            return int(self.tree.cget('height'))
+        return max(1, height // self.row_height - 1)
+
+    def sync_selection(self):
+        """把 Treeview 中可见行的选中状态同步到按键保存的选中集合"""
+        current = set(self.tree.selection())
+        for slot in self.slots:
+            key = self.rendered[slot][0]
+            if slot in current:
+                self.selected.add(key)
+            else:
+                self.selected.discard(key)
+
+    def render(self):
+        """把当前窗口的数据写入复用的行，只改动有变化的行"""
+        self.sync_selection()
+        size = self.window_size()
+        self.offset = max(0, min(self.offset, len(self.visible) - size))
+        count = max(0, min(size, len(self.visible) - self.offset))
+        while len(self.slots) < count:
+            slot = self.tree.insert('', tk.END)
+            self.slots.append(slot)
+            self.rendered[slot] = (None, None, None)
+        while len(self.slots) > count:
+            slot = self.slots.pop()
+            del self.rendered[slot]
+            self.tree.delete(slot)
+
+        selection = []
+        for i, slot in enumerate(self.slots):
+            key = self.visible[self.offset + i]
+            text = str(self.positions[key] + 1) if self.numbered else ""
+            row = (key, text, self.rows[key])
+            if self.rendered[slot] != row:
+                self.tree.item(slot, text=text, values=row[2])
+                self.rendered[slot] = row
+            if key in self.selected:
+                selection.append(slot)
+        if set(selection) != set(self.tree.selection()):
+            self.tree.selection_set(selection)
+
+        if self.scrollbar is not None:
+            total = len(self.visible)
+            if total:
+                self.scrollbar.set(self.offset / total, (self.offset + count) / total)
+            else:
+                self.scrollbar.set(0, 1)
+
+    def yview(self, *args):
+        """滚动条回调（moveto / scroll units|pages）"""
+        size = self.window_size()
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * len(self.visible))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            self.offset += step * (size if args[2] == 'pages' else 1)
+        self.render()
+        return 'break'
+
+    def on_wheel(self, event):
+        if event.num == 4:
+            step = -1
+        elif event.num == 5:
+            step = 1
+        else:
+            step = -1 if event.delta > 0 else 1
+        return self.yview('scroll', step * WHEEL_ROWS, 'units')
+
+    def on_arrow(self, step):
+        """在窗口边缘按方向键时滚动一行并选中新出现的行"""
+        focus = self.tree.focus()
+        if not self.slots or focus not in self.slots:
+            return None
+        edge = self.slots[0] if step < 0 else self.slots[-1]
+        position = self.offset + self.slots.index(edge) + step
+        if focus != edge or not 0 <= position < len(self.visible):
+            return None
+        self.tree.selection_set(())
+        self.selected = {self.visible[position]}
+        self.offset += step
+        self.render()
+        self.tree.focus(edge)
+        return 'break'